@@ -1,123 +1,194 @@
-from flask import Flask, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Response, abort, request, jsonify, send_file, stream_with_context
+import click
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask_jwt_extended import JWTManager, create_access_token, current_user, jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
+from functools import wraps
+import json
+import logging
 import os
-import random
-
-# Models
-db = SQLAlchemy()
-
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(100), nullable=False)
-    phone = db.Column(db.String(20))
-    user_type = db.Column(db.String(20))  # buyer, seller, agent
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    listings = db.relationship('Listing', backref='owner', lazy=True)
-    favorites = db.relationship('Favorite', backref='user', lazy=True)
-    messages_sent = db.relationship('Message', foreign_keys='Message.sender_id', backref='sender', lazy=True)
-    messages_received = db.relationship('Message', foreign_keys='Message.receiver_id', backref='receiver', lazy=True)
-
-class Listing(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    title = db.Column(db.String(200), nullable=False)
-    description = db.Column(db.Text)
-    price = db.Column(db.Float, nullable=False)
-    property_type = db.Column(db.String(50))  # house, apartment, condo, land
-    bedrooms = db.Column(db.Integer)
-    bathrooms = db.Column(db.Integer)
-    square_feet = db.Column(db.Float)
-    address = db.Column(db.String(200))
-    city = db.Column(db.String(100))
-    state = db.Column(db.String(50))
-    zip_code = db.Column(db.String(20))
-    latitude = db.Column(db.Float)
-    longitude = db.Column(db.Float)
-    status = db.Column(db.String(20), default='active')  # active, sold, pending
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    
-    images = db.relationship('ListingImage', backref='listing', lazy=True, cascade='all, delete-orphan')
-    favorites = db.relationship('Favorite', backref='listing', lazy=True)
-
-class ListingImage(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    listing_id = db.Column(db.Integer, db.ForeignKey('listing.id'), nullable=False)
-    image_url = db.Column(db.String(500), nullable=False)
-    is_primary = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Favorite(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    listing_id = db.Column(db.Integer, db.ForeignKey('listing.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Message(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    listing_id = db.Column(db.Integer, db.ForeignKey('listing.id'), nullable=True)
-    subject = db.Column(db.String(200))
-    content = db.Column(db.Text, nullable=False)
-    is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class PropertyFeature(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    listing_id = db.Column(db.Integer, db.ForeignKey('listing.id'), nullable=False)
-    feature_name = db.Column(db.String(100), nullable=False)
-    feature_value = db.Column(db.String(200))
+import threading
+from urllib.parse import urlencode
+
+from sqlalchemy import delete, func, select, update
+from werkzeug.wsgi import get_input_stream
+
+from models import (
+    db, User, Listing, ListingImage, Message, PropertyFeature, ConversationParticipant, SavedSearch
+)
+from queries import (
+    listing_cards_query, listing_detail_query, search_cards_query, favorites_query, mailbox_query,
+    messages_query, inbox_query, thread_query, listings_detail_query
+)
+from search_index import apply_keyword_search, create_search_index, rebuild_search_index
+from geo import apply_geo_filter, create_geo_index, distance_km, parse_geo_args, rebuild_geo_index
+from pagination import approximate_total, clamp_page_size, decode_cursor, keyset_page, keyset_result
+from facets import create_facet_index, facet_counts, rebuild_facet_index
+from feature_index import apply_feature_filter, parse_feature_args
+from cache import ResponseCache
+from compression import ResponseCompressor
+from matching import listing_snapshot
+from migrations import apply_migrations, check_query_plans
+from importer import import_listings, parse_features, read_csv, read_ndjson, text_stream
+from exporter import iter_export
+from generator import generate
+from sample_data import create_sample_data
+import messaging
+from favorites import MAX_BATCH, add_favorites, favorited_ids, remove_favorites
+from instrumentation import Instrumentation
+from notifications import NotificationDispatcher
+from saved_searches import MAX_SEARCHES_PER_USER, matching_searches, normalize_filters, save_search
+from passwords import PasswordHasher, PasswordHasherBusy
+from identity import UserCache
+from engines import Engines, engine_options
+from images import CARD_VARIANT, ImagePipeline, image_url, variant_urls
 
 app = Flask(__name__, instance_path='/tmp')
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///real_estate.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connection pool per engine (ignored for in-memory SQLite); recycling
+# applies to server databases
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+# Pragmas for every SQLite connection, see engines.py
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'wal')
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'normal')
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16384))
+app.config['SQLITE_MMAP_SIZE_MB'] = int(os.environ.get('SQLITE_MMAP_SIZE_MB', 256))
+# Engine for the reads of GET requests: a replica URL, readonly (read-only
+# connections to the SQLite file) or unset to use the primary
+app.config['DATABASE_READ_URL'] = os.environ.get('DATABASE_READ_URL')
 app.config['JWT_SECRET_KEY'] = 'jwt-secret-key'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+# memory (per process), file (shared by workers via RESPONSE_CACHE_DIR) or none
+app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+app.config['RESPONSE_CACHE_DIR'] = os.environ.get('RESPONSE_CACHE_DIR')
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 60))
+# Operational endpoints (/api/_metrics, /api/_cache/stats) answer 404 unless
+# enabled here or in debug mode; enable them only where the API is not
+# publicly reachable
+app.config['INTERNAL_ENDPOINTS'] = os.environ.get('INTERNAL_ENDPOINTS', '0') != '0'
+# JSON response compression: encodings in order of preference (br needs the
+# brotli package), smallest body compressed, levels, and background threads
+# compressing cached bodies in the encodings their first client did not ask for
+app.config['COMPRESS_ENCODINGS'] = os.environ.get('COMPRESS_ENCODINGS', 'br,gzip')
+app.config['COMPRESS_MIN_BYTES'] = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+app.config['COMPRESS_WORKERS'] = int(os.environ.get('COMPRESS_WORKERS', 1))
+# Signed-in user records per process for token lookups; 0 TTL disables
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+# Per-request SQL counts, Server-Timing headers and /api/_metrics
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') != '0'
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))
+# Socket.IO notifications: socketio or local (records deliveries, for tests)
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+app.config['NOTIFY_BACKEND'] = os.environ.get('NOTIFY_BACKEND', 'socketio')
+app.config['NOTIFY_QUEUE_SIZE'] = int(os.environ.get('NOTIFY_QUEUE_SIZE', 10000))
+app.config['NOTIFY_COALESCE_MS'] = float(os.environ.get('NOTIFY_COALESCE_MS', 10))
+# Serve Socket.IO clients from this process. 0 on serverless deploys, which
+# then import Socket.IO only to emit a notification (via the message queue)
+app.config['SOCKETIO_SERVER'] = os.environ.get('SOCKETIO_SERVER', '1') != '0'
+# Initialize the database when the app is imported: 0 (run `flask init-db`
+# instead), 1, or seed to also load the sample data into an empty database
+app.config['INIT_DB_ON_STARTUP'] = os.environ.get('INIT_DB_ON_STARTUP', '0')
+# ASGI mode (asgi.py): async driver URL, derived from the database URL when
+# unset; async connection pool size; threads for the routes Flask serves
+app.config['ASYNC_DATABASE_URL'] = os.environ.get('ASYNC_DATABASE_URL')
+app.config['ASYNC_DB_POOL_SIZE'] = int(os.environ.get('ASYNC_DB_POOL_SIZE', 10))
+app.config['ASGI_WSGI_THREADS'] = int(os.environ.get('ASGI_WSGI_THREADS', 20))
+# Uploaded listing photos: store directory (default <instance>/images),
+# resizing threads, uploads that may wait for them, per-file limits
+app.config['IMAGE_STORE_DIR'] = os.environ.get('IMAGE_STORE_DIR')
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', os.cpu_count() or 1))
+app.config['IMAGE_QUEUE'] = int(os.environ.get('IMAGE_QUEUE', 256))
+app.config['IMAGE_MAX_BYTES'] = int(os.environ.get('IMAGE_MAX_BYTES', 20 * 1024 * 1024))
+app.config['IMAGE_MAX_PIXELS'] = int(os.environ.get('IMAGE_MAX_PIXELS', 50_000_000))
+# Largest request body in bytes, larger ones get 413; listing imports stream
+# their feeds and are exempt
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 100 * 1024 * 1024))
+# Password hashing: method and cost, hashing threads (0 hashes on the request
+# thread) and how many more hashes may wait before logins get a 503
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+app.config['PASSWORD_HASH_QUEUE'] = int(
+    os.environ.get('PASSWORD_HASH_QUEUE', 4 * max(1, app.config['PASSWORD_HASH_WORKERS']))
+)
 
 db.init_app(app)
+engines = Engines()
+engines.init_app(app, db)
 jwt = JWTManager(app)
+users = UserCache()
+users.init_app(app, jwt)
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+response_cache = ResponseCache()
+response_cache.init_app(app)
+metrics = Instrumentation()
+metrics.init_app(app)
+compression = ResponseCompressor()
+compression.init_app(app, response_cache)
+metrics.add_collector(compression.metrics)
+metrics.add_collector(engines.metrics)
+metrics.add_collector(response_cache.metrics)
+metrics.add_collector(users.metrics)
+notifications = NotificationDispatcher()
+metrics.add_collector(notifications.metrics)
+passwords = PasswordHasher()
+passwords.init_app(app)
+metrics.add_collector(passwords.metrics)
+images = ImagePipeline()
+images.init_app(app)
+metrics.add_collector(images.metrics)
 
-# Global flag to track initialization
-_initialized = False
-
-def initialize_database():
+def initialize_database(seed_if_empty=False):
+    # Explicit startup step (flask init-db, the dev server, INIT_DB_ON_STARTUP);
+    # requests never initialize. Returns the migrations applied.
     with app.app_context():
         db.create_all()
+        ran = apply_migrations()
+        create_search_index()
+        create_geo_index()
+        create_facet_index()
         
-        # Create sample data if database is empty
-        if not User.query.first():
-            create_sample_data()
+        if seed_if_empty and not User.query.first():
+            create_sample_data(passwords.method)
+    return ran
+
+def _passwords_busy():
+    return jsonify({'error': 'Too many logins in progress, try again shortly'}), 503, {'Retry-After': '1'}
 
-@app.before_request
-def ensure_initialized():
-    global _initialized
-    if not _initialized:
-        initialize_database()
-        _initialized = True
+def _has_credentials(data):
+    # Rejected before hashing: the hashers only take strings
+    return isinstance(data, dict) and isinstance(data.get('email'), str) and isinstance(data.get('password'), str)
 
 # Authentication routes
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     data = request.get_json()
+    if not _has_credentials(data):
+        return jsonify({'error': 'email and password must be strings'}), 400
     
     if User.query.filter_by(email=data['email']).first():
         return jsonify({'error': 'Email already registered'}), 400
+    # Release the connection while the password hashes
+    db.session.rollback()
+    try:
+        password = passwords.hash(data['password'])
+    except PasswordHasherBusy:
+        return _passwords_busy()
     
     user = User(
         name=data['name'],
         email=data['email'],
-        password=data['password'],  # In production, hash the password
+        password=password,
         phone=data.get('phone'),
         user_type=data.get('user_type', 'buyer')
     )
@@ -140,12 +211,28 @@ def register():
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
-    print(f"[LOGIN] Attempt: email={data.get('email')}")
+    if not _has_credentials(data):
+        return jsonify({'error': 'email and password must be strings'}), 400
     user = User.query.filter_by(email=data['email']).first()
     if user:
-        print(f"[LOGIN] User found: {user.email}")
-        if user.password == data['password']:
-            print(f"[LOGIN] Password match for {user.email}")
+        # Keep the loaded row but release the connection while hashing
+        db.session.expunge(user)
+    db.session.rollback()
+    try:
+        matches, upgraded = passwords.verify(user.password if user else None, data['password'])
+    except PasswordHasherBusy:
+        return _passwords_busy()
+    if user:
+        if matches:
+            if upgraded:
+                # Plaintext or another method's hash; a concurrent login may
+                # have upgraded it already
+                db.session.execute(
+                    update(User).where(User.id == user.id, User.password == user.password)
+                    .values(password=upgraded)
+                )
+                db.session.commit()
+            app.logger.info('Login succeeded for user %s', user.id)
             access_token = create_access_token(identity=user.id)
             return jsonify({
                 'token': access_token,
@@ -158,20 +245,16 @@ def login():
                 }
             })
         else:
-            print(f"[LOGIN] Password mismatch for {user.email}")
+            app.logger.info('Login failed for user %s: wrong password', user.id)
     else:
-        print(f"[LOGIN] User not found for email: {data.get('email')}")
+        app.logger.info('Login failed: unknown email')
     return jsonify({'error': 'Invalid credentials'}), 401
 
 # User profile routes
 @app.route('/api/user/profile', methods=['GET'])
-# @jwt_required()
+@jwt_required()
 def get_profile():
-    # user_id = get_jwt_identity()
-    # For demo: always return the first user
-    user = User.query.first()
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
+    user = current_user
     return jsonify({
         'id': user.id,
         'name': user.name,
@@ -181,10 +264,9 @@ def get_profile():
     })
 
 @app.route('/api/user/profile', methods=['PUT'])
-# @jwt_required()
+@jwt_required()
 def update_profile():
-    # user_id = get_jwt_identity()
-    user = User.query.first()
+    user = db.session.get(User, current_user.id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     data = request.get_json()
@@ -195,6 +277,8 @@ def update_profile():
     if 'user_type' in data:
         user.user_type = data['user_type']
     db.session.commit()
+    users.invalidate(user.id)
+    response_cache.invalidate_owner(user.id)
     return jsonify({
         'id': user.id,
         'name': user.name,
@@ -204,79 +288,216 @@ def update_profile():
     })
 
 # Listing routes
-@app.route('/api/listings', methods=['GET'])
-def get_listings():
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
-    property_type = request.args.get('property_type')
-    min_price = request.args.get('min_price', type=float)
-    max_price = request.args.get('max_price', type=float)
-    bedrooms = request.args.get('bedrooms', type=int)
-    city = request.args.get('city')
-    status = request.args.get('status', 'active')
-    
-    query = Listing.query.filter_by(status=status)
+MAX_MULTI_GET = 200
+
+def _listing_ids(values, limit=MAX_BATCH, ordered=False):
+    # A list of listing ids from JSON or a comma-separated query argument;
+    # sorted and unique, or deduplicated in request order with `ordered`
+    if isinstance(values, str):
+        values = [value for value in values.split(',') if value.strip()]
+    if not isinstance(values, list):
+        raise ValueError('Expected a list of listing ids')
+    try:
+        ids = list(dict.fromkeys(int(value) for value in values))
+    except (TypeError, ValueError):
+        raise ValueError('Expected a list of listing ids')
+    if len(ids) > limit:
+        raise ValueError(f'At most {limit} listing ids per request')
+    return ids if ordered else sorted(ids)
+
+def _json_id(data, key, required=True):
+    # An integer id from a JSON body; None if absent and not `required`
+    value = data.get(key)
+    if value is None and not required:
+        return None
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be an integer id')
+
+# Shared by the listing and search views here and their async versions in
+# asgi.py, so both serving modes answer the same arguments the same way
+def filter_listings(stmt, args):
+    # Applies the common listing filters in `args`; returns (stmt, geo).
+    # Raises ValueError for malformed geo or feature filters.
+    geo = parse_geo_args(args)
+    features = parse_feature_args(args)
+    property_type = args.get('property_type')
+    min_price = args.get('min_price', type=float)
+    max_price = args.get('max_price', type=float)
+    bedrooms = args.get('bedrooms', type=int)
+    city = args.get('city')
     
     if property_type:
-        query = query.filter_by(property_type=property_type)
+        stmt = stmt.filter_by(property_type=property_type)
     if min_price:
-        query = query.filter(Listing.price >= min_price)
+        stmt = stmt.filter(Listing.price >= min_price)
     if max_price:
-        query = query.filter(Listing.price <= max_price)
+        stmt = stmt.filter(Listing.price <= max_price)
     if bedrooms:
-        query = query.filter(Listing.bedrooms >= bedrooms)
+        stmt = stmt.filter(Listing.bedrooms >= bedrooms)
     if city:
-        query = query.filter(Listing.city.ilike(f'%{city}%'))
+        stmt = stmt.filter(Listing.city.ilike(f'%{city}%'))
+    if features:
+        stmt = apply_feature_filter(stmt, features)
+    if geo:
+        stmt = apply_geo_filter(stmt, geo)
+    return stmt, geo
+
+def _card_image(listing):
+    # The small variant of an uploaded photo; external URLs as stored
+    if not listing.images:
+        return None
+    image = listing.images[0]
+    return image_url(image.content_hash, CARD_VARIANT) if image.content_hash else image.image_url
+
+def _with_distances(cards, listings, geo):
+    if geo and 'near' in geo:
+        for card, listing in zip(cards, listings):
+            card['distance_km'] = distance_km(geo, listing)
+    return cards
+
+def listing_cards(listings, geo=None):
+    # Items of GET /api/listings, from listing_cards_query() rows
+    return _with_distances([{
+        'id': listing.id,
+        'title': listing.title,
+        'description': listing.description,
+        'price': listing.price,
+        'property_type': listing.property_type,
+        'bedrooms': listing.bedrooms,
+        'bathrooms': listing.bathrooms,
+        'square_feet': listing.square_feet,
+        'address': listing.address,
+        'city': listing.city,
+        'state': listing.state,
+        'zip_code': listing.zip_code,
+        'latitude': listing.latitude,
+        'longitude': listing.longitude,
+        'status': listing.status,
+        'created_at': listing.created_at.isoformat(),
+        'owner': {
+            'id': listing.owner.id,
+            'name': listing.owner.name,
+            'phone': listing.owner.phone
+        },
+        'primary_image': _card_image(listing),
+        'image_count': len(listing.images),
+        'favorite_count': listing.favorite_count
+    } for listing in listings], listings, geo)
+
+def search_cards(listings, geo=None):
+    # Items of GET /api/search, from search_cards_query() rows
+    return _with_distances([{
+        'id': listing.id,
+        'title': listing.title,
+        'price': listing.price,
+        'property_type': listing.property_type,
+        'bedrooms': listing.bedrooms,
+        'bathrooms': listing.bathrooms,
+        'city': listing.city,
+        'state': listing.state,
+        'primary_image': _card_image(listing),
+        'favorite_count': listing.favorite_count
+    } for listing in listings], listings, geo)
+
+def search_statement(args):
+    # (stmt, geo) for GET /api/search, before the newest-first SEARCH_LIMIT
+    stmt, geo = filter_listings(search_cards_query(), args)
+    if args.get('q', ''):
+        stmt = apply_keyword_search(stmt, args['q'])
+    return stmt, geo
+
+LISTINGS_CACHE_DEFAULTS = {'page': '1', 'per_page': '10', 'status': 'active'}
+
+@app.route('/api/listings', methods=['GET'])
+@response_cache.cached(defaults=LISTINGS_CACHE_DEFAULTS)
+def get_listings():
+    # ?ids=1,2,3 returns those listings in full instead of a filtered page
+    if 'ids' in request.args:
+        return get_listings_by_ids()
     
-    listings = query.order_by(Listing.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    page = request.args.get('page', 1, type=int)
+    per_page = clamp_page_size(request.args.get('per_page', 10, type=int))
+    status = request.args.get('status', 'active')
+    try:
+        query, geo = filter_listings(listing_cards_query(status), request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Cursor mode: pass cursor= (empty for the first page), then next_cursor
+    cursor_mode = 'cursor' in request.args
+    if cursor_mode:
+        if geo and 'near' in geo:
+            return jsonify({'error': 'Cursor pagination cannot be combined with near'}), 400
+        try:
+            items, next_cursor = keyset_page(query, request.args['cursor'], per_page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    else:
+        listings = db.paginate(
+            query.order_by(Listing.created_at.desc()),
+            page=page, per_page=per_page, error_out=False
+        )
+        items = listings.items
+    
+    cards = listing_cards(items, geo)
+    
+    if cursor_mode:
+        result = {'listings': cards, 'next_cursor': next_cursor}
+        if request.args.get('include_total', type=int):
+            filters = tuple(sorted(
+                (k, v) for k, v in request.args.items(multi=True)
+                if k not in ('cursor', 'per_page', 'page', 'include_total', 'facets')
+            ))
+            result['total'] = approximate_total(query, filters)
+            result['total_is_approximate'] = True
+    else:
+        result = {
+            'listings': cards,
+            'total': listings.total,
+            'pages': listings.pages,
+            'current_page': page
+        }
+    if request.args.get('facets', type=int):
+        result['facets'] = facet_counts(query, request.args, status)
+    
+    return jsonify(result)
+
+def get_listings_by_ids():
+    # Full details of up to MAX_MULTI_GET listings in request order, in the
+    # same three queries however many are asked for
+    try:
+        listing_ids = _listing_ids(request.args['ids'], limit=MAX_MULTI_GET, ordered=True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
+    found = {}
+    if listing_ids:
+        found = {
+            listing.id: listing
+            for listing in db.session.execute(listings_detail_query(listing_ids)).scalars()
+        }
     return jsonify({
-        'listings': [{
-            'id': listing.id,
-            'title': listing.title,
-            'description': listing.description,
-            'price': listing.price,
-            'property_type': listing.property_type,
-            'bedrooms': listing.bedrooms,
-            'bathrooms': listing.bathrooms,
-            'square_feet': listing.square_feet,
-            'address': listing.address,
-            'city': listing.city,
-            'state': listing.state,
-            'zip_code': listing.zip_code,
-            'latitude': listing.latitude,
-            'longitude': listing.longitude,
-            'status': listing.status,
-            'created_at': listing.created_at.isoformat(),
-            'owner': {
-                'id': listing.owner.id,
-                'name': listing.owner.name,
-                'phone': listing.owner.phone
-            },
-            'primary_image': listing.images[0].image_url if listing.images else None,
-            'image_count': len(listing.images)
-        } for listing in listings.items],
-        'total': listings.total,
-        'pages': listings.pages,
-        'current_page': page
+        'listings': [_listing_detail(found[i]) for i in listing_ids if i in found],
+        'missing': [i for i in listing_ids if i not in found]
     })
 
 @app.route('/api/listings/<int:listing_id>', methods=['GET'])
+@response_cache.cached()
 def get_listing(listing_id):
-    listing = Listing.query.get(listing_id)
+    listing = db.session.execute(listing_detail_query(listing_id)).scalar_one_or_none()
     
     if not listing:
         return jsonify({'error': 'Listing not found'}), 404
 
-    # Fetch features for this listing
-    features = []
-    from models import PropertyFeature
-    for f in PropertyFeature.query.filter_by(listing_id=listing.id).all():
-        features.append({'name': f.feature_name, 'value': f.feature_value})
+    return jsonify(_listing_detail(listing))
 
-    return jsonify({
+def _listing_detail(listing):
+    # Payload of GET /api/listings/<id>; see queries.listing_detail_query
+    return {
         'id': listing.id,
         'title': listing.title,
         'description': listing.description,
@@ -293,6 +514,7 @@ def get_listing(listing_id):
         'longitude': listing.longitude,
         'status': listing.status,
         'created_at': listing.created_at.isoformat(),
+        'favorite_count': listing.favorite_count,
         'owner': {
             'id': listing.owner.id,
             'name': listing.owner.name,
@@ -302,16 +524,24 @@ def get_listing(listing_id):
         'images': [{
             'id': img.id,
             'image_url': img.image_url,
+            'variants': variant_urls(img.content_hash) if img.content_hash else None,
             'is_primary': img.is_primary
         } for img in listing.images],
-        'features': features
-    })
+        'features': [{
+            'name': f.feature_name,
+            'value': f.feature_value
+        } for f in listing.features]
+    }
 
 @app.route('/api/listings', methods=['POST'])
 @jwt_required()
 def create_listing():
     user_id = get_jwt_identity()
     data = request.get_json()
+    try:
+        features = parse_features(data.get('features'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     listing = Listing(
         owner_id=user_id,
@@ -342,8 +572,13 @@ def create_listing():
                 is_primary=(i == 0)  # First image is primary
             )
             db.session.add(image)
+    for name, value in features:
+        db.session.add(PropertyFeature(listing_id=listing.id, feature_name=name, feature_value=value))
     
     db.session.commit()
+    snapshot = listing_snapshot(listing)
+    response_cache.invalidate_listing(listing.id, after=snapshot)
+    _notify_saved_searches(None, snapshot)
     
     return jsonify({
         'id': listing.id,
@@ -365,6 +600,11 @@ def update_listing(listing_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     data = request.get_json()
+    try:
+        features = parse_features(data.get('features')) if 'features' in data else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    before = listing_snapshot(listing)
     
     if 'title' in data:
         listing.title = data['title']
@@ -388,10 +628,26 @@ def update_listing(listing_id):
         listing.state = data['state']
     if 'zip_code' in data:
         listing.zip_code = data['zip_code']
+    if 'latitude' in data:
+        listing.latitude = data['latitude']
+    if 'longitude' in data:
+        listing.longitude = data['longitude']
     if 'status' in data:
         listing.status = data['status']
+    if features is not None:
+        # Replaces the whole set; bumps updated_at for incremental exports
+        db.session.execute(
+            delete(PropertyFeature).where(PropertyFeature.listing_id == listing.id),
+            execution_options={'synchronize_session': False}
+        )
+        for name, value in features:
+            db.session.add(PropertyFeature(listing_id=listing.id, feature_name=name, feature_value=value))
+        listing.updated_at = datetime.utcnow()
     
     db.session.commit()
+    after = listing_snapshot(listing)
+    response_cache.invalidate_listing(listing.id, before, after)
+    _notify_saved_searches(before, after)
     
     return jsonify({
         'id': listing.id,
@@ -400,13 +656,138 @@ def update_listing(listing_id):
         'status': listing.status
     })
 
+MAX_IMAGES_PER_UPLOAD = 20
+
+@app.route('/api/listings/<int:listing_id>/images', methods=['POST'])
+@jwt_required()
+def upload_listing_images(listing_id):
+    # multipart/form-data with one or more `images` files (JPEG, PNG, WebP).
+    # Responds once the originals are stored; the resized variants follow.
+    listing = db.session.get(Listing, listing_id)
+    if not listing:
+        return jsonify({'error': 'Listing not found'}), 404
+    if listing.owner_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    uploads = request.files.getlist('images')
+    if not uploads:
+        return jsonify({'error': 'No images uploaded'}), 400
+    if len(uploads) > MAX_IMAGES_PER_UPLOAD:
+        return jsonify({'error': f'At most {MAX_IMAGES_PER_UPLOAD} images per upload'}), 400
+    # Werkzeug spools parts over 500 KB to temporary files; the images are
+    # checked and stored from those, never read into memory whole
+    for upload in uploads:
+        try:
+            images.check(upload.stream)
+        except ValueError as e:
+            return jsonify({'error': f'{upload.filename}: {e}'}), 400
+    existing = db.session.execute(
+        select(ListingImage.content_hash).filter_by(listing_id=listing.id)
+    ).scalars().all()
+    # Release the connection while the files are written
+    db.session.rollback()
+    attached = set(existing)
+    added = []
+    for upload in uploads:
+        digest = images.store(upload.stream)
+        # The same photo twice on one listing is stored and shown once
+        if digest in attached:
+            continue
+        attached.add(digest)
+        added.append(ListingImage(
+            listing_id=listing_id,
+            image_url=image_url(digest),
+            content_hash=digest,
+            is_primary=not existing and not added
+        ))
+    db.session.add_all(added)
+    db.session.commit()
+    if added:
+        response_cache.invalidate_listings([listing_id])
+    
+    return jsonify({'images': [{
+        'id': image.id,
+        'image_url': image.image_url,
+        'variants': variant_urls(image.content_hash),
+        'is_primary': image.is_primary
+    } for image in added], 'duplicates': len(uploads) - len(added)}), 201
+
+@app.route('/api/images/<digest>', methods=['GET'])
+@app.route('/api/images/<digest>/<variant>', methods=['GET'])
+def get_image(digest, variant=None):
+    # Stored files never change, so browsers and CDNs may keep them for good;
+    # a variant still being made is answered with the original, briefly
+    located = images.locate(digest, variant)
+    if located is None:
+        return jsonify({'error': 'Image not found'}), 404
+    path, mimetype, final = located
+    response = send_file(path, mimetype=mimetype, max_age=31536000 if final else 60)
+    response.cache_control.public = True
+    if final:
+        response.cache_control.immutable = True
+    return response
+
+def _notify_saved_searches(before, after):
+    # Pushes the listing to owners of saved searches it newly matches
+    for search in matching_searches(before, after):
+        notifications.notify(f'user_{search.user_id}', 'saved_search_match', {
+            'saved_search': {
+                'id': search.id,
+                'name': search.name
+            },
+            'listing': {
+                'id': after['id'],
+                'title': after['title'],
+                'price': after['price'],
+                'property_type': after['property_type'],
+                'bedrooms': after['bedrooms'],
+                'city': after['city']
+            }
+        })
+
+@app.route('/api/listings/import', methods=['POST'])
+@jwt_required()
+def import_listings_route():
+    # Body is NDJSON (default) or CSV (?format=csv or Content-Type: text/csv)
+    user_id = get_jwt_identity()
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    
+    # Feeds may be any size; request.stream would stop at MAX_CONTENT_LENGTH
+    stream = text_stream(get_input_stream(request.environ))
+    rows = read_csv(stream) if fmt == 'csv' else read_ndjson(stream)
+    report = import_listings(rows, user_id)
+    if report.imported:
+        response_cache.clear()
+    
+    return jsonify(report.as_dict())
+
+@app.route('/api/listings/export', methods=['GET'])
+@jwt_required()
+def export_listings():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    updated_since = request.args.get('updated_since')
+    if updated_since:
+        try:
+            updated_since = datetime.fromisoformat(updated_since)
+        except ValueError:
+            return jsonify({'error': 'updated_since must be an ISO 8601 timestamp'}), 400
+    
+    rows = iter_export(fmt, updated_since, request.args.get('status'))
+    return Response(
+        stream_with_context(rows),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=listings.{fmt}'}
+    )
+
 # Favorite routes
 @app.route('/api/favorites', methods=['GET'])
-# @jwt_required()
+@jwt_required()
 def get_favorites():
-    # user_id = get_jwt_identity()
-    user = User.query.first()
-    favorites = Favorite.query.filter_by(user_id=user.id).all()
+    user = current_user
+    favorites = db.session.execute(favorites_query(user.id)).scalars().all()
     
     return jsonify([{
         'id': fav.id,
@@ -416,66 +797,137 @@ def get_favorites():
             'price': fav.listing.price,
             'property_type': fav.listing.property_type,
             'city': fav.listing.city,
-            'primary_image': fav.listing.images[0].image_url if fav.listing.images else None
+            'primary_image': _card_image(fav.listing),
+            'favorite_count': fav.listing.favorite_count
         },
         'created_at': fav.created_at.isoformat()
     } for fav in favorites])
 
+def _favorites_changed(listing_ids):
+    # favorite_count is part of the cached listing payloads
+    if listing_ids:
+        response_cache.invalidate_listings(listing_ids)
+
 @app.route('/api/favorites', methods=['POST'])
-# @jwt_required()
+@jwt_required()
 def add_favorite():
-    # user_id = get_jwt_identity()
-    user = User.query.first()
+    user = current_user
     data = request.get_json()
     
-    # Check if already favorited
-    existing = Favorite.query.filter_by(
-        user_id=user.id, 
-        listing_id=data['listing_id']
-    ).first()
-    
-    if existing:
-        return jsonify({'error': 'Already favorited'}), 400
-    
-    favorite = Favorite(
-        user_id=user.id,
-        listing_id=data['listing_id']
-    )
-    
-    db.session.add(favorite)
+    added = add_favorites(user.id, [data['listing_id']])
     db.session.commit()
+    if not added:
+        if db.session.get(Listing, data['listing_id']) is None:
+            return jsonify({'error': 'Listing not found'}), 404
+        return jsonify({'error': 'Already favorited'}), 400
+    _favorites_changed(added)
     
     return jsonify({'message': 'Added to favorites'})
 
 @app.route('/api/favorites/<int:listing_id>', methods=['DELETE'])
-# @jwt_required()
+@jwt_required()
 def remove_favorite(listing_id):
-    # user_id = get_jwt_identity()
-    user = User.query.first()
-    favorite = Favorite.query.filter_by(
-        user_id=user.id, 
-        listing_id=listing_id
-    ).first()
-    
-    if not favorite:
+    user = current_user
+    removed = remove_favorites(user.id, [listing_id])
+    db.session.commit()
+    
+    if not removed:
         return jsonify({'error': 'Favorite not found'}), 404
+    _favorites_changed(removed)
     
-    db.session.delete(favorite)
+    return jsonify({'message': 'Removed from favorites'})
+
+@app.route('/api/favorites/batch', methods=['POST'])
+@jwt_required()
+def batch_favorites():
+    # {"add": [ids], "remove": [ids]}; ids already in the requested state
+    # and unknown listings are skipped
+    user = current_user
+    data = request.get_json()
+    try:
+        to_add = _listing_ids(data.get('add', []))
+        to_remove = _listing_ids(data.get('remove', []))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    added = add_favorites(user.id, to_add)
+    removed = remove_favorites(user.id, to_remove)
     db.session.commit()
+    _favorites_changed(added + removed)
     
-    return jsonify({'message': 'Removed from favorites'})
+    return jsonify({'added': added, 'removed': removed})
 
-# Message routes
-@app.route('/api/messages', methods=['GET'])
+@app.route('/api/favorites/check', methods=['GET'])
 @jwt_required()
-def get_messages():
-    user_id = get_jwt_identity()
-    messages = Message.query.filter(
-        (Message.sender_id == user_id) | (Message.receiver_id == user_id)
-    ).order_by(Message.created_at.desc()).all()
+def check_favorites():
+    # Which of ?ids=1,2,3 the user has favorited, e.g. for a results page
+    user = current_user
+    try:
+        listing_ids = _listing_ids(request.args.get('ids', ''))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify([{
+    return jsonify({'favorited': favorited_ids(user.id, listing_ids)})
+
+# Saved search routes
+def _saved_search_payload(search):
+    filters = json.loads(search.filters)
+    return {
+        'id': search.id,
+        'name': search.name,
+        'filters': filters,
+        'query_string': urlencode(filters),
+        'created_at': search.created_at.isoformat()
+    }
+
+@app.route('/api/saved-searches', methods=['GET'])
+@jwt_required()
+def get_saved_searches():
+    user_id = get_jwt_identity()
+    searches = db.session.execute(
+        select(SavedSearch).filter_by(user_id=user_id).order_by(SavedSearch.created_at.desc(), SavedSearch.id.desc())
+    ).scalars().all()
+    return jsonify([_saved_search_payload(search) for search in searches])
+
+@app.route('/api/saved-searches', methods=['POST'])
+@jwt_required()
+def create_saved_search():
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    try:
+        filters = normalize_filters(data.get('filters'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    count = db.session.execute(select(func.count(SavedSearch.id)).filter_by(user_id=user_id)).scalar()
+    if count >= MAX_SEARCHES_PER_USER:
+        return jsonify({'error': f'At most {MAX_SEARCHES_PER_USER} saved searches allowed'}), 400
+    search = save_search(user_id, data.get('name'), filters)
+    db.session.commit()
+    return jsonify(_saved_search_payload(search)), 201
+
+@app.route('/api/saved-searches/<int:search_id>', methods=['DELETE'])
+@jwt_required()
+def delete_saved_search(search_id):
+    user_id = get_jwt_identity()
+    search = db.session.execute(
+        select(SavedSearch).filter_by(id=search_id, user_id=user_id)
+    ).scalars().first()
+    if not search:
+        return jsonify({'error': 'Saved search not found'}), 404
+    db.session.delete(search)
+    db.session.commit()
+    return jsonify({'message': 'Saved search deleted'})
+
+# Message routes
+MESSAGE_PAGE_SIZE = 50
+
+def _page_size(default):
+    return clamp_page_size(request.args.get('per_page', default, type=int))
+
+def _message_payload(msg):
+    return {
         'id': msg.id,
+        'conversation_id': msg.conversation_id,
         'subject': msg.subject,
         'content': msg.content,
         'is_read': msg.is_read,
@@ -487,416 +939,370 @@ def get_messages():
         'receiver': {
             'id': msg.receiver.id,
             'name': msg.receiver.name
-        },
-        'listing': {
-            'id': msg.listing.id,
-            'title': msg.listing.title
-        } if msg.listing else None
-    } for msg in messages])
+        }
+    }
+
+@app.route('/api/messages', methods=['GET'])
+@jwt_required()
+def get_messages():
+    # Newest messages first, at most per_page; pass cursor= (empty for the
+    # first page) to page through older ones
+    user_id = get_jwt_identity()
+    per_page = _page_size(MESSAGE_PAGE_SIZE)
+    paged = 'cursor' in request.args
+    try:
+        before = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Pick the page's ids from the indexes, then load those rows; one extra
+    # row tells cursor clients whether another page follows
+    page = db.session.execute(mailbox_query(user_id, per_page + 1 if paged else per_page, before)).all()
+    loaded = {msg.id: msg for msg in db.session.execute(messages_query([row.id for row in page])).scalars()}
+    messages = [loaded[row.id] for row in page if row.id in loaded]
+    if paged:
+        messages, next_cursor = keyset_result(messages, per_page, columns=(Message.created_at, Message.id))
+    
+    payload = [dict(_message_payload(msg), listing={
+        'id': msg.listing.id,
+        'title': msg.listing.title
+    } if msg.listing else None) for msg in messages]
+    if 'cursor' in request.args:
+        return jsonify({'messages': payload, 'next_cursor': next_cursor})
+    return jsonify(payload)
 
 @app.route('/api/messages', methods=['POST'])
 @jwt_required()
 def send_message():
     user_id = get_jwt_identity()
     data = request.get_json()
+    try:
+        receiver_id = _json_id(data, 'receiver_id')
+        listing_id = _json_id(data, 'listing_id', required=False)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if db.session.execute(select(User.id).filter_by(id=receiver_id)).first() is None:
+        return jsonify({'error': 'Receiver not found'}), 404
+    if listing_id is not None and db.session.execute(select(Listing.id).filter_by(id=listing_id)).first() is None:
+        return jsonify({'error': 'Listing not found'}), 404
     
-    message = Message(
-        sender_id=user_id,
-        receiver_id=data['receiver_id'],
-        listing_id=data.get('listing_id'),
-        subject=data.get('subject', ''),
-        content=data['content']
+    message = messaging.send_message(
+        user_id, receiver_id, data['content'], subject=data.get('subject', ''), listing_id=listing_id
     )
-    
-    db.session.add(message)
-    db.session.commit()
-    
-    # Emit real-time notification
-    socketio.emit('new_message', {
-        'message': {
-            'id': message.id,
-            'subject': message.subject,
-            'content': message.content,
-            'sender': {
-                'id': message.sender.id,
-                'name': message.sender.name
-            }
-        }
-    }, room=f"user_{data['receiver_id']}")
-    
-    return jsonify({
+    sender_name = current_user.name
+    # Built before commit, which would expire the message and reload it
+    result = {
         'id': message.id,
+        'conversation_id': message.conversation_id,
         'subject': message.subject,
         'content': message.content
+    }
+    db.session.commit()
+    
+    # Real-time notification, emitted by the background dispatcher
+    notifications.notify(f'user_{receiver_id}', 'new_message', {
+        'message': dict(result, sender={
+            'id': user_id,
+            'name': sender_name
+        })
     })
+    
+    return jsonify(result)
+
+@app.route('/api/conversations', methods=['GET'])
+@jwt_required()
+def get_conversations():
+    # Inbox, most recently active first; page with cursor=/next_cursor
+    user_id = get_jwt_identity()
+    try:
+        entries, next_cursor = keyset_page(
+            inbox_query(user_id), request.args.get('cursor'), _page_size(20),
+            columns=(ConversationParticipant.last_message_at, ConversationParticipant.conversation_id)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    unread_total = db.session.execute(select(User.unread_count).filter_by(id=user_id)).scalar()
+    
+    conversations = []
+    for entry in entries:
+        conversation = entry.conversation
+        last = conversation.last_message
+        conversations.append({
+            'id': entry.conversation_id,
+            'counterpart': {
+                'id': entry.counterpart_id,
+                'name': entry.counterpart.name
+            },
+            'listing': {
+                'id': conversation.listing.id,
+                'title': conversation.listing.title
+            } if conversation.listing else None,
+            'unread_count': entry.unread_count,
+            'last_message_at': entry.last_message_at.isoformat() if entry.last_message_at else None,
+            'last_message': {
+                'id': last.id,
+                'sender_id': last.sender_id,
+                'subject': last.subject,
+                'content': last.content,
+                'is_read': last.is_read
+            } if last else None
+        })
+    return jsonify({'conversations': conversations, 'next_cursor': next_cursor, 'unread_total': unread_total or 0})
+
+def _participant(conversation_id, user_id):
+    return db.session.execute(
+        select(ConversationParticipant).filter_by(conversation_id=conversation_id, user_id=user_id)
+    ).scalars().first()
+
+@app.route('/api/conversations/<int:conversation_id>/messages', methods=['GET'])
+@jwt_required()
+def get_conversation_messages(conversation_id):
+    # One thread, newest first; page with cursor=/next_cursor
+    user_id = get_jwt_identity()
+    if not _participant(conversation_id, user_id):
+        return jsonify({'error': 'Conversation not found'}), 404
+    try:
+        messages, next_cursor = keyset_page(
+            thread_query(conversation_id), request.args.get('cursor'), _page_size(MESSAGE_PAGE_SIZE),
+            columns=(Message.created_at, Message.id)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'messages': [_message_payload(msg) for msg in messages], 'next_cursor': next_cursor})
+
+@app.route('/api/conversations/<int:conversation_id>/read', methods=['POST'])
+@jwt_required()
+def mark_conversation_read(conversation_id):
+    user_id = get_jwt_identity()
+    if not _participant(conversation_id, user_id):
+        return jsonify({'error': 'Conversation not found'}), 404
+    marked = messaging.mark_conversation_read(conversation_id, user_id)
+    db.session.commit()
+    unread_total = db.session.execute(select(User.unread_count).filter_by(id=user_id)).scalar()
+    return jsonify({'marked': marked, 'unread_total': unread_total})
 
 # Search routes
+SEARCH_LIMIT = 20
+
 @app.route('/api/search', methods=['GET'])
+@response_cache.cached(status='active')
 def search_listings():
-    query = request.args.get('q', '')
-    property_type = request.args.get('property_type')
-    min_price = request.args.get('min_price', type=float)
-    max_price = request.args.get('max_price', type=float)
-    bedrooms = request.args.get('bedrooms', type=int)
-    city = request.args.get('city')
-    
-    listings_query = Listing.query.filter_by(status='active')
-    
-    if query:
-        listings_query = listings_query.filter(
-            db.or_(
-                Listing.title.ilike(f'%{query}%'),
-                Listing.description.ilike(f'%{query}%'),
-                Listing.address.ilike(f'%{query}%'),
-                Listing.city.ilike(f'%{query}%')
-            )
-        )
-    
-    if property_type:
-        listings_query = listings_query.filter_by(property_type=property_type)
-    if min_price:
-        listings_query = listings_query.filter(Listing.price >= min_price)
-    if max_price:
-        listings_query = listings_query.filter(Listing.price <= max_price)
-    if bedrooms:
-        listings_query = listings_query.filter(Listing.bedrooms >= bedrooms)
-    if city:
-        listings_query = listings_query.filter(Listing.city.ilike(f'%{city}%'))
+    try:
+        listings_query, geo = search_statement(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    listings = listings_query.order_by(Listing.created_at.desc()).limit(20).all()
+    listings = db.session.execute(
+        listings_query.order_by(Listing.created_at.desc()).limit(SEARCH_LIMIT)
+    ).scalars().all()
+    cards = search_cards(listings, geo)
     
-    return jsonify([{
-        'id': listing.id,
-        'title': listing.title,
-        'price': listing.price,
-        'property_type': listing.property_type,
-        'bedrooms': listing.bedrooms,
-        'bathrooms': listing.bathrooms,
-        'city': listing.city,
-        'state': listing.state,
-        'primary_image': listing.images[0].image_url if listing.images else None
-    } for listing in listings])
+    # facets=1 wraps the results as {'listings': [...], 'facets': {...}}
+    if request.args.get('facets', type=int):
+        return jsonify({'listings': cards, 'facets': facet_counts(listings_query, request.args)})
+    return jsonify(cards)
+
+def internal(view):
+    # 404, as for an unknown route, unless INTERNAL_ENDPOINTS is set or the
+    # app runs in debug mode
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not (app.config['INTERNAL_ENDPOINTS'] or app.debug):
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/api/_cache/stats', methods=['GET'])
+@internal
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/api/_metrics', methods=['GET'])
+@internal
+def prometheus_metrics():
+    return Response(metrics.metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# CLI commands
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Create missing tables and apply pending schema migrations."""
+    ran = initialize_database()
+    for version, description in ran:
+        print(f'Applied migration {version}: {description}')
+    print('Database is up to date' if not ran else f'{len(ran)} migration(s) applied')
+
+@app.cli.command('init-db')
+@click.option('--seed-if-empty', is_flag=True, help='Load the demo sample data if there are no users yet.')
+def init_db_command(seed_if_empty):
+    """Prepare the database before the app serves requests."""
+    ran = initialize_database(seed_if_empty=seed_if_empty)
+    print(f'Database initialized ({len(ran)} migration(s) applied)')
+
+@app.cli.command('import-listings')
+@click.argument('path')
+@click.option('--owner-id', type=int, required=True, help='User that will own the imported listings.')
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+def import_listings_command(path, owner_id, fmt, batch_size):
+    """Bulk-import listings from an NDJSON or CSV file ('-' for stdin)."""
+    import sys
+    import time
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'ndjson')
+    stream = text_stream(sys.stdin.buffer) if path == '-' else open(path, encoding='utf-8-sig', newline='')
+    started = time.perf_counter()
+    with stream:
+        rows = read_csv(stream) if fmt == 'csv' else read_ndjson(stream)
+        report = import_listings(rows, owner_id, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    if report.imported:
+        response_cache.clear()
+    for error in report.errors:
+        print(f"line {error['line']}: {error['error']}")
+    print(f'Imported {report.imported} listings, {report.failed} failed, '
+          f'in {elapsed:.1f}s ({report.imported / max(elapsed, 1e-9):.0f} rows/s)')
+
+@app.cli.command('export-listings')
+@click.argument('path', default='-')
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), help='Defaults to the file extension.')
+@click.option('--updated-since', type=click.DateTime(), help='Only listings changed at or after this time.')
+@click.option('--status', help='Only listings with this status.')
+def export_listings_command(path, fmt, updated_since, status):
+    """Stream every listing with owner, images and features to a file ('-' for stdout)."""
+    import sys
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'ndjson')
+    out = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8', newline='')
+    try:
+        for chunk in iter_export(fmt, updated_since, status):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+@app.cli.command('seed')
+@click.option('--users', type=int, default=1000, show_default=True)
+@click.option('--listings', type=int, default=10000, show_default=True)
+@click.option('--favorites-per-user', type=float, default=3, show_default=True, help='Mean favorites per buyer.')
+@click.option('--messages', type=int, help='Defaults to half the number of listings.')
+@click.option('--seed', 'seed', type=int, default=42, show_default=True, help='Same seed, same data.')
+@click.option('--batch-size', type=int, default=5000, show_default=True)
+def seed_command(users, listings, favorites_per_user, messages, seed, batch_size):
+    """Append synthetic users, listings, favorites and messages for load testing."""
+    import time
+    initialize_database()
+    started = time.perf_counter()
+
+    def progress(table, done, total):
+        print(f'\r{table}: {done}/{total} ({time.perf_counter() - started:.0f}s)', end='', flush=True)
+        if done >= total:
+            print()
+
+    counts = generate(users=users, listings=listings, favorites_per_user=favorites_per_user,
+                      messages=messages, seed=seed, batch_size=batch_size, progress=progress,
+                      password_method=passwords.method)
+    response_cache.clear()
+    elapsed = time.perf_counter() - started
+    print(', '.join(f'{count} {table}' for table, count in counts.items()) +
+          f' in {elapsed:.1f}s ({counts["listings"] / max(elapsed, 1e-9):.0f} listings/s)')
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """EXPLAIN the hot endpoint queries and fail if any scans or sorts."""
+    failed = False
+    for name, (plan, offending) in check_query_plans().items():
+        print(f"{'FAIL' if offending else 'ok  '} {name}")
+        for line in plan:
+            print(f'       {line}')
+        failed = failed or bool(offending)
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the full-text index behind /api/search."""
+    db.create_all()
+    if rebuild_search_index():
+        print('Search index rebuilt')
+    else:
+        print('Full-text index is only available on SQLite; /api/search uses ILIKE')
+
+@app.cli.command('rebuild-geo-index')
+def rebuild_geo_index_command():
+    """Rebuild the spatial index behind the near/bbox filters."""
+    db.create_all()
+    if rebuild_geo_index():
+        print('Geo index rebuilt')
+    else:
+        print('Spatial index is only available on SQLite; near/bbox filter the coordinate columns')
+
+@app.cli.command('rebuild-facet-index')
+def rebuild_facet_index_command():
+    """Recount the pre-aggregated facet counts from the listing table."""
+    db.create_all()
+    if rebuild_facet_index():
+        print('Facet index rebuilt')
+    else:
+        print('Facet index is only available on SQLite; facets are counted from the listing table')
+
+@app.cli.command('process-images')
+def process_images_command():
+    """Make the missing resized variants of every uploaded listing image."""
+    import time
+    digests = db.session.execute(
+        select(ListingImage.content_hash).where(ListingImage.content_hash.isnot(None)).distinct()
+    ).scalars().all()
+    # Queue the whole batch; uploads are not running alongside
+    images.queue_size = max(images.queue_size, len(digests))
+    started = time.perf_counter()
+    processed = images.processed
+    for digest in digests:
+        images.submit(digest)
+    images.flush()
+    elapsed = time.perf_counter() - started
+    done = images.processed - processed
+    print(f'Made variants for {done} of {len(digests)} images ({images.failed} failed) '
+          f'in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.1f} images/s, {images.workers} workers)')
 
 # Socket.IO events
-@socketio.on('connect')
 def handle_connect():
-    print('Client connected')
+    app.logger.debug('Client connected: %s', request.sid)
 
-@socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
+    app.logger.debug('Client disconnected: %s', request.sid)
 
-@socketio.on('join_user_room')
 def handle_join_user_room(data):
+    from flask_socketio import join_room
     room = f"user_{data['user_id']}"
     join_room(room)
-    print(f'Client joined room: {room}')
-
-def create_sample_data():
-    # Create users
-    users = [
-        User(
-            name='Max Mustermann',
-            email='max@example.com',
-            password='password123',
-            phone='+49-30-123456',
-            user_type='buyer'
-        ),
-        User(
-            name='Sabine Müller',
-            email='sabine@example.com',
-            password='password123',
-            phone='+49-89-654321',
-            user_type='seller'
-        ),
-        User(
-            name='Thomas Schmidt',
-            email='thomas@example.com',
-            password='password123',
-            phone='+49-40-987654',
-            user_type='agent'
-        ),
-        User(
-            name='Julia Becker',
-            email='julia@example.com',
-            password='password123',
-            phone='+49-69-112233',
-            user_type='buyer'
-        ),
-        User(
-            name='David Wagner',
-            email='david@example.com',
-            password='password123',
-            phone='+49-221-445566',
-            user_type='seller'
-        )
-    ]
-    for user in users:
-        db.session.add(user)
-    db.session.commit()
+    app.logger.debug('Client %s joined room %s', request.sid, room)
 
-    # German cities and coordinates
-    german_cities = [
-        ('Berlin', 'Brandenburger Tor', '10117', 52.5163, 13.3777),
-        ('München', 'Marienplatz', '80331', 48.1371, 11.5754),
-        ('Hamburg', 'Jungfernstieg', '20095', 53.5535, 9.9937),
-        ('Frankfurt', 'Zeil', '60313', 50.1155, 8.6842),
-        ('Köln', 'Domkloster', '50667', 50.9413, 6.9583),
-        ('Düsseldorf', 'Königsallee', '40212', 51.2254, 6.7763),
-        ('Stuttgart', 'Schlossplatz', '70173', 48.7784, 9.1806),
-        ('Leipzig', 'Augustusplatz', '04109', 51.3397, 12.3731),
-        ('Dresden', 'Altmarkt', '01067', 51.0504, 13.7373),
-        ('Hannover', 'Kröpcke', '30159', 52.3759, 9.7320)
-    ]
-    
-    # Sample listings in German cities
-    listings = [
-        Listing(
-            owner_id=2,
-            title='Moderne Wohnung am Brandenburger Tor',
-            description='Helle, moderne 3-Zimmer-Wohnung mit Balkon im Herzen von Berlin. Perfekt für Familien oder Paare.',
-            price=650000.0,
-            property_type='apartment',
-            bedrooms=3,
-            bathrooms=2,
-            square_feet=110,
-            address='Brandenburger Tor 1',
-            city='Berlin',
-            state='Berlin',
-            zip_code='10117',
-            latitude=52.5163,
-            longitude=13.3777,
-            status='active'
-        ),
-        Listing(
-            owner_id=5,
-            title='Luxusvilla mit Isarblick',
-            description='Exklusive Villa mit großem Garten und Blick auf die Isar. Hochwertige Ausstattung, ruhige Lage.',
-            price=2200000.0,
-            property_type='house',
-            bedrooms=6,
-            bathrooms=4,
-            square_feet=350,
-            address='Isarstraße 12',
-            city='München',
-            state='Bayern',
-            zip_code='80331',
-            latitude=48.1371,
-            longitude=11.5754,
-            status='active'
-        ),
-        Listing(
-            owner_id=2,
-            title='Altbauwohnung an der Alster',
-            description='Charmante Altbauwohnung mit hohen Decken und Stuck, direkt an der Außenalster.',
-            price=850000.0,
-            property_type='apartment',
-            bedrooms=4,
-            bathrooms=2,
-            square_feet=140,
-            address='Alsterufer 8',
-            city='Hamburg',
-            state='Hamburg',
-            zip_code='20095',
-            latitude=53.5535,
-            longitude=9.9937,
-            status='active'
-        ),
-        Listing(
-            owner_id=5,
-            title='Penthouse mit Skyline-Blick',
-            description='Luxuriöses Penthouse mit Panoramablick über die Frankfurter Skyline. Moderne Ausstattung.',
-            price=1800000.0,
-            property_type='apartment',
-            bedrooms=3,
-            bathrooms=3,
-            square_feet=180,
-            address='Zeil 123',
-            city='Frankfurt',
-            state='Hessen',
-            zip_code='60313',
-            latitude=50.1155,
-            longitude=8.6842,
-            status='active'
-        ),
-        Listing(
-            owner_id=2,
-            title='Stadtvilla im Rheinviertel',
-            description='Elegante Stadtvilla im exklusiven Rheinviertel. Großer Garten, Garage, hochwertige Ausstattung.',
-            price=1200000.0,
-            property_type='house',
-            bedrooms=5,
-            bathrooms=3,
-            square_feet=280,
-            address='Rheinallee 45',
-            city='Köln',
-            state='Nordrhein-Westfalen',
-            zip_code='50667',
-            latitude=50.9413,
-            longitude=6.9583,
-            status='active'
-        ),
-        Listing(
-            owner_id=5,
-            title='Stadthaus am Kröpcke',
-            description='Moderne Stadthaus in bester Lage. Offener Grundriss, Terrasse, Tiefgarage.',
-            price=950000.0,
-            property_type='house',
-            bedrooms=4,
-            bathrooms=2,
-            square_feet=200,
-            address='Kröpcke 7',
-            city='Hannover',
-            state='Niedersachsen',
-            zip_code='30159',
-            latitude=52.3759,
-            longitude=9.7320,
-            status='active'
-        ),
-        Listing(
-            owner_id=2,
-            title='Loftwohnung am Augustusplatz',
-            description='Industrielles Loft in einem umgebauten Fabrikgebäude. Hohe Decken, große Fenster.',
-            price=750000.0,
-            property_type='apartment',
-            bedrooms=2,
-            bathrooms=2,
-            square_feet=160,
-            address='Augustusplatz 15',
-            city='Leipzig',
-            state='Sachsen',
-            zip_code='04109',
-            latitude=51.3397,
-            longitude=12.3731,
-            status='active'
-        ),
-        Listing(
-            owner_id=5,
-            title='Barockwohnung am Altmarkt',
-            description='Historische Wohnung in einem Barockgebäude. Stuckdecken, Parkett, antike Details.',
-            price=680000.0,
-            property_type='apartment',
-            bedrooms=3,
-            bathrooms=1,
-            square_feet=120,
-            address='Altmarkt 22',
-            city='Dresden',
-            state='Sachsen',
-            zip_code='01067',
-            latitude=51.0504,
-            longitude=13.7373,
-            status='active'
-        )
-    ]
-    
-    for listing in listings:
-        db.session.add(listing)
-    db.session.commit()
+# Flask-SocketIO and its async driver cost ~90 ms to import and set up, so
+# the server is created by init_socketio(): at import when this process
+# serves Socket.IO clients, else when the first notification is emitted.
+socketio = None
+_socketio_lock = threading.Lock()
 
-    # Add images to listings
-    house_images = [
-        'https://images.pexels.com/photos/106399/pexels-photo-106399.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/1396122/pexels-photo-1396122.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/210617/pexels-photo-210617.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/323780/pexels-photo-323780.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/259962/pexels-photo-259962.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/259600/pexels-photo-259600.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/259701/pexels-photo-259701.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/259624/pexels-photo-259624.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/259580/pexels-photo-259580.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/259597/pexels-photo-259597.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/259618/pexels-photo-259618.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/259588/pexels-photo-259588.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/259600/pexels-photo-259600.jpeg?auto=compress&w=800',
-    ]
-    
-    # Add multiple images per listing
-    listing_objs = Listing.query.all()
-    for i, listing in enumerate(listing_objs):
-        used_imgs = random.sample(house_images, 3)
-        for j, img_url in enumerate(used_imgs):
-            db.session.add(ListingImage(listing_id=listing.id, image_url=img_url, is_primary=(j==0)))
-    db.session.commit()
+def init_socketio():
+    global socketio
+    with _socketio_lock:
+        if socketio is None:
+            from flask_socketio import SocketIO
+            # A message queue URL (e.g. redis://) lets several server processes share rooms
+            server = SocketIO(app, cors_allowed_origins="*", message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'])
+            server.on_event('connect', handle_connect)
+            server.on_event('disconnect', handle_disconnect)
+            server.on_event('join_user_room', handle_join_user_room)
+            socketio = server
+    return socketio
 
-    # Add property features per listing
-    feature_pool = [
-        ('Balkon', ['Ja', 'Nein']),
-        ('Garten', ['Ja', 'Nein']),
-        ('Keller', ['Ja', 'Nein']),
-        ('Baujahr', ['1990', '2005', '2015', '2020', '1975']),
-        ('Heizung', ['Gas', 'Fernwärme', 'Öl', 'Wärmepumpe', 'Elektro']),
-        ('Energieausweis', ['Vorhanden', 'Nicht vorhanden']),
-        ('Stellplatz', ['Garage', 'Tiefgarage', 'Außenstellplatz', 'Kein Stellplatz']),
-        ('Aufzug', ['Ja', 'Nein']),
-        ('Barrierefrei', ['Ja', 'Nein']),
-        ('Einbauküche', ['Ja', 'Nein']),
-        ('Internet', ['Glasfaser', 'DSL', 'Kabel', 'Kein Internet']),
-        ('Bodenbelag', ['Parkett', 'Fliesen', 'Teppich', 'Laminat']),
-        ('Möbliert', ['Ja', 'Nein']),
-        ('Haustiere erlaubt', ['Ja', 'Nein'])
-    ]
-    for listing in listing_objs:
-        chosen = random.sample(feature_pool, 6)
-        for fname, fvals in chosen:
-            db.session.add(PropertyFeature(listing_id=listing.id, feature_name=fname, feature_value=random.choice(fvals)))
-    db.session.commit()
-    
-    # Create favorites
-    favorites = [
-        Favorite(user_id=1, listing_id=1),  # Max likes Moderne Wohnung am Brandenburger Tor
-        Favorite(user_id=1, listing_id=3),  # Max likes Altbauwohnung an der Alster
-        Favorite(user_id=4, listing_id=2),  # Julia likes Luxusvilla mit Isarblick
-        Favorite(user_id=4, listing_id=4),  # Julia likes Penthouse mit Skyline-Blick
-        Favorite(user_id=3, listing_id=6),  # Thomas likes Stadthaus am Kröpcke
-        Favorite(user_id=3, listing_id=8),  # Thomas likes Loftwohnung am Augustusplatz
-    ]
-    
-    for favorite in favorites:
-        db.session.add(favorite)
-    db.session.commit()
-    
-    # Create messages
-    messages = [
-        Message(
-            sender_id=1,  # Max
-            receiver_id=2,  # Sabine
-            listing_id=1,
-            subject='Interesse an Wohnung am Brandenburger Tor',
-            content='Hallo Sabine, ich bin sehr interessiert an Ihrer Wohnung am Brandenburger Tor. Ist sie noch verfügbar?',
-            is_read=False
-        ),
-        Message(
-            sender_id=2,  # Sabine
-            receiver_id=1,  # Max
-            listing_id=1,
-            subject='Re: Interesse an Wohnung am Brandenburger Tor',
-            content='Hallo Max, ja sie ist noch verfügbar! Ich kann Ihnen heute Abend einen Besichtigungstermin anbieten. Wann passt es Ihnen?',
-            is_read=True
-        ),
-        Message(
-            sender_id=4,  # Julia
-            receiver_id=5,  # David
-            listing_id=2,
-            subject='Luxusvilla Anfrage',
-            content='Hallo David, ich bin sehr interessiert an Ihrer Luxusvilla. Können Sie mir mehr über die Ausstattung und den Garten erzählen?',
-            is_read=False
-        ),
-        Message(
-            sender_id=3,  # Thomas
-            receiver_id=5,  # David
-            listing_id=6,
-            subject='Stadthaus Fragen',
-            content='Hallo David, ich bin ein Agent für einen Kunden, der an Ihrem Stadthaus interessiert ist. Ist die Garage inbegriffen?',
-            is_read=False
-        )
-    ]
-    
-    for message in messages:
-        db.session.add(message)
-    db.session.commit()
-    
-    print("Sample data created successfully!")
+notifications.init_app(app, init_socketio)
+if app.config['SOCKETIO_SERVER']:
+    init_socketio()
+
+# For deploys without a separate init step, e.g. serverless
+if app.config['INIT_DB_ON_STARTUP'] in ('1', 'seed'):
+    initialize_database(seed_if_empty=app.config['INIT_DB_ON_STARTUP'] == 'seed')
 
 if __name__ == '__main__':
-    initialize_database()
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True) 
\ No newline at end of file
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'),
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    initialize_database(seed_if_empty=True)
+    init_socketio().run(app, debug=True, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True) 
\ No newline at end of file
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+from functools import partial
+from urllib.parse import parse_qsl
+
+# ASGI serving mode, for an ASGI server instead of `python app.py`:
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000
+#
+# GET /api/listings and /api/search, the read-heavy public endpoints, are
+# served on the event loop: the same statements as the Flask views, run
+# through an async SQLAlchemy session (aiosqlite on SQLite), and the same
+# response cache and compression, so a client waiting on the database holds a coroutine
+# instead of a thread. Arguments the async views do not handle (ids=,
+# facets=, include_total=, page numbers below 1) and every other route go to
+# the Flask app on a pool of ASGI_WSGI_THREADS threads. Socket.IO runs on
+# an AsyncServer sharing the event loop, so its connections hold no threads
+# either. Needs the packages in requirements-async.txt.
+
+# The Flask-SocketIO server is replaced by the AsyncServer below
+os.environ.setdefault('SOCKETIO_SERVER', '0')
+
+import socketio
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import lazyload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.datastructures import MultiDict
+
+from app import (
+    app as flask_app, LISTINGS_CACHE_DEFAULTS, SEARCH_LIMIT, compression, engines, filter_listings, listing_cards,
+    notifications, response_cache, search_cards, search_statement
+)
+from cache import FileBackend
+from models import Listing
+from pagination import clamp_page_size, keyset_result, keyset_statement
+from queries import listing_cards_query
+
+logger = logging.getLogger('real_estate.asgi')
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+# Arguments the async views answer; anything else goes to Flask
+LISTING_ARGS = {
+    'page', 'per_page', 'cursor', 'status', 'property_type', 'min_price', 'max_price', 'bedrooms', 'city',
+    'near', 'radius_km', 'bbox', 'feature'
+}
+SEARCH_ARGS = {
+    'q', 'property_type', 'min_price', 'max_price', 'bedrooms', 'city', 'near', 'radius_km', 'bbox', 'feature'
+}
+def _async_url():
+    # The async views only read, so they follow DATABASE_READ_URL
+    if flask_app.config['ASYNC_DATABASE_URL']:
+        return flask_app.config['ASYNC_DATABASE_URL']
+    url = (engines.read_engine or engines.engine).url
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=driver) if driver else None
+
+_url = _async_url()
+if _url is not None:
+    engine = create_async_engine(
+        _url, poolclass=AsyncAdaptedQueuePool, pool_size=flask_app.config['ASYNC_DB_POOL_SIZE'], max_overflow=0
+    )
+    engines.configure_engine(engine.sync_engine, read_only=engines.read_engine is not None)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+else:
+    engine = Session = None
+
+# Statements are built in an app context (index availability is looked up
+# through db.engine), then run without one
+def _listings_statement(args):
+    # (statement, geo, page, per_page) or None to leave the request to Flask
+    if not LISTING_ARGS.issuperset(args.keys()):
+        return None
+    page = args.get('page', 1, type=int)
+    # Clamped as the Flask view clamps it
+    per_page = clamp_page_size(args.get('per_page', 10, type=int))
+    if 'cursor' not in args and page < 1:
+        return None
+    with flask_app.app_context():
+        try:
+            stmt, geo = filter_listings(listing_cards_query(args.get('status', 'active')), args)
+            if 'cursor' in args:
+                if geo and 'near' in geo:
+                    return None
+                stmt = keyset_statement(stmt, args['cursor'], per_page)
+        except ValueError:
+            return None
+    return stmt, geo, page, per_page
+
+async def _listings(args, prepared):
+    stmt, geo, page, per_page = prepared
+    async with Session() as session:
+        if 'cursor' in args:
+            rows = (await session.execute(stmt)).scalars().all()
+            items, next_cursor = keyset_result(rows, per_page)
+            return {'listings': listing_cards(items, geo), 'next_cursor': next_cursor}
+        items = (await session.execute(
+            stmt.order_by(Listing.created_at.desc()).limit(per_page).offset((page - 1) * per_page)
+        )).unique().scalars().all()
+        total = (await session.execute(
+            select(func.count()).select_from(stmt.options(lazyload('*')).order_by(None).subquery())
+        )).scalar()
+        return {
+            'listings': listing_cards(items, geo),
+            'total': total,
+            'pages': math.ceil(total / per_page) if total else 0,
+            'current_page': page
+        }
+
+def _search_statement(args):
+    if not SEARCH_ARGS.issuperset(args.keys()):
+        return None
+    with flask_app.app_context():
+        try:
+            stmt, geo = search_statement(args)
+        except ValueError:
+            return None
+    return stmt.order_by(Listing.created_at.desc()).limit(SEARCH_LIMIT), geo
+
+async def _search(args, prepared):
+    stmt, geo = prepared
+    async with Session() as session:
+        listings = (await session.execute(stmt)).scalars().all()
+        return search_cards(listings, geo)
+
+# path -> (prepare, run, cache defaults, pinned status filter)
+ASYNC_VIEWS = {
+    '/api/listings': (_listings_statement, _listings, LISTINGS_CACHE_DEFAULTS, None),
+    '/api/search': (_search_statement, _search, None, 'active'),
+}
+
+async def _send_json(send, body, cache_status, encoding=None):
+    # Headers the Flask app would add: CORS(app) allows any origin
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (b'vary', b'Accept-Encoding'),
+        (b'access-control-allow-origin', b'*'),
+        (b'x-cache', cache_status),
+    ]
+    if encoding is not None:
+        headers.append((b'content-encoding', encoding.encode()))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+async def _cache_call(fn, *args, **kwargs):
+    # The file backend reads and writes files; that runs on the default
+    # executor so the event loop keeps serving meanwhile
+    if isinstance(response_cache.backend, FileBackend):
+        return await asyncio.get_running_loop().run_in_executor(None, partial(fn, *args, **kwargs))
+    return fn(*args, **kwargs)
+
+wsgi = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_THREADS'])
+
+async def http(scope, receive, send):
+    if emitter.loop is None:
+        emitter.loop = asyncio.get_running_loop()
+    view = ASYNC_VIEWS.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+    if view is None or engine is None:
+        return await wsgi(scope, receive, send)
+    prepare, run, defaults, status_filter = view
+    args = MultiDict(parse_qsl(scope['query_string'].decode('utf-8', 'replace'), keep_blank_values=True))
+    prepared = prepare(args)
+    if prepared is None:
+        return await wsgi(scope, receive, send)
+
+    accept_encoding = _header(scope, b'accept-encoding')
+    cache = response_cache if response_cache.backend is not None else None
+    if cache:
+        key, params = cache.request_key(scope['path'], args, defaults)
+        entry = await _cache_call(cache.lookup, key)
+        if entry is not None:
+            body, encoding = cache.encode(entry['body'], accept_encoding, entry)
+            return await _send_json(send, body, b'HIT', encoding)
+        generation = cache.generation()
+    body = flask_app.json.response(await run(args, prepared)).get_data()
+    encoding = compression.negotiate(accept_encoding, len(body))
+    encoded = compression.compress(body, encoding) if encoding else body
+    if cache:
+        await _cache_call(cache.store, key, body, 'application/json', params, generation,
+                          status_filter=status_filter, encodings={encoding: encoded} if encoding else None)
+    await _send_json(send, encoded, b'MISS', encoding)
+
+# Socket.IO. With SOCKETIO_MESSAGE_QUEUE, rooms are shared with sync
+# processes on the same queue through Flask-SocketIO's channel.
+def _client_manager():
+    url = flask_app.config['SOCKETIO_MESSAGE_QUEUE']
+    if not url:
+        return None
+    if not url.startswith(('redis://', 'rediss://')):
+        raise ValueError('ASGI mode supports redis:// SOCKETIO_MESSAGE_QUEUE URLs only')
+    return socketio.AsyncRedisManager(url, channel='flask-socketio')
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', client_manager=_client_manager())
+
+@sio.event
+async def connect(sid, environ):
+    logger.debug('Client connected: %s', sid)
+
+@sio.event
+async def disconnect(sid):
+    logger.debug('Client disconnected: %s', sid)
+
+@sio.event
+async def join_user_room(sid, data):
+    room = f"user_{data['user_id']}"
+    await sio.enter_room(sid, room)
+    logger.debug('Client %s joined room %s', sid, room)
+
+class _LoopEmitter:
+    # The Socket.IO server as the notification dispatcher sees it: its
+    # thread emits through the AsyncServer on the event loop
+    def __init__(self, server):
+        self.server = server
+        self.loop = None
+
+    def start_background_task(self, target):
+        threading.Thread(target=target, name='notification-dispatcher', daemon=True).start()
+
+    def emit(self, event, data, room):
+        asyncio.run_coroutine_threadsafe(self.server.emit(event, data, room=room), self.loop).result()
+
+emitter = _LoopEmitter(sio)
+notifications.init_app(flask_app, lambda: emitter)
+
+async def _shutdown():
+    if engine is not None:
+        await engine.dispose()
+
+app = socketio.ASGIApp(sio, other_asgi_app=http, on_shutdown=_shutdown)
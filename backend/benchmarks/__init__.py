@@ -0,0 +1,12 @@
+# Endpoint benchmarks. Run from backend/:
+#
+#   python -m benchmarks run --sizes 1k,100k --out results/before.json
+#   python -m benchmarks compare results/before.json results/after.json
+#   python -m benchmarks coldstart --out results/coldstart.json
+#   python -m benchmarks login --out results/login.json
+#   python -m benchmarks serve --out results/serve.json
+#   python -m benchmarks contention --out results/contention.json
+#   python -m benchmarks images --out results/images.json
+#
+# Each size runs in its own process against a copy of a fixture database
+# built once by the synthetic data generator and kept in benchmarks/fixtures/.
@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import sys
+
+from benchmarks.runner import (
+    COMPRESSION_ENCODINGS, CONTENTION_VARIANTS, IMAGE_WORKER_COUNTS, LOGIN_METHODS, SERVE_MODES, cold_start,
+    cold_start_worker, compare, compression_load, compression_worker, contention, contention_worker, image_load,
+    login_load, login_worker, run, run_worker, serve_load, serve_worker
+)
+
+def _write(report, path):
+    if path in (None, '-'):
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {path}', file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark the API endpoints.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Benchmark every route on fixture databases.')
+    run_parser.add_argument('--sizes', default='1k,100k', help='Comma-separated listing counts, e.g. 1k,100k,1m.')
+    run_parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario.')
+    run_parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per scenario.')
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--cache', default='none', choices=['none', 'memory'],
+                            help='Response cache backend; off by default to measure the database path.')
+    run_parser.add_argument('--only', action='append', help='Run scenarios whose name contains this; repeatable.')
+    run_parser.add_argument('--out', help="JSON results file ('-' for stdout).")
+
+    cold_parser = commands.add_parser('coldstart', help='Time import to first response in fresh processes.')
+    cold_parser.add_argument('--size', default='1k', help='Fixture listing count.')
+    cold_parser.add_argument('--runs', type=int, default=20, help='Processes per variant.')
+    cold_parser.add_argument('--seed', type=int, default=42)
+    cold_parser.add_argument('--out', help="JSON results file ('-' for stdout).")
+
+    login_parser = commands.add_parser('login', help='Concurrent login throughput and latency per hashing method.')
+    login_parser.add_argument('--methods', default=','.join(LOGIN_METHODS),
+                              help='Comma-separated PASSWORD_HASH_METHOD values.')
+    login_parser.add_argument('--size', default='1k', help='Fixture listing count.')
+    login_parser.add_argument('--concurrency', type=int, default=8, help='Threads logging in at once.')
+    login_parser.add_argument('--requests', type=int, default=200, help='Logins per method.')
+    login_parser.add_argument('--seed', type=int, default=42)
+    login_parser.add_argument('--out', help="JSON results file ('-' for stdout).")
+
+    serve_parser = commands.add_parser('serve', help='Concurrent clients against the sync and ASGI servers.')
+    serve_parser.add_argument('--modes', default=','.join(SERVE_MODES), help='Comma-separated: sync, asgi.')
+    serve_parser.add_argument('--size', default='1k', help='Fixture listing count.')
+    serve_parser.add_argument('--concurrency', default='10,100,1000', help='Comma-separated client counts.')
+    serve_parser.add_argument('--duration', type=float, default=10, help='Seconds per client count.')
+    serve_parser.add_argument('--seed', type=int, default=42)
+    serve_parser.add_argument('--cache', default='none', choices=['none', 'memory'],
+                              help='Response cache backend; off by default to measure the database path.')
+    serve_parser.add_argument('--out', help="JSON results file ('-' for stdout).")
+
+    contention_parser = commands.add_parser('contention', help='Reader latency while writers commit, per journal mode.')
+    contention_parser.add_argument('--variants', default=','.join(CONTENTION_VARIANTS),
+                                   help='Comma-separated: ' + ', '.join(CONTENTION_VARIANTS) + '.')
+    contention_parser.add_argument('--size', default='1k', help='Fixture listing count.')
+    contention_parser.add_argument('--readers', type=int, default=8)
+    contention_parser.add_argument('--writers', type=int, default=2)
+    contention_parser.add_argument('--importers', type=int, default=1, help='Bulk-import threads.')
+    contention_parser.add_argument('--duration', type=float, default=10, help='Seconds per variant.')
+    contention_parser.add_argument('--seed', type=int, default=42)
+    contention_parser.add_argument('--out', help="JSON results file ('-' for stdout).")
+
+    images_parser = commands.add_parser('images', help='Image upload and resizing throughput per worker count.')
+    images_parser.add_argument('--count', type=int, default=48, help='Photos per run.')
+    images_parser.add_argument('--workers', default=','.join(map(str, IMAGE_WORKER_COUNTS)),
+                               help='Comma-separated IMAGE_WORKERS values.')
+    images_parser.add_argument('--width', type=int, default=4000)
+    images_parser.add_argument('--height', type=int, default=3000)
+    images_parser.add_argument('--seed', type=int, default=42)
+    images_parser.add_argument('--out', help="JSON results file ('-' for stdout).")
+
+    compression_parser = commands.add_parser('compression', help='Response size and latency per Accept-Encoding.')
+    compression_parser.add_argument('--encodings', default=','.join(COMPRESSION_ENCODINGS),
+                                    help='Comma-separated: ' + ', '.join(COMPRESSION_ENCODINGS) + '.')
+    compression_parser.add_argument('--size', default='1k', help='Fixture listing count.')
+    compression_parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario.')
+    compression_parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per scenario.')
+    compression_parser.add_argument('--seed', type=int, default=42)
+    compression_parser.add_argument('--out', help="JSON results file ('-' for stdout).")
+
+    compare_parser = commands.add_parser('compare', help='Compare two result files; exit 1 on regressions.')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type=float, default=0.25, help='Allowed relative p95 increase.')
+
+    worker_parser = commands.add_parser('worker')
+    worker_parser.add_argument('database')
+    worker_parser.add_argument('out')
+    worker_parser.add_argument('--requests', type=int, default=200)
+    worker_parser.add_argument('--warmup', type=int, default=20)
+    worker_parser.add_argument('--seed', type=int, default=42)
+    worker_parser.add_argument('--only', action='append')
+
+    cold_worker_parser = commands.add_parser('coldstart-worker')
+    cold_worker_parser.add_argument('out')
+
+    login_worker_parser = commands.add_parser('login-worker')
+    login_worker_parser.add_argument('database')
+    login_worker_parser.add_argument('out')
+    login_worker_parser.add_argument('--concurrency', type=int, default=8)
+    login_worker_parser.add_argument('--requests', type=int, default=200)
+
+    serve_worker_parser = commands.add_parser('serve-worker')
+    serve_worker_parser.add_argument('mode', choices=SERVE_MODES)
+    serve_worker_parser.add_argument('port', type=int)
+
+    contention_worker_parser = commands.add_parser('contention-worker')
+    contention_worker_parser.add_argument('database')
+    contention_worker_parser.add_argument('out')
+    contention_worker_parser.add_argument('--readers', type=int, default=8)
+    contention_worker_parser.add_argument('--writers', type=int, default=2)
+    contention_worker_parser.add_argument('--importers', type=int, default=1)
+    contention_worker_parser.add_argument('--duration', type=float, default=10)
+
+    compression_worker_parser = commands.add_parser('compression-worker')
+    compression_worker_parser.add_argument('database')
+    compression_worker_parser.add_argument('out')
+    compression_worker_parser.add_argument('--encodings', default=','.join(COMPRESSION_ENCODINGS))
+    compression_worker_parser.add_argument('--requests', type=int, default=200)
+    compression_worker_parser.add_argument('--warmup', type=int, default=20)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+        report = run(sizes, requests=args.requests, warmup=args.warmup, seed=args.seed,
+                     cache=args.cache, only=args.only)
+        _write(report, args.out)
+    elif args.command == 'coldstart':
+        _write(cold_start(args.size, runs=args.runs, seed=args.seed), args.out)
+    elif args.command == 'coldstart-worker':
+        cold_start_worker(args.out)
+    elif args.command == 'login':
+        methods = [method.strip() for method in args.methods.split(',') if method.strip()]
+        report = login_load(methods, size=args.size, concurrency=args.concurrency,
+                            requests=args.requests, seed=args.seed)
+        _write(report, args.out)
+    elif args.command == 'login-worker':
+        login_worker(args.database, args.out, args.concurrency, args.requests)
+    elif args.command == 'serve':
+        modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+        clients = [int(count) for count in args.concurrency.split(',') if count.strip()]
+        report = serve_load(modes, size=args.size, concurrency=clients, duration=args.duration,
+                            seed=args.seed, cache=args.cache)
+        _write(report, args.out)
+    elif args.command == 'serve-worker':
+        serve_worker(args.mode, args.port)
+    elif args.command == 'contention':
+        variants = [variant.strip() for variant in args.variants.split(',') if variant.strip()]
+        report = contention(variants, size=args.size, readers=args.readers, writers=args.writers,
+                            importers=args.importers, duration=args.duration, seed=args.seed)
+        _write(report, args.out)
+    elif args.command == 'contention-worker':
+        contention_worker(args.database, args.out, args.readers, args.writers, args.importers, args.duration)
+    elif args.command == 'images':
+        workers = [int(count) for count in args.workers.split(',') if count.strip()]
+        report = image_load(args.count, workers, width=args.width, height=args.height, seed=args.seed)
+        _write(report, args.out)
+    elif args.command == 'compression':
+        encodings = [encoding.strip() for encoding in args.encodings.split(',') if encoding.strip()]
+        report = compression_load(encodings, size=args.size, requests=args.requests, warmup=args.warmup,
+                                  seed=args.seed)
+        _write(report, args.out)
+    elif args.command == 'compression-worker':
+        encodings = [encoding.strip() for encoding in args.encodings.split(',') if encoding.strip()]
+        compression_worker(args.database, args.out, encodings, args.requests, args.warmup)
+    elif args.command == 'worker':
+        results = run_worker(args.database, args.requests, args.warmup, args.seed, args.only)
+        with open(args.out, 'w') as f:
+            json.dump(results, f)
+    else:
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        rows, regressions = compare(before, after, args.threshold)
+        print(f"{'size':<6} {'scenario':<38} {'p95 before':>11} {'p95 after':>10} {'change':>8} {'queries':>11}")
+        for size, name, old_p95, new_p95, change, old_q, new_q, regressed in rows:
+            print(f"{size:<6} {name:<38} {old_p95:>9.2f}ms {new_p95:>8.2f}ms {change:>+7.0%} "
+                  f"{old_q:>5}->{new_q:<5}{'  REGRESSION' if regressed else ''}")
+        if regressions:
+            print(f'{len(regressions)} regression(s)')
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
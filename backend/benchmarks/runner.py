@@ -0,0 +1,797 @@
+import asyncio
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'fixtures')
+
+def parse_size(text):
+    # '1k' -> 1000, '1m' -> 1000000, '2500' -> 2500
+    text = text.strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+def _env(database):
+    return dict(os.environ, DATABASE_URL=f'sqlite:///{database}')
+
+def ensure_fixture(size, seed):
+    # Builds benchmarks/fixtures/listings-<size>-<seed>.db once with the
+    # synthetic data generator; later runs reuse it.
+    listings = parse_size(size)
+    path = os.path.join(FIXTURE_DIR, f'listings-{size}-{seed}.db')
+    if os.path.exists(path):
+        return path
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    partial = path + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    print(f'Building fixture {os.path.basename(path)} ...', file=sys.stderr)
+    subprocess.run(
+        [sys.executable, '-m', 'flask', '--app', 'app', 'seed',
+         '--users', str(max(50, listings // 50)), '--listings', str(listings), '--seed', str(seed)],
+        cwd=BACKEND_DIR, env=_env(partial), check=True, stdout=subprocess.DEVNULL,
+    )
+    os.replace(partial, path)
+    return path
+
+def percentile(ordered, p):
+    # Nearest-rank percentile of an ascending list
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def summarize(latencies, queries, statuses):
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    return {
+        'requests': len(ordered),
+        'throughput_rps': round(len(ordered) / total, 1) if total else None,
+        'mean_ms': round(total / len(ordered) * 1000, 3),
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+        'max_queries': max(queries),
+        'statuses': {str(code): statuses.count(code) for code in sorted(set(statuses))},
+    }
+
+def run_worker(database, requests, warmup, seed, only=None):
+    # Runs in its own process: the app binds its database at import time.
+    # Requests go sequentially through the WSGI test client, so latency is
+    # application and database time without network or server overhead.
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    from sqlalchemy import event
+
+    from app import app, engines, initialize_database
+    from benchmarks.scenarios import SCENARIOS, context
+
+    executed = [0]
+
+    def count(*args):
+        executed[0] += 1
+
+    initialize_database()  # migrates fixtures built by older revisions
+    client = app.test_client()
+    with app.app_context():
+        ctx = context()
+    for engine in (engines.engine, engines.read_engine):
+        if engine is not None:
+            event.listen(engine, 'before_cursor_execute', count)
+    token = client.post('/api/auth/login', json={'email': ctx['email'], 'password': ctx['password']}).json['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    results = {}
+    rng = random.Random(seed)
+    for name, method, make_request in SCENARIOS:
+        if only and not any(part in name for part in only):
+            continue
+        latencies, queries, statuses = [], [], []
+        for i in range(warmup + requests):
+            path, body = make_request(rng, ctx)
+            executed[0] = 0
+            started = time.perf_counter()
+            response = client.open(path, method=method, json=body, headers=headers)
+            elapsed = time.perf_counter() - started
+            if i >= warmup:
+                latencies.append(elapsed)
+                queries.append(executed[0])
+                statuses.append(response.status_code)
+        results[name] = summarize(latencies, queries, statuses)
+        print(f"  {name:<38} p50 {results[name]['p50_ms']:>9.2f} ms  p95 {results[name]['p95_ms']:>9.2f} ms  "
+              f"{results[name]['queries_per_request']:>5} queries", file=sys.stderr)
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes, requests=200, warmup=20, seed=42, cache='none', only=None):
+    # Benchmarks each fixture size in a fresh process on a scratch copy, so
+    # writes never touch the fixture and every size starts cold.
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'requests': requests,
+            'warmup': warmup,
+            'cache': cache,
+        },
+        'sizes': {},
+    }
+    for size in sizes:
+        fixture = ensure_fixture(size, seed)
+        with tempfile.TemporaryDirectory() as scratch:
+            database = os.path.join(scratch, 'bench.db')
+            shutil.copyfile(fixture, database)
+            out = os.path.join(scratch, 'results.json')
+            print(f'{size} listings', file=sys.stderr)
+            command = [sys.executable, '-m', 'benchmarks', 'worker', database, out,
+                       '--requests', str(requests), '--warmup', str(warmup), '--seed', str(seed)]
+            for part in only or []:
+                command += ['--only', part]
+            env = dict(os.environ, RESPONSE_CACHE_BACKEND=cache)
+            subprocess.run(command, cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+            with open(out) as f:
+                scenarios = json.load(f)
+        report['sizes'][size] = {'listings': parse_size(size), 'scenarios': scenarios}
+    return report
+
+COLD_START_PATH = '/api/listings'
+COLD_START_VARIANTS = {
+    'default': {},
+    'SOCKETIO_SERVER=0': {'SOCKETIO_SERVER': '0'},
+}
+
+def cold_start_worker(out):
+    # Runs as a fresh interpreter: times `import app` and the first request,
+    # which together are what a new serverless instance or worker pays.
+    started = time.perf_counter()
+    from app import app
+    imported = time.perf_counter()
+    response = app.test_client().get(COLD_START_PATH)
+    finished = time.perf_counter()
+    timing = re.search(r'desc="(\d+) queries"', response.headers.get('Server-Timing', ''))
+    with open(out, 'w') as f:
+        json.dump({
+            'import': imported - started,
+            'first_request': finished - imported,
+            'status': response.status_code,
+            'queries': int(timing.group(1)) if timing else 0,
+        }, f)
+
+def cold_start(size='1k', runs=20, seed=42):
+    # Starts `runs` fresh processes per variant against an initialized copy
+    # of the fixture and summarizes import, first request and their sum.
+    fixture = ensure_fixture(size, seed)
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'runs': runs,
+            'path': COLD_START_PATH,
+        },
+        'sizes': {},
+    }
+    scenarios = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        database = os.path.join(scratch, 'bench.db')
+        shutil.copyfile(fixture, database)
+        subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+            cwd=BACKEND_DIR, env=_env(database), check=True, stdout=subprocess.DEVNULL,
+        )
+        out = os.path.join(scratch, 'cold.json')
+        for variant, overrides in COLD_START_VARIANTS.items():
+            samples = []
+            for _ in range(runs):
+                subprocess.run(
+                    [sys.executable, '-m', 'benchmarks', 'coldstart-worker', out],
+                    cwd=BACKEND_DIR, env=dict(_env(database), **overrides), check=True,
+                    stdout=subprocess.DEVNULL,
+                )
+                with open(out) as f:
+                    samples.append(json.load(f))
+            statuses = [s['status'] for s in samples]
+            queries = [s['queries'] for s in samples]
+            for part, times in (
+                ('import', [s['import'] for s in samples]),
+                ('first request', [s['first_request'] for s in samples]),
+                ('import to first response', [s['import'] + s['first_request'] for s in samples]),
+            ):
+                name = f'{part} ({variant})'
+                scenarios[name] = summarize(times, queries if part != 'import' else [0] * runs, statuses)
+                print(f"  {name:<52} p50 {scenarios[name]['p50_ms']:>8.1f} ms  "
+                      f"p95 {scenarios[name]['p95_ms']:>8.1f} ms", file=sys.stderr)
+    report['sizes'][size] = {'listings': parse_size(size), 'scenarios': scenarios}
+    return report
+
+LOGIN_METHODS = ('scrypt:32768:8:1', 'scrypt:16384:8:1', 'pbkdf2:sha256:600000')
+
+def login_worker(database, out, concurrency=8, requests=200):
+    # Runs in its own process with PASSWORD_HASH_* set by login_load():
+    # `concurrency` threads log in as many different users while one more
+    # thread reads listing details, to show what hashing costs other requests.
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    import threading
+
+    from sqlalchemy import func, select
+
+    from app import app, initialize_database
+    from generator import PASSWORD
+    from models import db, Listing, User
+
+    initialize_database()  # migrates fixtures built by older revisions
+    with app.app_context():
+        emails = db.session.execute(select(User.email).order_by(User.id).limit(concurrency)).scalars().all()
+        max_listing_id = db.session.execute(select(func.max(Listing.id))).scalar()
+    # Fixtures store the password as plaintext or another method's hash;
+    # the first login rehashes it with the method under test
+    warm = app.test_client()
+    for email in emails:
+        warm.post('/api/auth/login', json={'email': email, 'password': PASSWORD})
+
+    logins, reads = [], []
+    remaining = [requests]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def log_in(email):
+        client = app.test_client()
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            response = client.post('/api/auth/login', json={'email': email, 'password': PASSWORD})
+            with lock:
+                logins.append((time.perf_counter() - started, response.status_code))
+
+    def read():
+        client = app.test_client()
+        rng = random.Random(0)
+        while not done.is_set():
+            started = time.perf_counter()
+            response = client.get(f'/api/listings/{rng.randint(1, max_listing_id)}')
+            reads.append((time.perf_counter() - started, response.status_code))
+
+    reader = threading.Thread(target=read)
+    threads = [threading.Thread(target=log_in, args=(emails[i % len(emails)],)) for i in range(concurrency)]
+    started = time.perf_counter()
+    reader.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    done.set()
+    reader.join()
+    with open(out, 'w') as f:
+        json.dump({'wall': wall, 'logins': logins, 'reads': reads}, f)
+
+def login_load(methods=LOGIN_METHODS, size='1k', concurrency=8, requests=200, seed=42):
+    # Login throughput and latency per hashing method, each in a fresh
+    # process on a scratch copy of the fixture, plus the first method with
+    # hashing on the request threads (PASSWORD_HASH_WORKERS=0) for contrast.
+    # The queue admits every thread, so logins measure waiting for a worker
+    # rather than 503s; statuses would show any that were turned away.
+    fixture = ensure_fixture(size, seed)
+    queue = {'PASSWORD_HASH_QUEUE': str(concurrency)}
+    variants = [(method, dict(queue, PASSWORD_HASH_METHOD=method)) for method in methods]
+    variants.append((f'{methods[0]}, request threads', dict(
+        queue, PASSWORD_HASH_METHOD=methods[0], PASSWORD_HASH_WORKERS='0'
+    )))
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': seed,
+            'requests': requests,
+            'concurrency': concurrency,
+        },
+        'sizes': {},
+    }
+    scenarios = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for variant, overrides in variants:
+            database = os.path.join(scratch, 'bench.db')
+            shutil.copyfile(fixture, database)
+            out = os.path.join(scratch, 'login.json')
+            subprocess.run(
+                [sys.executable, '-m', 'benchmarks', 'login-worker', database, out,
+                 '--concurrency', str(concurrency), '--requests', str(requests)],
+                cwd=BACKEND_DIR, env=dict(_env(database), SOCKETIO_SERVER='0', **overrides), check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            with open(out) as f:
+                result = json.load(f)
+            for name, samples in (
+                (f'POST /api/auth/login x{concurrency} ({variant})', result['logins']),
+                (f'GET /api/listings/<id> during logins ({variant})', result['reads']),
+            ):
+                latencies = [latency for latency, _ in samples]
+                summary = summarize(latencies, [0] * len(samples), [status for _, status in samples])
+                # Requests completed per second of wall time across all threads
+                summary['throughput_rps'] = round(len(samples) / result['wall'], 1)
+                scenarios[name] = summary
+                print(f"  {name:<64} {summary['throughput_rps']:>7.1f}/s  p50 {summary['p50_ms']:>8.1f} ms  "
+                      f"p99 {summary['p99_ms']:>8.1f} ms", file=sys.stderr)
+    report['sizes'][size] = {'listings': parse_size(size), 'scenarios': scenarios}
+    return report
+
+# Settings before engines.py (SQLite's defaults), WAL, and WAL with reads
+# on a read-only pool
+CONTENTION_VARIANTS = {
+    'rollback journal': {
+        'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_SYNCHRONOUS': 'full', 'SQLITE_CACHE_SIZE_KB': '2000',
+        'SQLITE_MMAP_SIZE_MB': '0',
+    },
+    'wal': {},
+    'wal + read-only pool': {'DATABASE_READ_URL': 'readonly'},
+}
+CONTENTION_READS = ('GET /api/listings (filters)', 'GET /api/listings/<id>', 'GET /api/search')
+CONTENTION_WRITES = ('POST /api/listings', 'POST /api/favorites/batch', 'POST /api/messages')
+IMPORT_BATCH = 1000
+
+def contention_worker(database, out, readers=8, writers=2, importers=1, duration=10):
+    # Runs in its own process with the SQLITE_* settings of one variant:
+    # `writers` threads create listings, favorites and messages and
+    # `importers` threads bulk-import batches of IMPORT_BATCH listings (one
+    # long write transaction each) while `readers` threads browse. Requests
+    # go through the WSGI test client.
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    import threading
+
+    from flask_jwt_extended import create_access_token
+
+    from app import app, engines, initialize_database
+    from importer import import_listings
+    from benchmarks.scenarios import SCENARIOS, _new_listing, context
+
+    initialize_database()
+    # Lock errors and slow commits are the expected outcome under the
+    # rollback journal; they are counted, not logged
+    logging.disable(logging.CRITICAL)
+    with app.app_context():
+        ctx = context()
+        headers = {'Authorization': f"Bearer {create_access_token(identity=ctx['user_id'])}"}
+    scenarios = {name: (method, make_request) for name, method, make_request in SCENARIOS}
+    samples = {'reads': [], 'writes': [], 'imports': []}
+    deadline = time.monotonic() + duration
+
+    def work(kind, names, seed):
+        client = app.test_client()
+        rng = random.Random(seed)
+        while time.monotonic() < deadline:
+            method, make_request = scenarios[rng.choice(names)]
+            path, body = make_request(rng, ctx)
+            started = time.perf_counter()
+            response = client.open(path, method=method, json=body, headers=headers)
+            samples[kind].append((time.perf_counter() - started, response.status_code))
+
+    def bulk_import(seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            while time.monotonic() < deadline:
+                rows = [(line_no, _new_listing(rng, ctx)) for line_no in range(1, IMPORT_BATCH + 1)]
+                started = time.perf_counter()
+                report = import_listings(rows, ctx['user_id'], batch_size=IMPORT_BATCH)
+                samples['imports'].append((time.perf_counter() - started, 500 if report.failed else 200))
+
+    threads = [threading.Thread(target=work, args=('reads', CONTENTION_READS, i)) for i in range(readers)]
+    threads += [threading.Thread(target=work, args=('writes', CONTENTION_WRITES, readers + i)) for i in range(writers)]
+    threads += [threading.Thread(target=bulk_import, args=(readers + writers + i,)) for i in range(importers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(out, 'w') as f:
+        json.dump(dict(samples, wall=time.perf_counter() - started, lock_errors=engines.lock_errors), f)
+
+def contention(variants=tuple(CONTENTION_VARIANTS), size='1k', readers=8, writers=2, importers=1, duration=10,
+               seed=42):
+    # Reader latency while writers commit, per journal mode, each variant in
+    # a fresh process on a scratch copy of the fixture. Under the rollback
+    # journal a writer locks readers out while it commits, or from the moment
+    # a large transaction spills pages to the file, so reads queue behind it
+    # or fail with "database is locked" (status 500); under WAL they read
+    # the last committed snapshot and do not wait.
+    fixture = ensure_fixture(size, seed)
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': seed,
+            'readers': readers,
+            'writers': writers,
+            'importers': importers,
+            'duration_s': duration,
+        },
+        'sizes': {},
+    }
+    scenarios = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for variant in variants:
+            database = os.path.join(scratch, 'bench.db')
+            shutil.copyfile(fixture, database)
+            out = os.path.join(scratch, 'contention.json')
+            subprocess.run(
+                [sys.executable, '-m', 'benchmarks', 'contention-worker', database, out, '--readers', str(readers),
+                 '--writers', str(writers), '--importers', str(importers), '--duration', str(duration)],
+                cwd=BACKEND_DIR, env=dict(_env(database), SOCKETIO_SERVER='0', RESPONSE_CACHE_BACKEND='none',
+                                          NOTIFY_BACKEND='local', **CONTENTION_VARIANTS[variant]),
+                check=True, stdout=subprocess.DEVNULL,
+            )
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(database + suffix):
+                    os.remove(database + suffix)
+            with open(out) as f:
+                result = json.load(f)
+            for name, samples in (
+                (f'reads x{readers} ({variant})', result['reads']),
+                (f'writes x{writers} ({variant})', result['writes']),
+                (f'imports of {IMPORT_BATCH} x{importers} ({variant})', result['imports']),
+            ):
+                if not samples:
+                    continue
+                latencies = [latency for latency, _ in samples]
+                statuses = [status for _, status in samples]
+                summary = summarize(latencies, [0] * len(samples), statuses)
+                summary['throughput_rps'] = round(len(samples) / result['wall'], 1)
+                scenarios[name] = summary
+                print(f"  {name:<36} {summary['throughput_rps']:>7.1f}/s  p50 {summary['p50_ms']:>8.1f} ms  "
+                      f"p99 {summary['p99_ms']:>8.1f} ms  max {summary['max_ms']:>8.1f} ms  "
+                      f"errors {len(statuses) - statuses.count(200)}", file=sys.stderr)
+            report['meta'].setdefault('lock_errors', {})[variant] = result['lock_errors']
+            print(f"  {variant}: {result['lock_errors']} 'database is locked' errors", file=sys.stderr)
+    report['sizes'][size] = {'listings': parse_size(size), 'scenarios': scenarios}
+    return report
+
+IMAGE_WORKER_COUNTS = (1, 2, 4)
+
+def _photo(seed, width, height):
+    # JPEG bytes of a synthetic photo: gradients under sensor-like noise, so
+    # file sizes and decode costs resemble camera images, not flat colour
+    from PIL import Image
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    channels = [
+        Image.blend(gradient.rotate(rng.choice((0, 90, 180, 270))).resize((width, height)),
+                    Image.effect_noise((width, height), rng.uniform(20, 60)), 0.3)
+        for _ in range(3)
+    ]
+    buffer = io.BytesIO()
+    Image.merge('RGB', channels).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+def image_load(count=48, workers=IMAGE_WORKER_COUNTS, width=4000, height=3000, seed=42):
+    # Upload-to-variants throughput of the image pipeline per worker count:
+    # `count` distinct photos are stored as fast as possible, then the run
+    # waits for all their variants. Store latency is what an upload request
+    # waits for; throughput counts images with every variant written.
+    from images import FORMATS, VARIANTS, ImagePipeline
+    photos = [_photo(seed + i, width, height) for i in range(count)]
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': seed,
+            'photo': f'{width}x{height} JPEG, {sum(map(len, photos)) / count / 1024:.0f} KB on average',
+        },
+        'sizes': {},
+    }
+    scenarios = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for worker_count in workers:
+            pipeline = ImagePipeline()
+            pipeline.root = os.path.join(scratch, f'workers-{worker_count}')
+            pipeline.workers = worker_count
+            pipeline.queue_size = count
+            latencies = []
+            started = time.perf_counter()
+            for data in photos:
+                stored = time.perf_counter()
+                upload = io.BytesIO(data)
+                pipeline.check(upload)
+                digest = pipeline.store(upload)
+                latencies.append(time.perf_counter() - stored)
+            pipeline.flush()
+            wall = time.perf_counter() - started
+            name = f'upload {width}x{height} x{count} ({worker_count} workers)'
+            summary = summarize(latencies, [0] * count, [200] * count)
+            # Images with all variants written per second of wall time
+            summary['throughput_rps'] = round(pipeline.processed / wall, 2)
+            summary['worker_s_per_image'] = round(pipeline.seconds / max(pipeline.processed, 1), 3)
+            scenarios[name] = summary
+            print(f"  {name:<44} {summary['throughput_rps']:>6.2f} images/s  "
+                  f"{summary['worker_s_per_image'] * 1000:>6.0f} ms per image  "
+                  f"store p99 {summary['p99_ms']:>6.1f} ms", file=sys.stderr)
+        directory = os.path.join(pipeline.root, digest[:2], digest)
+        report['meta']['variant_kb'] = {
+            f'{variant}.{ext}': round(os.path.getsize(os.path.join(directory, f'{variant}.{ext}')) / 1024, 1)
+            for variant in VARIANTS for ext in FORMATS
+        }
+    report['sizes'][f'{count}'] = {'listings': 0, 'scenarios': scenarios}
+    return report
+
+SERVE_MODES = ('sync', 'asgi')
+SERVE_PATHS = (
+    '/api/listings?page={page}',
+    '/api/listings?city={city}&per_page=20',
+    '/api/listings?cursor=&property_type=apartment',
+    '/api/search?q={term}',
+    '/api/search?city={city}&min_price=200000',
+)
+
+def serve_worker(mode, port):
+    # The server of one mode: sync is what `python app.py` runs (Werkzeug's
+    # threaded server via Flask-SocketIO) without the debugger, asgi is
+    # uvicorn serving asgi.py
+    if mode == 'asgi':
+        import uvicorn
+        uvicorn.run('asgi:app', host='127.0.0.1', port=port, log_level='warning', access_log=False)
+    else:
+        from app import app, init_socketio
+        init_socketio().run(app, host='127.0.0.1', port=port, allow_unsafe_werkzeug=True, log_output=False)
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+async def _read_response(reader):
+    # (status, keep_alive) after consuming one HTTP/1.1 response
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+async def _load(port, paths, concurrency, duration, timeout=30):
+    # `concurrency` keep-alive clients each sending its next request as soon
+    # as the previous answer arrives; failed or timed-out requests count as
+    # status 0 and the client reconnects
+    latencies, statuses = [], []
+    deadline = time.monotonic() + duration
+
+    async def client(rng):
+        reader = writer = None
+        while time.monotonic() < deadline:
+            path = rng.choice(paths)
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+                writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+                status, keep_alive = await asyncio.wait_for(_read_response(reader), timeout)
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                status, keep_alive = 0, False
+            latencies.append(time.perf_counter() - started)
+            statuses.append(status)
+            if not keep_alive and writer is not None:
+                writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(random.Random(i)) for i in range(concurrency)))
+    return latencies, statuses, time.monotonic() - started
+
+def _wait_for_server(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Server exited during startup')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not start')
+
+def serve_load(modes=SERVE_MODES, size='1k', concurrency=(10, 100, 1000), duration=10, seed=42, cache='none'):
+    # Throughput and latency of the read endpoints over real connections,
+    # per serving mode and number of concurrent clients. Each mode runs as
+    # a server process on a scratch copy of the fixture; the load generator
+    # is one asyncio process on the same host, so both compete for CPU.
+    fixture = ensure_fixture(size, seed)
+    rng = random.Random(seed)
+    from benchmarks.scenarios import CITIES, SEARCH_TERMS
+    paths = [
+        template.format(page=rng.randint(1, 20), city=quote(rng.choice(CITIES)), term=quote(rng.choice(SEARCH_TERMS)))
+        for template in SERVE_PATHS for _ in range(20)
+    ]
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': seed,
+            'duration_s': duration,
+            'cache': cache,
+        },
+        'sizes': {},
+    }
+    scenarios = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        database = os.path.join(scratch, 'bench.db')
+        shutil.copyfile(fixture, database)
+        subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+            cwd=BACKEND_DIR, env=_env(database), check=True, stdout=subprocess.DEVNULL,
+        )
+        for mode in modes:
+            port = _free_port()
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'benchmarks', 'serve-worker', mode, str(port)],
+                cwd=BACKEND_DIR, env=dict(_env(database), RESPONSE_CACHE_BACKEND=cache),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                _wait_for_server(port, process)
+                asyncio.run(_load(port, paths, 10, 2))  # warm up connections and caches
+                for clients in concurrency:
+                    latencies, statuses, wall = asyncio.run(_load(port, paths, clients, duration))
+                    name = f'GET listings+search x{clients} ({mode})'
+                    summary = summarize(latencies, [0] * len(latencies), statuses)
+                    # Requests completed per second of wall time across all clients
+                    summary['throughput_rps'] = round(statuses.count(200) / wall, 1)
+                    scenarios[name] = summary
+                    print(f"  {name:<40} {summary['throughput_rps']:>8.1f}/s  p50 {summary['p50_ms']:>8.1f} ms  "
+                          f"p99 {summary['p99_ms']:>8.1f} ms  errors {len(statuses) - statuses.count(200)}",
+                          file=sys.stderr)
+            finally:
+                process.terminate()
+                process.wait()
+    report['sizes'][size] = {'listings': parse_size(size), 'scenarios': scenarios}
+    return report
+
+COMPRESSION_ENCODINGS = ('identity', 'gzip', 'br')
+# /api/messages is never cached
+COMPRESSION_PATHS = ('/api/listings', '/api/listings?per_page=100', '/api/search?q=Balkon', '/api/messages')
+
+def compression_worker(database, out, encodings=COMPRESSION_ENCODINGS, requests=200, warmup=20):
+    # Runs in its own process with the memory response cache: each path is
+    # requested in each encoding, as a cache miss (the cache is cleared
+    # before every request, so the body is rendered and compressed) and as
+    # a hit (sent as stored). Records response bytes and the compression
+    # time on the request path; background precompression is not included.
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    os.environ['RESPONSE_CACHE_BACKEND'] = 'memory'
+    from app import app, compression, initialize_database, response_cache
+    from benchmarks.scenarios import context
+
+    initialize_database()  # migrates fixtures built by older revisions
+    client = app.test_client()
+    with app.app_context():
+        ctx = context()
+    token = client.post('/api/auth/login', json={'email': ctx['email'], 'password': ctx['password']}).json['token']
+    results = {}
+    for path in COMPRESSION_PATHS:
+        for encoding in encodings:
+            headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': encoding}
+            for mode in ('miss',) if path == '/api/messages' else ('miss', 'hit'):
+                response_cache.clear()
+                latencies, statuses = [], []
+                compress_seconds = compression.seconds
+                for i in range(warmup + requests):
+                    if mode == 'miss':
+                        response_cache.clear()
+                    started = time.perf_counter()
+                    response = client.get(path, headers=headers)
+                    elapsed = time.perf_counter() - started
+                    if i == warmup:
+                        compress_seconds = compression.seconds
+                    if i >= warmup:
+                        latencies.append(elapsed)
+                        statuses.append(response.status_code)
+                name = f'GET {path} {encoding} ({mode})'
+                summary = summarize(latencies, [0] * requests, statuses)
+                summary['bytes'] = len(response.get_data())
+                summary['compress_ms_per_request'] = round((compression.seconds - compress_seconds) / requests * 1000, 3)
+                results[name] = summary
+                print(f"  {name:<52} {summary['bytes']:>7} bytes  p50 {summary['p50_ms']:>7.2f} ms  "
+                      f"compressing {summary['compress_ms_per_request']:>6.3f} ms", file=sys.stderr)
+    with open(out, 'w') as f:
+        json.dump(results, f)
+
+def compression_load(encodings=COMPRESSION_ENCODINGS, size='1k', requests=200, warmup=20, seed=42):
+    # Response size and latency per Accept-Encoding through the WSGI test
+    # client, in a fresh process on a scratch copy of the fixture
+    fixture = ensure_fixture(size, seed)
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'requests': requests,
+            'warmup': warmup,
+            'cache': 'memory',
+        },
+        'sizes': {},
+    }
+    with tempfile.TemporaryDirectory() as scratch:
+        database = os.path.join(scratch, 'bench.db')
+        shutil.copyfile(fixture, database)
+        out = os.path.join(scratch, 'results.json')
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks', 'compression-worker', database, out,
+             '--encodings', ','.join(encodings), '--requests', str(requests), '--warmup', str(warmup)],
+            cwd=BACKEND_DIR, check=True, stdout=subprocess.DEVNULL,
+        )
+        with open(out) as f:
+            scenarios = json.load(f)
+    report['sizes'][size] = {'listings': parse_size(size), 'scenarios': scenarios}
+    return report
+
+def compare(before, after, threshold=0.25, floor_ms=1.0):
+    # Returns (rows, regressions). A scenario regresses when its p95 grows by
+    # more than `threshold` and `floor_ms`, or its worst request issues more
+    # queries (the mean moves with how many requests found no rows).
+    rows, regressions = [], []
+    for size, result in after['sizes'].items():
+        base = before['sizes'].get(size, {}).get('scenarios', {})
+        for name, new in result['scenarios'].items():
+            old = base.get(name)
+            if old is None:
+                continue
+            change = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0.0
+            slower = change > threshold and new['p95_ms'] - old['p95_ms'] > floor_ms
+            more_queries = new['max_queries'] > old['max_queries']
+            row = (size, name, old['p95_ms'], new['p95_ms'], change,
+                   old['queries_per_request'], new['queries_per_request'], slower or more_queries)
+            rows.append(row)
+            if row[-1]:
+                regressions.append(row)
+    return rows, regressions
@@ -0,0 +1,102 @@
+from sqlalchemy import func, select
+
+from generator import PASSWORD
+from models import db, User, Listing, Message, ConversationParticipant
+
+# One scenario per route and notable parameter mix. A scenario is
+# (name, method, make_request) where make_request(rng, ctx) returns
+# (path, json body or None). `ctx` holds ids picked from the fixture.
+
+CITIES = ['Berlin', 'Hamburg', 'München', 'Köln', 'Frankfurt', 'Leipzig']
+SEARCH_TERMS = ['Balkon', 'Altbauwohnung', 'Garten Familien', 'Villa', 'Penthouse München', 'Tiefgarage']
+FEATURE_CHOICES = ['Garten:Ja', 'Keller:Ja|Stellplatz:Garage', 'Einbauküche:Ja', 'Barrierefrei']
+
+def context():
+    # The benchmark user is the owner with the most listings, so it has
+    # listings to update and an inbox to read.
+    owner_id, _ = db.session.execute(
+        select(Listing.owner_id, func.count()).group_by(Listing.owner_id)
+        .order_by(func.count().desc()).limit(1)
+    ).one()
+    user = db.session.get(User, owner_id)
+    own_listings = db.session.execute(
+        select(Listing.id).filter_by(owner_id=owner_id).order_by(Listing.id).limit(1000)
+    ).scalars().all()
+    correspondent = db.session.execute(
+        select(Message.sender_id).filter_by(receiver_id=owner_id).limit(1)
+    ).scalar() or owner_id
+    conversations = db.session.execute(
+        select(ConversationParticipant.conversation_id).filter_by(user_id=owner_id).limit(1000)
+    ).scalars().all()
+    return {
+        'user_id': owner_id,
+        'conversations': conversations,
+        'email': user.email,
+        'password': PASSWORD,
+        'max_listing_id': db.session.execute(select(func.max(Listing.id))).scalar(),
+        'own_listings': own_listings,
+        'correspondent': correspondent,
+    }
+
+def _listing_id(rng, ctx):
+    return rng.randint(1, ctx['max_listing_id'])
+
+def _new_listing(rng, ctx):
+    city = rng.choice(CITIES)
+    return {
+        'title': f'Benchmark Wohnung in {city}',
+        'description': 'Helle Wohnung mit Balkon.',
+        'price': rng.randrange(150000, 900000, 1000),
+        'property_type': 'apartment',
+        'bedrooms': rng.randint(1, 4),
+        'bathrooms': 1,
+        'square_feet': rng.randint(40, 120),
+        'address': 'Hauptstraße 1',
+        'city': city,
+        'zip_code': '10115',
+        'latitude': 52.52,
+        'longitude': 13.405,
+        'images': ['https://images.pexels.com/photos/106399/pexels-photo-106399.jpeg'],
+    }
+
+SCENARIOS = [
+    ('GET /api/listings', 'GET', lambda rng, ctx: ('/api/listings', None)),
+    ('GET /api/listings?page=50', 'GET', lambda rng, ctx: ('/api/listings?page=50', None)),
+    ('GET /api/listings (filters)', 'GET', lambda rng, ctx: (
+        f'/api/listings?city={rng.choice(CITIES)}&property_type=apartment'
+        f'&min_price={rng.randrange(100000, 400000, 50000)}&max_price=900000&bedrooms=2', None)),
+    ('GET /api/listings (facets)', 'GET', lambda rng, ctx: (
+        f'/api/listings?cursor=&facets=1&city={rng.choice(CITIES)}&bedrooms={rng.randint(1, 4)}', None)),
+    ('GET /api/listings (features)', 'GET', lambda rng, ctx: (
+        '/api/listings?cursor=&feature=Balkon:Ja&feature=Aufzug:Ja&feature=' + rng.choice(FEATURE_CHOICES), None)),
+    ('GET /api/listings (cursor)', 'GET', lambda rng, ctx: ('/api/listings?cursor=', None)),
+    ('GET /api/listings (near)', 'GET', lambda rng, ctx: ('/api/listings?near=52.52,13.405&radius_km=2', None)),
+    ('GET /api/listings/<id>', 'GET', lambda rng, ctx: (f'/api/listings/{_listing_id(rng, ctx)}', None)),
+    ('GET /api/listings?ids= (50)', 'GET', lambda rng, ctx: (
+        '/api/listings?ids=' + ','.join(str(_listing_id(rng, ctx)) for _ in range(50)), None)),
+    ('GET /api/search', 'GET', lambda rng, ctx: (f'/api/search?q={rng.choice(SEARCH_TERMS)}', None)),
+    ('GET /api/search (filters)', 'GET', lambda rng, ctx: (
+        f'/api/search?q={rng.choice(SEARCH_TERMS)}&city={rng.choice(CITIES)}&max_price=800000', None)),
+    ('GET /api/search (facets)', 'GET', lambda rng, ctx: (
+        f'/api/search?q={rng.choice(SEARCH_TERMS)}&facets=1', None)),
+    ('GET /api/favorites', 'GET', lambda rng, ctx: ('/api/favorites', None)),
+    ('POST /api/favorites', 'POST', lambda rng, ctx: ('/api/favorites', {'listing_id': _listing_id(rng, ctx)})),
+    ('GET /api/favorites/check', 'GET', lambda rng, ctx: (
+        '/api/favorites/check?ids=' + ','.join(str(_listing_id(rng, ctx)) for _ in range(50)), None)),
+    ('POST /api/favorites/batch', 'POST', lambda rng, ctx: ('/api/favorites/batch', {
+        'add': [_listing_id(rng, ctx) for _ in range(10)], 'remove': [_listing_id(rng, ctx) for _ in range(10)]})),
+    ('GET /api/messages', 'GET', lambda rng, ctx: ('/api/messages', None)),
+    ('GET /api/conversations', 'GET', lambda rng, ctx: ('/api/conversations', None)),
+    ('GET /api/conversations/<id>/messages', 'GET', lambda rng, ctx: (
+        f"/api/conversations/{rng.choice(ctx['conversations'])}/messages", None)),
+    ('POST /api/conversations/<id>/read', 'POST', lambda rng, ctx: (
+        f"/api/conversations/{rng.choice(ctx['conversations'])}/read", None)),
+    ('POST /api/messages', 'POST', lambda rng, ctx: ('/api/messages', {
+        'receiver_id': ctx['correspondent'], 'subject': 'Benchmark', 'content': 'Ist die Wohnung noch frei?'})),
+    ('GET /api/user/profile', 'GET', lambda rng, ctx: ('/api/user/profile', None)),
+    ('POST /api/auth/login', 'POST', lambda rng, ctx: ('/api/auth/login', {
+        'email': ctx['email'], 'password': ctx['password']})),
+    ('POST /api/listings', 'POST', lambda rng, ctx: ('/api/listings', _new_listing(rng, ctx))),
+    ('PUT /api/listings/<id>', 'PUT', lambda rng, ctx: (
+        f"/api/listings/{rng.choice(ctx['own_listings'])}", {'price': rng.randrange(150000, 900000, 1000)})),
+]
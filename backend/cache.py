@@ -0,0 +1,464 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request
+from werkzeug.datastructures import MultiDict
+
+from matching import city_key, city_keys, listing_may_match
+
+# Response cache for the public listing endpoints. Entries hold the rendered
+# JSON body plus what invalidation needs to know about it: the listing and
+# owner ids it contains and, for list/search results, the filters that
+# produced it. A write to a listing drops exactly the entries that contain
+# the listing or whose filters it matched before or after the write.
+# Backends index entries by tags (the listings and owners they show, the
+# key of their city filter) so a write only evaluates the entries under the
+# tags it can affect rather than every entry.
+# With a compression.ResponseCompressor attached, entries also keep their
+# body compressed in each encoding, so hits are sent without compressing.
+
+def _collect_ids(payload):
+    # Listing and owner ids in a listing, list-of-listings or {'listings': [...]} payload;
+    # ids a multi-get reported missing count too, so creating them invalidates
+    if isinstance(payload, dict):
+        items = payload['listings'] if 'listings' in payload else [payload]
+    else:
+        items = payload
+    ids, owners = set(), set()
+    if isinstance(payload, dict):
+        ids.update(payload.get('missing', ()))
+    for item in items:
+        if isinstance(item, dict) and 'id' in item:
+            ids.add(item['id'])
+            if isinstance(item.get('owner'), dict):
+                owners.add(item['owner'].get('id'))
+    return ids, owners
+
+def _entry_tags(ids, owners, filters):
+    # `listing:<id>` and `owner:<id>` for what an entry shows; list/search
+    # results also get `city:<key>` for their city filter, or `filters`
+    tags = [f'listing:{listing_id}' for listing_id in ids] + [f'owner:{owner_id}' for owner_id in owners]
+    if filters is not None:
+        key = city_key(MultiDict(filters).get('city'))
+        tags.append(f'city:{key}' if key else 'filters')
+    return tags
+
+def _listing_tags(listing_id, snapshots):
+    # Tags of the entries a write to the listing with these snapshots may affect
+    tags = {f'listing:{listing_id}', 'filters'}
+    for snapshot in snapshots:
+        tags.update(f'city:{key}' for key in city_keys(snapshot['city']))
+    return tags
+
+class MemoryBackend:
+    # Per-process LRU with TTL; the default.
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}  # tag -> keys
+        self._lock = threading.Lock()
+
+    def _index(self, key, entry):
+        for tag in entry['tags']:
+            self._tags.setdefault(tag, set()).add(key)
+
+    def _pop(self, key):
+        entry = self._entries.pop(key)
+        for tag in entry['tags']:
+            keys = self._tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires'] <= time.time():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = entry
+            self._index(key, entry)
+            while len(self._entries) > self.max_entries:
+                self._pop(next(iter(self._entries)))
+
+    def invalidate(self, tags, predicate):
+        # Drops the entries under any of `tags` that satisfy `predicate`
+        with self._lock:
+            keys = set().union(*(self._tags.get(tag, ()) for tag in tags))
+            stale = [key for key in keys if predicate(self._entries[key])]
+            for key in stale:
+                self._pop(key)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+def _dump_entry(entry):
+    # JSON text of an entry: bytes as base64, id sets as lists
+    return json.dumps(dict(
+        entry,
+        body=base64.b64encode(entry['body']).decode(),
+        ids=list(entry['ids']),
+        owners=list(entry['owners']),
+        tags=list(entry['tags']),
+        encodings={name: base64.b64encode(data).decode() for name, data in entry.get('encodings', {}).items()},
+    ))
+
+def _load_entry(text):
+    entry = json.loads(text)
+    entry['body'] = base64.b64decode(entry['body'])
+    entry['ids'] = set(entry['ids'])
+    entry['owners'] = set(entry['owners'])
+    entry['tags'] = list(entry['tags'])
+    entry['encodings'] = {name: base64.b64decode(data) for name, data in entry['encodings'].items()}
+    return entry
+
+def _private_directory(directory):
+    # Creates `directory` for this user only, or checks that an existing one
+    # is this user's and not writable by others: anyone who can write
+    # entries there can change what the API answers
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        raise ValueError(f'RESPONSE_CACHE_DIR {directory} belongs to another user')
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise ValueError(f'RESPONSE_CACHE_DIR {directory} is writable by other users')
+
+class FileBackend:
+    # One file per entry in a directory shared by all workers on the host.
+    # Reads refresh the file's mtime, so eviction by oldest mtime is LRU.
+    # Entries are JSON, so a file that is not one is ignored rather than run.
+    # The tag index is a directory per tag holding an empty file named like
+    # each entry under it. Markers are written after the entry, so one whose
+    # entry is gone or no longer has the tag is stale and can be removed.
+    def __init__(self, directory, max_entries=1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        _private_directory(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.entry')
+
+    def _tag_directory(self, tag):
+        return os.path.join(self.directory, 'tags', hashlib.sha1(tag.encode()).hexdigest())
+
+    def _load(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return _load_entry(f.read())
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def _files(self):
+        try:
+            return [e for e in os.scandir(self.directory) if e.name.endswith('.entry')]
+        except OSError:
+            return []
+
+    def get(self, key):
+        path = self._path(key)
+        entry = self._load(path)
+        if entry is None or entry['key'] != key:
+            return None
+        if entry['expires'] <= time.time():
+            self._remove_entry(path, entry)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, entry):
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(_dump_entry(entry))
+        os.replace(tmp, path)
+        for tag in entry['tags']:
+            directory = self._tag_directory(tag)
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            open(os.path.join(directory, os.path.basename(path)), 'a').close()
+        files = self._files()
+        if len(files) > self.max_entries:
+            files.sort(key=lambda e: e.stat().st_mtime)
+            for stale in files[:len(files) - self.max_entries]:
+                self._remove_entry(stale.path)
+
+    def invalidate(self, tags, predicate):
+        # Drops the entries under any of `tags` that satisfy `predicate`
+        removed = 0
+        for tag in set(tags):
+            try:
+                markers = list(os.scandir(self._tag_directory(tag)))
+            except OSError:
+                continue
+            for marker in markers:
+                path = os.path.join(self.directory, marker.name)
+                entry = self._load(path)
+                if entry is None or tag not in entry['tags']:
+                    self._remove(marker.path)
+                elif predicate(entry):
+                    self._remove_entry(path, entry)
+                    removed += 1
+        return removed
+
+    def clear(self):
+        for file in self._files():
+            self._remove(file.path)
+        shutil.rmtree(os.path.join(self.directory, 'tags'), ignore_errors=True)
+
+    def _remove_entry(self, path, entry=None):
+        # The entry file and its tag markers
+        if entry is None:
+            entry = self._load(path)
+        self._remove(path)
+        if entry is not None:
+            for tag in entry['tags']:
+                self._remove(os.path.join(self._tag_directory(tag), os.path.basename(path)))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(self._files())
+
+class ResponseCache:
+    def __init__(self, backend=None, ttl=60):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.compressor = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        backend = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+        max_entries = app.config.get('RESPONSE_CACHE_SIZE', 1024)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', 60)
+        if backend == 'memory':
+            self.backend = MemoryBackend(max_entries)
+        elif backend == 'file':
+            directory = app.config.get('RESPONSE_CACHE_DIR') or os.path.join(
+                tempfile.gettempdir(), f"real-estate-cache-{os.getuid() if hasattr(os, 'getuid') else 0}"
+            )
+            self.backend = FileBackend(directory, max_entries)
+        elif backend == 'none':
+            self.backend = None
+        else:
+            raise ValueError(f'Unknown RESPONSE_CACHE_BACKEND: {backend}')
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def request_key(self, path, args, defaults=None):
+        # (key, params) for a GET of `path` with MultiDict `args`
+        defaults = defaults or {}
+        params = sorted((k, v) for k, v in args.items(multi=True) if defaults.get(k) != v)
+        return path + '?' + urlencode(params), params
+
+    def lookup(self, key):
+        # The cached entry for `key` or None; counts the hit or miss. Pair a
+        # miss with generation() before rendering and store() after.
+        entry = self.backend.get(key)
+        self._count('hits' if entry is not None else 'misses')
+        return entry
+
+    def generation(self):
+        return self._generation
+
+    def encode(self, body, accept_encoding, entry=None):
+        # (body, Content-Encoding or None) to send `body` in to a client
+        # sending `accept_encoding`, taken from `entry`'s compressed bodies
+        # when it has the encoding
+        encoding = self.compressor.negotiate(accept_encoding, len(body)) if self.compressor else None
+        if encoding is None:
+            return body, None
+        encoded = entry.get('encodings', {}).get(encoding) if entry is not None else None
+        if encoded is None:
+            encoded = self.compressor.compress(body, encoding)
+        return encoded, encoding
+
+    def store(self, key, body, mimetype, params, generation, status_filter=None, detail=False, encodings=None):
+        # Skips storing if a write in this process invalidated the cache
+        # since `generation` was read; the body may predate it. `encodings`
+        # maps encodings to `body` already compressed in them; the compressor
+        # adds the others in the background.
+        if generation != self._generation:
+            return
+        ids, owners = _collect_ids(json.loads(body))
+        filters = None if detail else params
+        encodings = dict(encodings or {})
+        self.backend.set(key, {
+            'key': key,
+            'body': body,
+            'status': 200,
+            'mimetype': mimetype,
+            'expires': time.time() + self.ttl,
+            'ids': ids,
+            'owners': owners,
+            'filters': filters,
+            'status_filter': status_filter,
+            'encodings': encodings,
+            'tags': _entry_tags(ids, owners, filters),
+        })
+        if self.compressor is not None:
+            self.compressor.precompress(
+                body, encodings, lambda encoded: self._add_encodings(key, body, encoded, generation)
+            )
+
+    def _add_encodings(self, key, body, encodings, generation):
+        # From a compression worker; an entry invalidated or replaced since
+        # is left alone
+        if generation != self._generation:
+            return
+        entry = self.backend.get(key)
+        if entry is None or entry['body'] != body:
+            return
+        entry['encodings'] = dict(entry.get('encodings', {}), **encodings)
+        self.backend.set(key, entry)
+
+    def cached(self, status=None, defaults=None):
+        # Caches a GET view's 200 responses under its path and normalized
+        # query string. `status` pins the status filter for endpoints that do
+        # not read it from the request; `defaults` lists parameter values
+        # equivalent to leaving the parameter out.
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+
+                key, params = self.request_key(request.path, request.args, defaults)
+                entry = self.lookup(key)
+                accept_encoding = request.headers.get('Accept-Encoding')
+                if entry is not None:
+                    body, encoding = self.encode(entry['body'], accept_encoding, entry)
+                    response = current_app.response_class(body, status=entry['status'], mimetype=entry['mimetype'])
+                    if encoding is not None:
+                        response.headers['Content-Encoding'] = encoding
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                generation = self.generation()
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and response.mimetype == 'application/json':
+                    body = response.get_data()
+                    encoded, encoding = self.encode(body, accept_encoding)
+                    # Detail views (view_args set) depend only on their ids
+                    self.store(key, body, response.mimetype, params, generation, status_filter=status,
+                               detail=bool(kwargs), encodings={encoding: encoded} if encoding else None)
+                    if encoding is not None:
+                        response.set_data(encoded)
+                        response.headers['Content-Encoding'] = encoding
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate_listing(self, listing_id, before=None, after=None):
+        # `before`/`after` are matching.listing_snapshot() dicts of the listing
+        # around the write; `before` is None for a new listing.
+        if self.backend is None:
+            return 0
+        snapshots = [snapshot for snapshot in (before, after) if snapshot is not None]
+
+        def affected(entry):
+            if listing_id in entry['ids']:
+                return True
+            if entry['filters'] is None:
+                return False
+            args = MultiDict(entry['filters'])
+            return any(listing_may_match(args, snapshot, entry['status_filter']) for snapshot in snapshots)
+
+        return self._invalidate(_listing_tags(listing_id, snapshots), affected)
+
+    def invalidate_listings(self, listing_ids):
+        # Drops entries showing any of the listings, for writes that change
+        # what a listing displays but not which filters it matches
+        if self.backend is None:
+            return 0
+        listing_ids = set(listing_ids)
+        return self._invalidate(
+            {f'listing:{listing_id}' for listing_id in listing_ids},
+            lambda entry: not listing_ids.isdisjoint(entry['ids'])
+        )
+
+    def invalidate_owner(self, user_id):
+        if self.backend is None:
+            return 0
+        return self._invalidate({f'owner:{user_id}'}, lambda entry: user_id in entry['owners'])
+
+    def _invalidate(self, tags, predicate):
+        with self._lock:
+            self._generation += 1
+        removed = self.backend.invalidate(tags, predicate)
+        with self._lock:
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+        if self.backend is not None:
+            self.backend.clear()
+
+    def metrics(self):
+        # Prometheus exposition lines for instrumentation.Instrumentation
+        stats = self.stats()
+        return [
+            '# HELP response_cache_hits_total Response cache hits.',
+            '# TYPE response_cache_hits_total counter',
+            f"response_cache_hits_total {stats['hits']}",
+            '# HELP response_cache_misses_total Response cache misses.',
+            '# TYPE response_cache_misses_total counter',
+            f"response_cache_misses_total {stats['misses']}",
+            '# HELP response_cache_invalidations_total Entries dropped by writes.',
+            '# TYPE response_cache_invalidations_total counter',
+            f"response_cache_invalidations_total {stats['invalidations']}",
+            '# HELP response_cache_entries Entries currently cached.',
+            '# TYPE response_cache_entries gauge',
+            f"response_cache_entries {stats['entries']}",
+        ]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__ if self.backend else None,
+                'entries': len(self.backend) if self.backend else 0,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'invalidations': self.invalidations,
+            }
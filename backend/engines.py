@@ -0,0 +1,168 @@
+import atexit
+import logging
+from urllib.parse import quote
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+# Database engine settings. Every SQLite connection gets the SQLITE_*
+# pragmas: WAL lets readers run alongside a writer instead of waiting for
+# (or failing with "database is locked" on) its commit, synchronous=NORMAL
+# syncs the WAL at checkpoints rather than on every commit (a power loss may
+# drop the last commits but does not corrupt the file), busy_timeout queues
+# writers for the write lock, and cache_size / mmap_size keep hot pages in
+# memory. Pool sizes come from DB_POOL_*; server databases also get
+# pre-ping and connection recycling.
+#
+# With DATABASE_READ_URL set, statements of GET and HEAD requests run on a
+# second engine: a replica URL, or `readonly` for a pool of read-only
+# connections to the primary SQLite file. A request that writes (a flush or
+# an INSERT/UPDATE/DELETE) uses the primary from then on. A replica may lag,
+# so a GET right after a write can miss it; the read-only pool cannot.
+
+logger = logging.getLogger('real_estate.engines')
+
+JOURNAL_MODES = ('wal', 'delete', 'truncate', 'persist', 'memory', 'off')
+SYNCHRONOUS_MODES = ('off', 'normal', 'full', 'extra')
+READ_METHODS = ('GET', 'HEAD')
+LOCKED = 'database is locked'
+
+def _is_sqlite_file(url):
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def engine_options(config):
+    # SQLALCHEMY_ENGINE_OPTIONS for the database URL in `config`
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite' and not _is_sqlite_file(url):
+        # In-memory databases live in one connection (SingletonThreadPool)
+        return {}
+    options = {
+        'pool_size': config.get('DB_POOL_SIZE', 10),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+    }
+    if url.get_backend_name() != 'sqlite':
+        options.update(pool_recycle=config.get('DB_POOL_RECYCLE', 1800), pool_pre_ping=True)
+    return options
+
+def sqlite_pragmas(config, read_only=False):
+    # PRAGMA statements run on each new SQLite connection
+    journal_mode = config.get('SQLITE_JOURNAL_MODE', 'wal').lower()
+    synchronous = config.get('SQLITE_SYNCHRONOUS', 'normal').lower()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f'Unknown SQLITE_JOURNAL_MODE: {journal_mode}')
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f'Unknown SQLITE_SYNCHRONOUS: {synchronous}')
+    pragmas = [
+        f"PRAGMA busy_timeout={config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)}",
+        f"PRAGMA cache_size=-{config.get('SQLITE_CACHE_SIZE_KB', 16384)}",
+        f"PRAGMA mmap_size={config.get('SQLITE_MMAP_SIZE_MB', 256) * 1024 * 1024}",
+    ]
+    if not read_only:
+        # The journal mode is stored in the file; read-only connections
+        # cannot change it and follow whatever the writers set
+        pragmas[:0] = [f'PRAGMA journal_mode={journal_mode}', f'PRAGMA synchronous={synchronous}']
+    return pragmas
+
+class RoutingSession(Session):
+    # Flask-SQLAlchemy's session; sends the reads of GET and HEAD requests
+    # to the read engine when one is configured. A flush asks for a mapper's
+    # bind without a statement; every ORM read passes its SELECT as `clause`.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self.info.get('wrote') and has_request_context():
+            engines = current_app.extensions.get('engines')
+            if engines is not None and engines.read_engine is not None:
+                flush = clause is None and mapper is not None
+                if flush or (clause is not None and not getattr(clause, 'is_select', False)):
+                    self.info['wrote'] = True
+                elif request.method in READ_METHODS:
+                    return engines.read_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+class Engines:
+    def __init__(self):
+        self.config = {}
+        self.engine = None
+        self.read_engine = None
+        self.lock_errors = 0
+        self._warned = False
+
+    def init_app(self, app, db):
+        # After db.init_app(app), whose engine options come from engine_options()
+        self.config = app.config
+        with app.app_context():
+            self.engine = db.engine
+        self.configure_engine(self.engine)
+        read_url = app.config.get('DATABASE_READ_URL')
+        if read_url:
+            self.read_engine = self._create_read_engine(read_url)
+        app.extensions['engines'] = self
+        # Closing the pooled connections at exit checkpoints the WAL into the
+        # database file, so a copied file (fixtures, backups) is complete
+        atexit.register(self.dispose)
+
+    def _create_read_engine(self, read_url):
+        read_only = read_url == 'readonly'
+        if read_only:
+            url = self.engine.url
+            if not _is_sqlite_file(url):
+                raise ValueError('DATABASE_READ_URL=readonly needs a SQLite database file')
+            read_url = f'sqlite:///file:{quote(url.database)}?mode=ro&uri=true'
+        engine = create_engine(read_url, **engine_options(dict(self.config, SQLALCHEMY_DATABASE_URI=read_url)))
+        self.configure_engine(engine, read_only=read_only)
+        return engine
+
+    def configure_engine(self, engine, read_only=False):
+        # Pragmas and lock accounting for `engine`; the async engine of
+        # asgi.py passes its sync_engine
+        event.listen(engine, 'handle_error', self._handle_error)
+        if not _is_sqlite_file(engine.url):
+            return
+        pragmas = sqlite_pragmas(self.config, read_only)
+
+        @event.listens_for(engine, 'connect')
+        def connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                # Not execute().fetchone(): the async drivers' adapted
+                # cursors do not return themselves from execute()
+                cursor.execute(pragma)
+                result = cursor.fetchone()
+                if pragma.startswith('PRAGMA journal_mode='):
+                    self._check_journal_mode(result[0], pragma.split('=')[1])
+            cursor.close()
+
+    def _check_journal_mode(self, actual, requested):
+        # WAL needs shared memory, which network filesystems may lack
+        if actual != requested and not self._warned:
+            self._warned = True
+            logger.warning('SQLite journal mode is %s, not %s', actual, requested)
+
+    def _handle_error(self, context):
+        if LOCKED in str(context.original_exception):
+            self.lock_errors += 1
+
+    def dispose(self):
+        for engine in (self.engine, self.read_engine):
+            if engine is not None:
+                engine.dispose()
+
+    def metrics(self):
+        # Prometheus exposition lines for instrumentation.Instrumentation
+        pools = [
+            (role, engine.pool) for role, engine in (('primary', self.engine), ('read', self.read_engine))
+            if engine is not None and hasattr(engine.pool, 'checkedout')
+        ]
+        return [
+            '# HELP db_pool_checked_out Connections in use.',
+            '# TYPE db_pool_checked_out gauge',
+            *(f'db_pool_checked_out{{engine="{role}"}} {pool.checkedout()}' for role, pool in pools),
+            '# HELP db_pool_idle Pooled connections waiting to be used.',
+            '# TYPE db_pool_idle gauge',
+            *(f'db_pool_idle{{engine="{role}"}} {pool.checkedin()}' for role, pool in pools),
+            '# HELP db_lock_errors_total Statements that failed with "database is locked".',
+            '# TYPE db_lock_errors_total counter',
+            f'db_lock_errors_total {self.lock_errors}',
+        ]
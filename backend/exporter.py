@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, User, Listing
+
+# Streaming export of the whole catalogue. Rows are fetched with yield_per, so
+# the ORM holds one batch at a time, and each batch costs a fixed number of
+# queries (listings with owners joined, then images and features selectin).
+# Output is produced row by row, so memory stays flat however many listings
+# are exported. `images` is a URL list with the primary image first and
+# `features` a list of {name, value}, so an NDJSON export can be fed back
+# into the bulk importer.
+
+BATCH_SIZE = 1000
+
+CSV_COLUMNS = [
+    'id', 'owner_id', 'owner_name', 'owner_email', 'owner_phone', 'title', 'description',
+    'price', 'property_type', 'bedrooms', 'bathrooms', 'square_feet', 'address', 'city',
+    'state', 'zip_code', 'latitude', 'longitude', 'status', 'created_at', 'updated_at',
+    'images', 'features',
+]
+
+def export_query(updated_since=None, status=None):
+    stmt = select(Listing).options(
+        joinedload(Listing.owner).load_only(User.name, User.email, User.phone),
+        selectinload(Listing.images),
+        selectinload(Listing.features),
+    )
+    if status:
+        stmt = stmt.filter(Listing.status == status)
+    if updated_since:
+        # Ordered by change time so an incremental job can resume from the
+        # last updated_at it saw
+        stmt = stmt.filter(Listing.updated_at >= updated_since).order_by(Listing.updated_at, Listing.id)
+    else:
+        stmt = stmt.order_by(Listing.id)
+    return stmt.execution_options(yield_per=BATCH_SIZE)
+
+def _record(listing):
+    images = sorted(listing.images, key=lambda img: (not img.is_primary, img.id))
+    owner = listing.owner
+    return {
+        'id': listing.id,
+        'owner': {
+            'id': owner.id,
+            'name': owner.name,
+            'email': owner.email,
+            'phone': owner.phone
+        } if owner else None,
+        'title': listing.title,
+        'description': listing.description,
+        'price': listing.price,
+        'property_type': listing.property_type,
+        'bedrooms': listing.bedrooms,
+        'bathrooms': listing.bathrooms,
+        'square_feet': listing.square_feet,
+        'address': listing.address,
+        'city': listing.city,
+        'state': listing.state,
+        'zip_code': listing.zip_code,
+        'latitude': listing.latitude,
+        'longitude': listing.longitude,
+        'status': listing.status,
+        'created_at': listing.created_at.isoformat() if listing.created_at else None,
+        'updated_at': listing.updated_at.isoformat() if listing.updated_at else None,
+        'images': [img.image_url for img in images],
+        'features': [{'name': f.feature_name, 'value': f.feature_value} for f in listing.features],
+    }
+
+def _listings(updated_since=None, status=None):
+    for listing in db.session.execute(export_query(updated_since, status)).scalars():
+        yield _record(listing)
+
+def iter_ndjson(updated_since=None, status=None):
+    for record in _listings(updated_since, status):
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+def iter_csv(updated_since=None, status=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    for record in _listings(updated_since, status):
+        owner = record.pop('owner') or {}
+        record.update(
+            owner_id=owner.get('id'), owner_name=owner.get('name'),
+            owner_email=owner.get('email'), owner_phone=owner.get('phone'),
+            images='|'.join(record['images']),
+            features='|'.join(f"{f['name']}:{f['value'] or ''}" for f in record['features']),
+        )
+        writer.writerow(['' if record[c] is None else record[c] for c in CSV_COLUMNS])
+        yield flush()
+
+def iter_export(fmt, updated_since=None, status=None):
+    return (iter_csv if fmt == 'csv' else iter_ndjson)(updated_since, status)
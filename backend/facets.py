@@ -0,0 +1,200 @@
+from sqlalchemy import column, func, literal_column, select, table, text
+
+from models import db, Listing
+
+# Facet counts for the listing filters: listings per property type, per city,
+# per bedroom count (5 meaning 5 or more) and per price bucket, for whatever
+# filtered set a query selects. All four come from one GROUP BY over the
+# combination of the four keys, folded into separate facets in Python.
+#
+# On SQLite the combinations are also kept pre-counted in `listing_facet`,
+# maintained by triggers on `listing` like the full-text and spatial indexes.
+# Requests filtering only by status, property type, city and up to 5
+# bedrooms -- the unfiltered first page and the usual sidebar clicks -- are
+# answered from those few thousand rows instead of the listing table.
+
+FACET_TABLE = 'listing_facet'
+# Lower edges of the price histogram buckets; the last one is open-ended
+PRICE_BUCKETS = (0, 100000, 200000, 300000, 400000, 500000, 750000, 1000000, 1500000, 2000000, 3000000)
+MAX_BEDROOMS_BUCKET = 5
+CITY_LIMIT = 20
+AGGREGATE_FILTERS = {'status', 'property_type', 'city', 'bedrooms'}
+# Request arguments that page or shape the response rather than filter
+NON_FILTER_ARGS = {'page', 'per_page', 'cursor', 'include_total', 'facets'}
+
+_facet = table(
+    FACET_TABLE, column('status'), column('property_type'), column('city'),
+    column('bedrooms_bucket'), column('price_bucket'), column('listings')
+)
+_ready = {}
+
+def _bedrooms_bucket(prefix):
+    # -1 for unknown, so `bedrooms >= n` stays `bedrooms_bucket >= n`
+    bedrooms = f'{prefix}.bedrooms'
+    return (
+        f'CASE WHEN {bedrooms} IS NULL THEN -1 '
+        f'WHEN {bedrooms} >= {MAX_BEDROOMS_BUCKET} THEN {MAX_BEDROOMS_BUCKET} ELSE {bedrooms} END'
+    )
+
+def _price_bucket(prefix):
+    price = f'{prefix}.price'
+    cases = ' '.join(
+        f'WHEN {price} < {edge} THEN {i}' for i, edge in enumerate(PRICE_BUCKETS[1:])
+    )
+    return f'CASE {cases} ELSE {len(PRICE_BUCKETS) - 1} END'
+
+def _key(prefix):
+    return (
+        f"COALESCE({prefix}.status, ''), COALESCE({prefix}.property_type, ''), "
+        f"COALESCE({prefix}.city, ''), {_bedrooms_bucket(prefix)}, {_price_bucket(prefix)}"
+    )
+
+def _ddl():
+    key_columns = 'status, property_type, city, bedrooms_bucket, price_bucket'
+    add = (
+        f"""INSERT INTO {FACET_TABLE} ({key_columns}, listings) VALUES ({_key('new')}, 1)
+            ON CONFLICT ({key_columns}) DO UPDATE SET listings = listings + 1;"""
+    )
+    remove = (
+        f"""UPDATE {FACET_TABLE} SET listings = listings - 1
+            WHERE ({key_columns}) = ({_key('old')});"""
+    )
+    return [
+        f"""CREATE TABLE IF NOT EXISTS {FACET_TABLE} (
+            status VARCHAR(20) NOT NULL,
+            property_type VARCHAR(50) NOT NULL,
+            city VARCHAR(100) NOT NULL,
+            bedrooms_bucket INTEGER NOT NULL,
+            price_bucket INTEGER NOT NULL,
+            listings INTEGER NOT NULL,
+            PRIMARY KEY ({key_columns})
+        ) WITHOUT ROWID""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FACET_TABLE}_ai AFTER INSERT ON listing BEGIN
+            {add}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FACET_TABLE}_ad AFTER DELETE ON listing BEGIN
+            {remove}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FACET_TABLE}_au
+        AFTER UPDATE OF status, property_type, city, bedrooms, price ON listing BEGIN
+            {remove}
+            {add}
+        END""",
+    ]
+
+def _populate(conn):
+    conn.execute(text(f"DELETE FROM {FACET_TABLE}"))
+    conn.execute(text(
+        f"""INSERT INTO {FACET_TABLE}
+        SELECT {_key('listing')}, COUNT(*) FROM listing GROUP BY 1, 2, 3, 4, 5"""
+    ))
+
+def _table_exists(conn, name):
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': name}
+    ).first() is not None
+
+def create_facet_index():
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        existed = _table_exists(conn, FACET_TABLE)
+        for statement in _ddl():
+            conn.execute(text(statement))
+        if not existed:
+            _populate(conn)
+    _ready[engine.url] = True
+    return True
+
+def rebuild_facet_index():
+    if not create_facet_index():
+        return False
+    with db.engine.begin() as conn:
+        _populate(conn)
+    return True
+
+def facet_index_ready():
+    engine = db.engine
+    if engine.url not in _ready:
+        ready = False
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as conn:
+                ready = _table_exists(conn, FACET_TABLE)
+        _ready[engine.url] = ready
+    return _ready[engine.url]
+
+def _fold(rows):
+    # (property_type, city, bedrooms_bucket, price_bucket, count) rows -> facets
+    types, cities, bedrooms, prices = {}, {}, {}, {}
+    for property_type, city, bedrooms_bucket, price_bucket, count in rows:
+        if not count:
+            continue
+        property_type, city = property_type or None, city or None
+        types[property_type] = types.get(property_type, 0) + count
+        cities[city] = cities.get(city, 0) + count
+        if bedrooms_bucket is not None and bedrooms_bucket >= 0:
+            bedrooms[bedrooms_bucket] = bedrooms.get(bedrooms_bucket, 0) + count
+        prices[price_bucket] = prices.get(price_bucket, 0) + count
+
+    def by_count(counts, limit=None):
+        ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0] is None, item[0] or ''))
+        return [{'value': value, 'count': count} for value, count in ordered[:limit]]
+
+    return {
+        'property_type': by_count(types),
+        'city': by_count(cities, CITY_LIMIT),
+        'bedrooms': [{
+            'min': bucket,
+            'max': bucket if bucket < MAX_BEDROOMS_BUCKET else None,
+            'count': bedrooms[bucket]
+        } for bucket in sorted(bedrooms)],
+        'price': [{
+            'min': PRICE_BUCKETS[bucket],
+            'max': PRICE_BUCKETS[bucket + 1] if bucket + 1 < len(PRICE_BUCKETS) else None,
+            'count': prices[bucket]
+        } for bucket in sorted(prices)],
+    }
+
+def _aggregate_rows(args, status):
+    stmt = select(
+        _facet.c.property_type, _facet.c.city, _facet.c.bedrooms_bucket, _facet.c.price_bucket,
+        _facet.c.listings
+    ).where(_facet.c.status == status, _facet.c.listings > 0)
+    if args.get('property_type'):
+        stmt = stmt.where(_facet.c.property_type == args['property_type'])
+    if args.get('city'):
+        # Same expression the endpoints apply to listing.city, which is
+        # stored as '' here when NULL
+        stmt = stmt.where(_facet.c.city != '', _facet.c.city.ilike(f"%{args['city']}%"))
+    bedrooms = args.get('bedrooms', type=int)
+    if bedrooms:
+        stmt = stmt.where(_facet.c.bedrooms_bucket >= bedrooms)
+    return db.session.execute(stmt).all()
+
+def _aggregate_covers(args):
+    for name, value in args.items():
+        if not value or name in NON_FILTER_ARGS:
+            continue
+        if name not in AGGREGATE_FILTERS:
+            return False
+        if name == 'bedrooms':
+            try:
+                if int(value) > MAX_BEDROOMS_BUCKET:
+                    return False
+            except ValueError:
+                return False
+    return True
+
+def facet_counts(stmt, args, status='active'):
+    # Facets of the listings `stmt` selects. `args` are the request arguments
+    # that built it; when they only use filters the pre-counted table can
+    # apply, it answers instead of `stmt`.
+    if facet_index_ready() and _aggregate_covers(args):
+        return _fold(_aggregate_rows(args, status))
+    keys = (
+        Listing.property_type, Listing.city,
+        literal_column(_bedrooms_bucket('listing')), literal_column(_price_bucket('listing'))
+    )
+    grouped = stmt.with_only_columns(*keys, func.count()).group_by(*keys).order_by(None)
+    return _fold(db.session.execute(grouped).all())
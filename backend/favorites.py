@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from sqlalchemy import delete, literal, select, text, update
+
+from models import db, dialect_insert, Favorite, Listing
+
+# Favorites are unique per (user, listing). Adds are upserts that skip pairs
+# already present and removes delete exactly the pairs present, both
+# returning the listing ids they changed, so concurrent requests can neither
+# duplicate a favorite nor miscount. listing.favorite_count moves by those
+# ids inside the caller's transaction; bulk loaders that insert favorites
+# directly call sync_favorite_counts() afterwards.
+
+MAX_BATCH = 100
+
+def _adjust_counts(listing_ids, delta):
+    # Keeps updated_at, whose onupdate would otherwise fire: a favorite is no
+    # edit of the listing and must not put it into incremental exports
+    if listing_ids:
+        db.session.execute(
+            update(Listing).where(Listing.id.in_(listing_ids))
+            .values(favorite_count=Listing.favorite_count + delta, updated_at=Listing.updated_at),
+            execution_options={'synchronize_session': False}
+        )
+
+def add_favorites(user_id, listing_ids):
+    # Favorites every existing listing in `listing_ids` not yet favorited by
+    # the user; returns the ids added. The caller commits.
+    if not listing_ids:
+        return []
+    insert = dialect_insert(db.session.get_bind().dialect.name)
+    source = select(literal(user_id), Listing.id, literal(datetime.utcnow())).where(
+        Listing.id.in_(listing_ids)
+    )
+    stmt = insert(Favorite).from_select(
+        ['user_id', 'listing_id', 'created_at'], source
+    ).on_conflict_do_nothing(index_elements=['user_id', 'listing_id']).returning(Favorite.listing_id)
+    added = sorted(db.session.execute(stmt).scalars())
+    _adjust_counts(added, 1)
+    return added
+
+def remove_favorites(user_id, listing_ids):
+    # Returns the ids that were favorited and no longer are; the caller commits
+    if not listing_ids:
+        return []
+    removed = sorted(db.session.execute(
+        delete(Favorite)
+        .where(Favorite.user_id == user_id, Favorite.listing_id.in_(listing_ids))
+        .returning(Favorite.listing_id),
+        execution_options={'synchronize_session': False}
+    ).scalars())
+    _adjust_counts(removed, -1)
+    return removed
+
+def favorited_ids(user_id, listing_ids):
+    # The subset of `listing_ids` the user has favorited, from the unique index
+    if not listing_ids:
+        return []
+    return sorted(db.session.execute(
+        select(Favorite.listing_id).where(Favorite.user_id == user_id, Favorite.listing_id.in_(listing_ids))
+    ).scalars())
+
+def sync_favorite_counts(conn):
+    # Recomputes every listing's favorite_count; for migrations and bulk loads
+    conn.execute(text(
+        """UPDATE listing SET favorite_count = (
+            SELECT COUNT(*) FROM favorite WHERE favorite.listing_id = listing.id
+        )"""
+    ))
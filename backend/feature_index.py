@@ -0,0 +1,51 @@
+from sqlalchemy import and_, intersect, or_, select
+
+from models import PropertyFeature, Listing
+
+# Filtering listings by PropertyFeature attributes. Every (name, value) pair
+# is a sorted run of listing ids in the covering index
+# ix_property_feature_name_value (feature_name, feature_value, listing_id),
+# kept current by every write to property_feature. A filter becomes set
+# algebra over those runs: `feature=Balkon:Ja&feature=Aufzug:Ja` is the
+# INTERSECT of two runs, `feature=Heizung:Gas|Heizung:Fernwärme` one scan
+# over both runs (an indexed OR, since SQLite cannot nest compound SELECTs),
+# and `feature=Garten` (no value) the whole name prefix. The listing table
+# is only consulted for the ids that survive.
+
+MAX_FEATURE_FILTERS = 10
+MAX_ALTERNATIVES = 10
+
+def parse_feature_args(args):
+    # [[(name, value or None), ...], ...]: the outer list is ANDed, each inner
+    # list ORed. Raises ValueError for malformed filters.
+    groups = []
+    for raw in args.getlist('feature'):
+        alternatives = []
+        for part in raw.split('|'):
+            name, _, value = part.partition(':')
+            name, value = name.strip(), value.strip()
+            if not name:
+                raise ValueError('feature must look like "Name:Value", alternatives separated by "|"')
+            alternatives.append((name, value or None))
+        if len(alternatives) > MAX_ALTERNATIVES:
+            raise ValueError(f'At most {MAX_ALTERNATIVES} alternatives per feature filter')
+        groups.append(alternatives)
+    if len(groups) > MAX_FEATURE_FILTERS:
+        raise ValueError(f'At most {MAX_FEATURE_FILTERS} feature filters')
+    return groups
+
+def _pair(name, value):
+    if value is None:
+        return PropertyFeature.feature_name == name
+    return and_(PropertyFeature.feature_name == name, PropertyFeature.feature_value == value)
+
+def feature_ids(groups):
+    # Listing ids satisfying every group, as one compound SELECT
+    sets = [
+        select(PropertyFeature.listing_id).where(or_(*[_pair(name, value) for name, value in alternatives]))
+        for alternatives in groups
+    ]
+    return intersect(*sets) if len(sets) > 1 else sets[0]
+
+def apply_feature_filter(stmt, groups):
+    return stmt.filter(Listing.id.in_(feature_ids(groups)))
@@ -0,0 +1,335 @@
+import math
+import random
+from array import array
+from itertools import accumulate
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from messaging import sync_conversations
+from favorites import sync_favorite_counts
+from passwords import DEFAULT_METHOD, hash_password
+from models import db, User, Listing, ListingImage, Favorite, Message, PropertyFeature
+
+# Synthetic data for load tests: N users with listings, images, features,
+# favorites and messages spread over the German cities of the sample data.
+# Everything is drawn from one random.Random(seed), and timestamps count back
+# from a fixed date, so the same arguments always produce the same rows.
+# Rows go in through Core multi-row INSERTs, BATCH_SIZE listings per
+# transaction, with ids assigned up front; only one array of listing owners
+# is kept in memory, so a million listings take minutes and little RAM.
+
+BATCH_SIZE = 5000
+EPOCH = datetime(2024, 1, 1)
+HISTORY_DAYS = 730
+# Every generated user logs in with this password
+PASSWORD = 'password123'
+
+# (city, state, zip prefix, latitude, longitude, population in thousands, EUR per m²)
+GERMAN_CITIES = [
+    ('Berlin', 'Berlin', '10', 52.5200, 13.4050, 3645, 5200),
+    ('Hamburg', 'Hamburg', '20', 53.5511, 9.9937, 1841, 5900),
+    ('München', 'Bayern', '80', 48.1351, 11.5820, 1472, 9000),
+    ('Köln', 'Nordrhein-Westfalen', '50', 50.9375, 6.9603, 1086, 4700),
+    ('Frankfurt', 'Hessen', '60', 50.1109, 8.6821, 753, 6200),
+    ('Stuttgart', 'Baden-Württemberg', '70', 48.7758, 9.1829, 635, 5300),
+    ('Düsseldorf', 'Nordrhein-Westfalen', '40', 51.2277, 6.7735, 619, 5000),
+    ('Leipzig', 'Sachsen', '04', 51.3397, 12.3731, 597, 2900),
+    ('Dresden', 'Sachsen', '01', 51.0504, 13.7373, 556, 3000),
+    ('Hannover', 'Niedersachsen', '30', 52.3759, 9.7320, 536, 3400),
+]
+
+FIRST_NAMES = [
+    'Max', 'Sabine', 'Thomas', 'Julia', 'David', 'Anna', 'Lukas', 'Laura', 'Felix',
+    'Sophie', 'Jonas', 'Marie', 'Leon', 'Lena', 'Paul', 'Katharina', 'Elias', 'Hannah',
+    'Finn', 'Emma', 'Moritz', 'Lea', 'Niklas', 'Clara', 'Tobias', 'Mia', 'Jan', 'Nina',
+]
+LAST_NAMES = [
+    'Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker',
+    'Schulz', 'Hoffmann', 'Schäfer', 'Koch', 'Bauer', 'Richter', 'Klein', 'Wolf',
+    'Schröder', 'Neumann', 'Schwarz', 'Zimmermann', 'Braun', 'Krüger', 'Hofmann', 'Hartmann',
+]
+STREETS = [
+    'Hauptstraße', 'Schulstraße', 'Gartenstraße', 'Bahnhofstraße', 'Dorfstraße',
+    'Bergstraße', 'Birkenweg', 'Lindenstraße', 'Kirchstraße', 'Waldstraße', 'Ringstraße',
+    'Schillerstraße', 'Goethestraße', 'Mühlenweg', 'Parkstraße', 'Rosenweg', 'Feldstraße',
+    'Am Markt', 'Friedrichstraße', 'Kastanienallee',
+]
+
+USER_TYPES = (('buyer', 70), ('seller', 22), ('agent', 8))
+# Agents list many properties, private sellers a few
+OWNER_WEIGHTS = {'seller': 1, 'agent': 15}
+STATUSES = (('active', 80), ('pending', 8), ('sold', 12))
+
+# type: (share, title words, bedroom range, m² range)
+PROPERTY_TYPES = {
+    'apartment': (55, ['Wohnung', 'Altbauwohnung', 'Loftwohnung', 'Dachgeschosswohnung'], (1, 4), (35, 140)),
+    'house': (25, ['Einfamilienhaus', 'Reihenhaus', 'Stadthaus', 'Doppelhaushälfte', 'Villa'], (3, 7), (90, 320)),
+    'condo': (15, ['Eigentumswohnung', 'Penthouse', 'Maisonette'], (1, 5), (45, 220)),
+    'land': (5, ['Baugrundstück', 'Grundstück'], (0, 0), (300, 2000)),
+}
+ADJECTIVES = [
+    'Moderne', 'Helle', 'Sanierte', 'Gemütliche', 'Charmante', 'Großzügige', 'Ruhige',
+    'Exklusive', 'Zentrale', 'Renovierte', 'Neuwertige', 'Familienfreundliche',
+]
+DESCRIPTION_PARTS = [
+    'Lichtdurchflutete Räume mit hochwertiger Ausstattung.',
+    'Ruhige Lage mit guter Anbindung an den öffentlichen Nahverkehr.',
+    'Schulen, Kitas und Einkaufsmöglichkeiten sind fußläufig erreichbar.',
+    'Der Balkon bietet einen weiten Blick über die Stadt.',
+    'Perfekt für Familien oder Paare.',
+    'Die Küche wurde kürzlich modernisiert.',
+    'Parkett in allen Wohnräumen, Fliesen in Bad und Küche.',
+    'Ein großer Garten lädt zum Verweilen ein.',
+    'Energieeffizient dank neuer Fenster und Wärmepumpe.',
+    'Provisionsfrei direkt vom Eigentümer.',
+    'Stellplatz in der Tiefgarage kann dazu erworben werden.',
+    'Bezugsfrei ab sofort.',
+]
+
+IMAGE_URLS = [
+    f'https://images.pexels.com/photos/{photo}/pexels-photo-{photo}.jpeg?auto=compress&w=800'
+    for photo in (
+        106399, 259588, 534151, 1396122, 210617, 323780, 259962, 259600, 259701, 259624,
+        259580, 259597, 259618, 280222, 1571460, 1643383, 2102587, 1029599, 1732414, 164558,
+    )
+]
+FEATURE_POOL = [
+    ('Balkon', ['Ja', 'Nein']),
+    ('Garten', ['Ja', 'Nein']),
+    ('Keller', ['Ja', 'Nein']),
+    ('Baujahr', ['1975', '1990', '2005', '2015', '2020']),
+    ('Heizung', ['Gas', 'Fernwärme', 'Öl', 'Wärmepumpe', 'Elektro']),
+    ('Energieausweis', ['Vorhanden', 'Nicht vorhanden']),
+    ('Stellplatz', ['Garage', 'Tiefgarage', 'Außenstellplatz', 'Kein Stellplatz']),
+    ('Aufzug', ['Ja', 'Nein']),
+    ('Barrierefrei', ['Ja', 'Nein']),
+    ('Einbauküche', ['Ja', 'Nein']),
+    ('Internet', ['Glasfaser', 'DSL', 'Kabel', 'Kein Internet']),
+    ('Bodenbelag', ['Parkett', 'Fliesen', 'Teppich', 'Laminat']),
+    ('Möbliert', ['Ja', 'Nein']),
+    ('Haustiere erlaubt', ['Ja', 'Nein']),
+]
+QUESTIONS = [
+    ('Besichtigungstermin', 'Hallo, ich interessiere mich für Ihr Angebot. Wann wäre eine Besichtigung möglich?'),
+    ('Frage zur Immobilie', 'Guten Tag, ist die Immobilie noch verfügbar?'),
+    ('Nebenkosten', 'Hallo, wie hoch sind die monatlichen Nebenkosten?'),
+    ('Stellplatz', 'Guten Tag, gehört ein Stellplatz zur Immobilie?'),
+    ('Haustiere', 'Hallo, sind Haustiere erlaubt?'),
+]
+ANSWERS = [
+    'Vielen Dank für Ihre Anfrage. Gerne können wir einen Termin vereinbaren.',
+    'Ja, das Angebot ist noch verfügbar.',
+    'Die Details sende ich Ihnen gerne per E-Mail zu.',
+    'Leider ist die Immobilie bereits reserviert.',
+]
+
+def _weighted(pairs):
+    values, weights = zip(*pairs)
+    return list(values), list(weights)
+
+def _next_id(conn, model):
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+def _timestamp(rng, not_before=None):
+    # Recent listings are more common than old ones
+    moment = EPOCH - timedelta(days=HISTORY_DAYS * rng.random() ** 1.5, seconds=rng.randrange(86400))
+    if not_before is not None and moment < not_before:
+        moment = not_before + timedelta(minutes=rng.randrange(1, 60 * 24 * 14))
+    return moment
+
+class Generator:
+    def __init__(self, seed=42, password_hash=None):
+        self.rng = random.Random(seed)
+        self.password_hash = password_hash or hash_password(PASSWORD)
+        self.cities, self.city_weights = _weighted((city, city[5]) for city in GERMAN_CITIES)
+        self.types, self.type_weights = _weighted((name, spec[0]) for name, spec in PROPERTY_TYPES.items())
+        self.statuses, self.status_weights = _weighted(STATUSES)
+        self.user_types, self.user_type_weights = _weighted(USER_TYPES)
+
+    def user(self, user_id):
+        rng = self.rng
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        return {
+            'id': user_id,
+            'name': f'{first} {last}',
+            'email': f'{first.lower()}.{user_id}@loadtest.example',
+            'password': self.password_hash,
+            'phone': f'+49-{rng.randrange(30, 999)}-{rng.randrange(100000, 9999999)}',
+            'user_type': rng.choices(self.user_types, self.user_type_weights)[0],
+            'created_at': _timestamp(rng),
+        }
+
+    def listing(self, listing_id, owner_id):
+        rng = self.rng
+        city, state, zip_prefix, lat, lon, _, price_per_sqm = rng.choices(self.cities, self.city_weights)[0]
+        property_type = rng.choices(self.types, self.type_weights)[0]
+        _, words, (min_bedrooms, max_bedrooms), (min_size, max_size) = PROPERTY_TYPES[property_type]
+        size = round(min_size + (max_size - min_size) * rng.betavariate(2, 4))
+        bedrooms = None if property_type == 'land' else min(max_bedrooms, max(min_bedrooms, round(size / 30)))
+        # Land sells for a fraction of the per-m² price; log-normal spread around the city average
+        base = price_per_sqm * (0.15 if property_type == 'land' else 1)
+        price = round(size * base * rng.lognormvariate(0, 0.25), -3)
+        street = rng.choice(STREETS)
+        created_at = _timestamp(rng)
+        updated_at = created_at if rng.random() < 0.7 else _timestamp(rng, not_before=created_at)
+        return {
+            'id': listing_id,
+            'owner_id': owner_id,
+            'title': f'{rng.choice(ADJECTIVES)} {rng.choice(words)} in {city}',
+            'description': ' '.join(rng.sample(DESCRIPTION_PARTS, rng.randint(2, 5))),
+            'price': price,
+            'property_type': property_type,
+            'bedrooms': bedrooms,
+            'bathrooms': None if bedrooms is None else max(1, bedrooms // 2),
+            'square_feet': size,
+            'address': f'{street} {rng.randint(1, 180)}',
+            'city': city,
+            'state': state,
+            'zip_code': f'{zip_prefix}{rng.randrange(1000):03d}',
+            # Roughly within 10 km of the centre, denser towards it
+            'latitude': round(lat + rng.gauss(0, 0.04), 6),
+            'longitude': round(lon + rng.gauss(0, 0.06), 6),
+            'status': rng.choices(self.statuses, self.status_weights)[0],
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
+
+    def images(self, listing):
+        urls = self.rng.sample(IMAGE_URLS, self.rng.randint(1, 6))
+        return [
+            {'listing_id': listing['id'], 'image_url': url, 'is_primary': i == 0,
+             'created_at': listing['created_at']}
+            for i, url in enumerate(urls)
+        ]
+
+    def features(self, listing):
+        return [
+            {'listing_id': listing['id'], 'feature_name': name, 'feature_value': self.rng.choice(values)}
+            for name, values in self.rng.sample(FEATURE_POOL, self.rng.randint(3, 8))
+        ]
+
+    def geometric(self, mean):
+        if mean <= 0:
+            return 0
+        return int(math.log(1 - self.rng.random()) / math.log(mean / (mean + 1)))
+
+    def popular_listing(self, first_id, count):
+        # Popularity is heavily skewed: a few listings draw most of the interest
+        return first_id + min(count - 1, int(count * self.rng.random() ** 3))
+
+def _insert(model, rows):
+    if rows:
+        db.session.connection().execute(insert(model.__table__), rows)
+
+def generate(users=1000, listings=10000, favorites_per_user=3, messages=None,
+             seed=42, batch_size=BATCH_SIZE, progress=None, password_method=DEFAULT_METHOD):
+    # Appends the generated rows to the database; returns the row counts.
+    # `messages` defaults to one inquiry per two listings, about half of
+    # them answered. `progress(table, done, total)` is called per batch.
+    # PASSWORD is hashed once with `password_method` and the hash shared by
+    # every user; its random salt is the only thing that differs between runs.
+    gen = Generator(seed, hash_password(PASSWORD, password_method))
+    rng = gen.rng
+    messages = listings // 2 if messages is None else messages
+    conn = db.session.connection()
+    first_user = _next_id(conn, User)
+    first_listing = _next_id(conn, Listing)
+    counts = {'users': 0, 'listings': 0, 'images': 0, 'features': 0, 'favorites': 0, 'messages': 0}
+
+    buyers, owners, owner_weights = [], [], []
+    for start in range(0, users, batch_size):
+        rows = [gen.user(first_user + n) for n in range(start, min(users, start + batch_size))]
+        for row in rows:
+            if row['user_type'] in OWNER_WEIGHTS:
+                owners.append(row['id'])
+                owner_weights.append(OWNER_WEIGHTS[row['user_type']])
+            else:
+                buyers.append(row['id'])
+        _insert(User, rows)
+        db.session.commit()
+        counts['users'] += len(rows)
+        if progress:
+            progress('users', counts['users'], users)
+    if listings and not owners:
+        raise ValueError('at least one seller or agent is needed to own listings; generate more users')
+    buyers = buyers or owners
+
+    # Owner per listing, for the messages below
+    listing_owner = array('l')
+    cumulative = list(accumulate(owner_weights))
+    for start in range(0, listings, batch_size):
+        rows, images, features = [], [], []
+        for n in range(start, min(listings, start + batch_size)):
+            owner_id = rng.choices(owners, cum_weights=cumulative)[0]
+            listing = gen.listing(first_listing + n, owner_id)
+            listing_owner.append(owner_id)
+            rows.append(listing)
+            images += gen.images(listing)
+            features += gen.features(listing)
+        _insert(Listing, rows)
+        _insert(ListingImage, images)
+        _insert(PropertyFeature, features)
+        db.session.commit()
+        counts['listings'] += len(rows)
+        counts['images'] += len(images)
+        counts['features'] += len(features)
+        if progress:
+            progress('listings', counts['listings'], listings)
+
+    if listings:
+        # Favorites per buyer are geometric around the mean, unique per listing
+        rows = []
+        for user_id in buyers:
+            wanted = gen.geometric(favorites_per_user)
+            chosen = {gen.popular_listing(first_listing, listings) for _ in range(wanted)}
+            rows += [
+                {'user_id': user_id, 'listing_id': listing_id, 'created_at': _timestamp(rng)}
+                for listing_id in sorted(chosen)
+            ]
+            if len(rows) >= batch_size:
+                _insert(Favorite, rows)
+                db.session.commit()
+                counts['favorites'] += len(rows)
+                rows = []
+        _insert(Favorite, rows)
+        sync_favorite_counts(db.session.connection())
+        db.session.commit()
+        counts['favorites'] += len(rows)
+        if progress:
+            progress('favorites', counts['favorites'], counts['favorites'])
+
+        # Inquiries from buyers to listing owners, some with a reply
+        rows = []
+        while counts['messages'] + len(rows) < messages:
+            listing_id = gen.popular_listing(first_listing, listings)
+            owner_id = listing_owner[listing_id - first_listing]
+            sender_id = rng.choice(buyers)
+            subject, content = rng.choice(QUESTIONS)
+            sent_at = _timestamp(rng)
+            rows.append({
+                'sender_id': sender_id, 'receiver_id': owner_id, 'listing_id': listing_id,
+                'subject': subject, 'content': content, 'is_read': rng.random() < 0.6,
+                'created_at': sent_at,
+            })
+            if rng.random() < 0.5 and counts['messages'] + len(rows) < messages:
+                rows.append({
+                    'sender_id': owner_id, 'receiver_id': sender_id, 'listing_id': listing_id,
+                    'subject': f'Re: {subject}', 'content': rng.choice(ANSWERS), 'is_read': rng.random() < 0.5,
+                    'created_at': sent_at + timedelta(minutes=rng.randrange(5, 60 * 48)),
+                })
+            if len(rows) >= batch_size:
+                _insert(Message, rows)
+                db.session.commit()
+                counts['messages'] += len(rows)
+                rows = []
+                if progress and counts['messages'] < messages:
+                    progress('messages', counts['messages'], messages)
+        _insert(Message, rows)
+        counts['messages'] += len(rows)
+        # Conversations and unread counters for the new messages
+        sync_conversations(db.session.connection())
+        db.session.commit()
+        if progress:
+            progress('messages', counts['messages'], messages)
+    return counts
@@ -0,0 +1,175 @@
+import math
+import sqlite3
+
+from sqlalchemy import column, select, table, text
+
+from models import db, Listing
+
+# Spatial index behind the `near`/`bbox` filters. On SQLite this is an R*Tree
+# holding one point-sized box per geocoded listing, maintained by triggers
+# like the full-text index in search_index.py. A radius query first asks the
+# R*Tree for the candidates inside the circle's bounding box and only ranks
+# those; other databases filter the latitude/longitude columns directly.
+# A bbox filter keeps the newest-first order of the listing pages, so it
+# checks the pages' rows against the R*Tree; a radius query is sorted by
+# distance anyway, so it reads the candidates from the R*Tree first and
+# looks the listings up by id.
+
+GEO_TABLE = 'listing_geo'
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+DEFAULT_RADIUS_KM = 10.0
+MAX_RADIUS_KM = 500.0
+
+_geo = table(GEO_TABLE, column('id'), column('min_lat'), column('max_lat'), column('min_lon'), column('max_lon'))
+_ready = {}
+# Without the hint SQLite flattens the candidates into the join and walks
+# every active listing instead (SQLite 3.35+)
+_MATERIALIZED = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+def _ddl():
+    point = 'new.id, new.latitude, new.latitude, new.longitude, new.longitude'
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {GEO_TABLE} USING rtree(
+            id, min_lat, max_lat, min_lon, max_lon
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {GEO_TABLE}_ai AFTER INSERT ON listing
+        WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+            INSERT INTO {GEO_TABLE} VALUES ({point});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {GEO_TABLE}_ad AFTER DELETE ON listing BEGIN
+            DELETE FROM {GEO_TABLE} WHERE id = old.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {GEO_TABLE}_au AFTER UPDATE OF latitude, longitude ON listing BEGIN
+            DELETE FROM {GEO_TABLE} WHERE id = old.id;
+            INSERT INTO {GEO_TABLE} SELECT {point}
+            WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+        END""",
+    ]
+
+def _populate(conn):
+    conn.execute(text(f"DELETE FROM {GEO_TABLE}"))
+    conn.execute(text(
+        f"""INSERT INTO {GEO_TABLE}
+        SELECT id, latitude, latitude, longitude, longitude FROM listing
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL"""
+    ))
+
+def _table_exists(conn, name):
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': name}
+    ).first() is not None
+
+def create_geo_index():
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        existed = _table_exists(conn, GEO_TABLE)
+        for statement in _ddl():
+            conn.execute(text(statement))
+        if not existed:
+            _populate(conn)
+    _ready[engine.url] = True
+    return True
+
+def rebuild_geo_index():
+    if not create_geo_index():
+        return False
+    with db.engine.begin() as conn:
+        _populate(conn)
+    return True
+
+def geo_index_ready():
+    engine = db.engine
+    if engine.url not in _ready:
+        ready = False
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as conn:
+                ready = _table_exists(conn, GEO_TABLE)
+        _ready[engine.url] = ready
+    return _ready[engine.url]
+
+def _floats(value, count, name):
+    try:
+        numbers = [float(part) for part in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or not all(math.isfinite(n) for n in numbers):
+        raise ValueError(f'{name} must be {count} comma-separated numbers')
+    return numbers
+
+def parse_geo_args(args):
+    # Returns {'near': (lat, lon), 'radius_km': r} and/or {'bbox': (s, w, n, e)},
+    # or None when the request has no location filter.
+    geo = {}
+    if args.get('near'):
+        lat, lon = _floats(args['near'], 2, 'near')
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError('near is out of range')
+        radius_km = args.get('radius_km', DEFAULT_RADIUS_KM, type=float)
+        if radius_km is None or not (0 < radius_km <= MAX_RADIUS_KM):
+            raise ValueError(f'radius_km must be between 0 and {MAX_RADIUS_KM:g}')
+        geo['near'] = (lat, lon)
+        geo['radius_km'] = radius_km
+    if args.get('bbox'):
+        south, west, north, east = _floats(args['bbox'], 4, 'bbox (south,west,north,east)')
+        if south > north or west > east:
+            raise ValueError('bbox must be ordered south,west,north,east')
+        geo['bbox'] = (south, west, north, east)
+    return geo or None
+
+def _radius_box(lat, lon, radius_km):
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+def _within(stmt, box, indexed, drive=False):
+    # `drive` reads the candidates from the R*Tree before the listing table
+    south, west, north, east = box
+    if indexed:
+        # R*Tree coordinates are 32-bit floats rounded outwards, so the exact
+        # column check below still decides the edge cases.
+        candidates = select(_geo.c.id).where(
+            _geo.c.max_lat >= south, _geo.c.min_lat <= north,
+            _geo.c.max_lon >= west, _geo.c.min_lon <= east
+        )
+        if drive:
+            candidates = candidates.cte()
+            if _MATERIALIZED:
+                candidates = candidates.prefix_with('MATERIALIZED')
+            stmt = stmt.join(candidates, candidates.c.id == Listing.id)
+        else:
+            stmt = stmt.filter(Listing.id.in_(candidates))
+    return stmt.filter(
+        Listing.latitude.between(south, north),
+        Listing.longitude.between(west, east)
+    )
+
+def apply_geo_filter(stmt, geo, indexed=None):
+    # `indexed` defaults to whether the database has the spatial index
+    if indexed is None:
+        indexed = geo_index_ready()
+    if 'bbox' in geo:
+        stmt = _within(stmt, geo['bbox'], indexed)
+    if 'near' in geo:
+        lat, lon = geo['near']
+        radius_km = geo['radius_km']
+        stmt = _within(stmt, _radius_box(lat, lon, radius_km), indexed, drive=True)
+        # Equirectangular distance in km^2: plain arithmetic SQLite can
+        # evaluate, and accurate to well under 1% at these radii. It is only
+        # computed for the candidates the bounding box let through.
+        lon_scale = math.cos(math.radians(lat))
+        dy = (Listing.latitude - lat) * KM_PER_DEGREE
+        dx = (Listing.longitude - lon) * (KM_PER_DEGREE * lon_scale)
+        distance_sq = dy * dy + dx * dx
+        stmt = stmt.filter(distance_sq <= radius_km * radius_km).order_by(distance_sq)
+    return stmt
+
+def distance_km(geo, listing):
+    if not geo or 'near' not in geo or listing.latitude is None or listing.longitude is None:
+        return None
+    lat1, lon1 = map(math.radians, geo['near'])
+    lat2, lon2 = math.radians(listing.latitude), math.radians(listing.longitude)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return round(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a)), 3)
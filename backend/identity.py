@@ -0,0 +1,73 @@
+import time
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from cache import MemoryBackend
+from models import db, User
+
+# The signed-in user behind @jwt_required() routes. JWTManager's
+# user_lookup_loader resolves the token identity to a CurrentUser once per
+# request (flask_jwt_extended.current_user), from a per-process LRU of user
+# records with a TTL, so authenticated requests normally issue no user
+# query. Records hold only profile fields: counters such as unread_count
+# change with other users' writes and are read from the database where
+# needed, and the password hash never leaves login. update_profile
+# invalidates the user's record here; other processes see the change once
+# their copy expires after USER_CACHE_TTL seconds.
+
+CurrentUser = namedtuple('CurrentUser', ['id', 'name', 'email', 'phone', 'user_type'])
+
+class UserCache:
+    def __init__(self):
+        self.ttl = 60
+        self.hits = 0
+        self.misses = 0
+        self._backend = MemoryBackend()
+
+    def init_app(self, app, jwt):
+        self.ttl = app.config.get('USER_CACHE_TTL', 60)
+        self._backend = MemoryBackend(app.config.get('USER_CACHE_SIZE', 1024))
+        jwt.user_lookup_loader(self._lookup)
+
+    def _lookup(self, jwt_header, jwt_data):
+        # None makes flask_jwt_extended answer 401 (user no longer exists)
+        return self.get(jwt_data['sub'])
+
+    def get(self, user_id):
+        key = str(user_id)
+        if self.ttl > 0:
+            entry = self._backend.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry['user']
+        self.misses += 1
+        row = db.session.execute(
+            select(User.id, User.name, User.email, User.phone, User.user_type).filter_by(id=user_id)
+        ).first()
+        if row is None:
+            return None
+        user = CurrentUser(*row)
+        if self.ttl > 0:
+            self._backend.set(key, {'user': user, 'expires': time.time() + self.ttl, 'tags': [key]})
+        return user
+
+    def invalidate(self, user_id):
+        return self._backend.invalidate([str(user_id)], lambda entry: True)
+
+    def clear(self):
+        self._backend.clear()
+
+    def metrics(self):
+        # Prometheus exposition lines for instrumentation.Instrumentation
+        return [
+            '# HELP user_cache_entries User records cached for token lookups.',
+            '# TYPE user_cache_entries gauge',
+            f'user_cache_entries {len(self._backend)}',
+            '# HELP user_cache_hits_total Token lookups answered from the cache.',
+            '# TYPE user_cache_hits_total counter',
+            f'user_cache_hits_total {self.hits}',
+            '# HELP user_cache_misses_total Token lookups that queried the user.',
+            '# TYPE user_cache_misses_total counter',
+            f'user_cache_misses_total {self.misses}',
+        ]
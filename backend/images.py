@@ -0,0 +1,280 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Listing photos uploaded through the API. Originals are stored under
+# IMAGE_STORE_DIR by the SHA-256 of their bytes, so a photo uploaded twice
+# (or to two listings) is stored once and a stored file never changes: its
+# URL can be cached indefinitely. Every original gets resized variants --
+# thumb (320 px, for cards) and medium (1024 px, for the gallery), each as
+# JPEG and WebP -- made on a pool of IMAGE_WORKERS threads after the upload
+# has returned; Pillow releases the GIL while decoding, resizing and
+# encoding. Until a variant exists its URL serves the original and queues
+# the variant, which also rebuilds variants that are missing for any other
+# reason. When IMAGE_QUEUE uploads are already waiting, new ones are left
+# to that path instead of growing the queue. Needs the Pillow package.
+
+logger = logging.getLogger('real_estate.images')
+
+# Longest side in pixels; larger variants first, each made from the last
+VARIANTS = {'medium': 1024, 'thumb': 320}
+# URL extension -> (Pillow format, mimetype, save options)
+FORMATS = {
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'progressive': True}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+}
+ORIGINAL_FORMATS = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+CARD_VARIANT = 'thumb.jpg'
+# Uploads are hashed and copied in chunks of this many bytes
+CHUNK_BYTES = 1024 * 1024
+
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+_VARIANT = re.compile(r'^(%s)\.(%s)$' % ('|'.join(VARIANTS), '|'.join(FORMATS)))
+
+def _pil():
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise RuntimeError('Image uploads need the Pillow package') from None
+    return Image, ImageOps
+
+def image_url(digest, variant=None):
+    # /api/images/<digest> for the original, /api/images/<digest>/thumb.jpg
+    # for a variant
+    return f'/api/images/{digest}/{variant}' if variant else f'/api/images/{digest}'
+
+def variant_urls(digest):
+    return {f'{name}.{ext}': image_url(digest, f'{name}.{ext}') for name in VARIANTS for ext in FORMATS}
+
+def _sniff(head):
+    # Mimetype of a stored original from its first bytes
+    if head.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG'):
+        return 'image/png'
+    return 'image/webp'
+
+def _rgb(image):
+    # JPEG has no alpha; transparent areas become white
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = _pil()[0].new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+def _write(path, data):
+    # Atomic, so readers never see a partial file
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, partial = tempfile.mkstemp(dir=directory, prefix='.partial-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(partial, path)
+
+class ImagePipeline:
+    def __init__(self):
+        self.root = os.path.join(tempfile.gettempdir(), 'images')
+        self.workers = os.cpu_count() or 1
+        self.queue_size = 256
+        self.max_bytes = 20 * 1024 * 1024
+        self.max_pixels = 50_000_000
+        self.stored = 0
+        self.deduplicated = 0
+        self.processed = 0
+        self.deferred = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self._queued = set()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def init_app(self, app):
+        self.root = app.config.get('IMAGE_STORE_DIR') or os.path.join(app.instance_path, 'images')
+        self.workers = max(1, app.config.get('IMAGE_WORKERS', self.workers))
+        self.queue_size = app.config.get('IMAGE_QUEUE', self.queue_size)
+        self.max_bytes = app.config.get('IMAGE_MAX_BYTES', self.max_bytes)
+        self.max_pixels = app.config.get('IMAGE_MAX_PIXELS', self.max_pixels)
+
+    def _directory(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def check(self, file):
+        # Raises ValueError unless the binary `file` holds a JPEG, PNG or
+        # WebP within the size limits; reads the header and verifies the
+        # structure without decoding the pixels, then rewinds `file`
+        file.seek(0, os.SEEK_END)
+        if file.tell() > self.max_bytes:
+            raise ValueError(f'Image larger than {self.max_bytes // (1024 * 1024)} MB')
+        file.seek(0)
+        Image, _ = _pil()
+        try:
+            with Image.open(file) as image:
+                if image.format not in ORIGINAL_FORMATS:
+                    raise ValueError(f'Unsupported image format {image.format}; use JPEG, PNG or WebP')
+                if image.width * image.height > self.max_pixels:
+                    raise ValueError(f'Image has more than {self.max_pixels} pixels')
+                image.verify()
+        except ValueError:
+            raise
+        except Exception:
+            raise ValueError('Not a readable image') from None
+        finally:
+            file.seek(0)
+
+    def store(self, file):
+        # Stores a checked original from the binary `file` and queues its
+        # variants; returns the digest. The bytes are copied to a temporary
+        # file and hashed on the way, CHUNK_BYTES at a time.
+        os.makedirs(self.root, exist_ok=True)
+        fd, partial = tempfile.mkstemp(dir=self.root, prefix='.partial-')
+        try:
+            sha256 = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: file.read(CHUNK_BYTES), b''):
+                    sha256.update(chunk)
+                    f.write(chunk)
+            digest = sha256.hexdigest()
+            path = os.path.join(self._directory(digest), 'original')
+            with self._lock:
+                exists = os.path.exists(path)
+                if exists:
+                    self.deduplicated += 1
+                else:
+                    self.stored += 1
+            if not exists:
+                # Atomic, so readers never see a partial file
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        self.submit(digest)
+        return digest
+
+    def submit(self, digest):
+        # Queues the missing variants of `digest`; False when the queue is
+        # full (they are made when first requested instead)
+        with self._lock:
+            if digest in self._queued:
+                return True
+            if len(self._queued) >= self.workers + self.queue_size:
+                self.deferred += 1
+                return False
+            self._queued.add(digest)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='image')
+        self._executor.submit(self._process, digest)
+        return True
+
+    def _process(self, digest):
+        started = time.perf_counter()
+        try:
+            made = self.generate(digest)
+        except Exception:
+            made = 0
+            with self._lock:
+                self.failed += 1
+            logger.exception('Failed to make the variants of image %s', digest)
+        finally:
+            with self._lock:
+                self._queued.discard(digest)
+                self.seconds += time.perf_counter() - started
+                self._idle.notify_all()
+        return made
+
+    def generate(self, digest):
+        # Makes the variants of `digest` that do not exist yet, on the
+        # calling thread; returns how many were written
+        directory = self._directory(digest)
+        missing = [
+            (name, ext) for name in VARIANTS for ext in FORMATS
+            if not os.path.exists(os.path.join(directory, f'{name}.{ext}'))
+        ]
+        if not missing:
+            return 0
+        Image, ImageOps = _pil()
+        with Image.open(os.path.join(directory, 'original')) as original:
+            largest = max(VARIANTS.values())
+            # JPEG decodes straight to a fraction of its size, far cheaper
+            # than decoding every pixel and resizing afterwards
+            original.draft('RGB', (largest, largest))
+            image = _rgb(ImageOps.exif_transpose(original))
+        for name, size in VARIANTS.items():
+            image.thumbnail((size, size), Image.LANCZOS)
+            for ext in FORMATS:
+                if (name, ext) not in missing:
+                    continue
+                pil_format, _, options = FORMATS[ext]
+                buffer = io.BytesIO()
+                image.save(buffer, pil_format, **options)
+                _write(os.path.join(directory, f'{name}.{ext}'), buffer.getvalue())
+        with self._lock:
+            self.processed += 1
+        return len(missing)
+
+    def locate(self, digest, variant=None):
+        # (path, mimetype, final) of an original or variant, or None. A
+        # variant not made yet is queued and answered with the original,
+        # final=False so it is not cached as the variant.
+        if not _DIGEST.match(digest) or (variant is not None and not _VARIANT.match(variant)):
+            return None
+        directory = self._directory(digest)
+        if variant is not None:
+            path = os.path.join(directory, variant)
+            if os.path.exists(path):
+                return path, FORMATS[variant.rsplit('.', 1)[1]][1], True
+        original = os.path.join(directory, 'original')
+        if not os.path.exists(original):
+            return None
+        with open(original, 'rb') as f:
+            mimetype = _sniff(f.read(4))
+        if variant is not None:
+            self.submit(digest)
+        return original, mimetype, variant is None
+
+    def flush(self, timeout=None):
+        # Waits until every queued image has been processed
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._queued:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def metrics(self):
+        # Prometheus exposition lines for instrumentation.Instrumentation
+        with self._lock:
+            queued = len(self._queued)
+        return [
+            '# HELP image_queue_depth Images waiting for or being resized.',
+            '# TYPE image_queue_depth gauge',
+            f'image_queue_depth {queued}',
+            '# HELP images_stored_total Uploaded originals written to the store.',
+            '# TYPE images_stored_total counter',
+            f'images_stored_total {self.stored}',
+            '# HELP images_deduplicated_total Uploads whose bytes were already stored.',
+            '# TYPE images_deduplicated_total counter',
+            f'images_deduplicated_total {self.deduplicated}',
+            '# HELP images_processed_total Originals whose variants were made.',
+            '# TYPE images_processed_total counter',
+            f'images_processed_total {self.processed}',
+            '# HELP images_deferred_total Uploads left to on-demand variants because the queue was full.',
+            '# TYPE images_deferred_total counter',
+            f'images_deferred_total {self.deferred}',
+            '# HELP image_failures_total Originals whose variants could not be made.',
+            '# TYPE image_failures_total counter',
+            f'image_failures_total {self.failed}',
+            '# HELP image_processing_seconds_total Worker time spent making variants.',
+            '# TYPE image_processing_seconds_total counter',
+            f'image_processing_seconds_total {self.seconds:.6f}',
+        ]
@@ -0,0 +1,226 @@
+import csv
+import io
+import json
+import math
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Listing, ListingImage, PropertyFeature
+
+# Streaming bulk import of listings from NDJSON or CSV. Input is read row by
+# row and written in batches of BATCH_SIZE, each batch one transaction with
+# one multi-row INSERT per table, so memory stays bounded by the batch and a
+# 200k-row feed costs a few hundred commits instead of 400k. Invalid rows are
+# reported with their line number and skipped; they never abort the import.
+#
+# Row fields are those of POST /api/listings plus optional `status`.
+# `images` is a list of URLs (CSV: separated by "|"); `features` is an object
+# {"Balkon": "Ja"}, a list of {"name", "value"} (CSV: "Balkon:Ja|Aufzug:Nein").
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+STATUSES = ('active', 'sold', 'pending')
+
+TEXT_FIELDS = {
+    'title': 200, 'property_type': 50, 'address': 200, 'city': 100,
+    'state': 50, 'zip_code': 20,
+}
+
+class RowError(ValueError):
+    pass
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+def _number(row, name, kind, required=False):
+    value = row.get(name)
+    if _blank(value):
+        if required:
+            raise RowError(f'{name} is required')
+        return None
+    try:
+        number = kind(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{name} must be a number')
+    if isinstance(number, float) and not math.isfinite(number):
+        raise RowError(f'{name} must be a finite number')
+    return number
+
+def _images(value):
+    if _blank(value):
+        return []
+    if isinstance(value, str):
+        value = value.split('|')
+    if not isinstance(value, list) or not all(isinstance(url, str) for url in value):
+        raise RowError('images must be a list of URLs')
+    urls = [url.strip() for url in value if url.strip()]
+    if any(len(url) > 500 for url in urls):
+        raise RowError('image URL is longer than 500 characters')
+    return urls
+
+def parse_features(value):
+    if _blank(value):
+        return []
+    if isinstance(value, str):
+        pairs = []
+        for part in value.split('|'):
+            name, sep, feature_value = part.partition(':')
+            if not sep or not name.strip():
+                raise RowError('features must look like "Name:Value|Name:Value"')
+            pairs.append((name.strip(), feature_value.strip()))
+    elif isinstance(value, dict):
+        pairs = [(str(k), None if v is None else str(v)) for k, v in value.items()]
+    elif isinstance(value, list) and all(isinstance(f, dict) and f.get('name') for f in value):
+        pairs = [(str(f['name']), None if f.get('value') is None else str(f['value'])) for f in value]
+    else:
+        raise RowError('features must be an object or a list of {name, value}')
+    if any(len(name) > 100 or (v is not None and len(v) > 200) for name, v in pairs):
+        raise RowError('feature name or value is too long')
+    return pairs
+
+def validate_row(row, owner_id):
+    # Returns (listing values, image urls, feature pairs) or raises RowError
+    if not isinstance(row, dict):
+        raise RowError('row must be an object')
+    if _blank(row.get('title')):
+        raise RowError('title is required')
+
+    listing = {'owner_id': owner_id, 'description': row.get('description') or ''}
+    for name, limit in TEXT_FIELDS.items():
+        value = row.get(name)
+        value = None if _blank(value) else str(value).strip()
+        if value is not None and len(value) > limit:
+            raise RowError(f'{name} is longer than {limit} characters')
+        listing[name] = value
+
+    listing['price'] = _number(row, 'price', float, required=True)
+    if listing['price'] < 0:
+        raise RowError('price must not be negative')
+    listing['bedrooms'] = _number(row, 'bedrooms', int)
+    listing['bathrooms'] = _number(row, 'bathrooms', int)
+    listing['square_feet'] = _number(row, 'square_feet', float)
+    listing['latitude'] = _number(row, 'latitude', float)
+    listing['longitude'] = _number(row, 'longitude', float)
+    if listing['latitude'] is not None and not -90 <= listing['latitude'] <= 90:
+        raise RowError('latitude is out of range')
+    if listing['longitude'] is not None and not -180 <= listing['longitude'] <= 180:
+        raise RowError('longitude is out of range')
+
+    status = row.get('status')
+    listing['status'] = 'active' if _blank(status) else str(status).strip()
+    if listing['status'] not in STATUSES:
+        raise RowError(f"status must be one of {', '.join(STATUSES)}")
+
+    return listing, _images(row.get('images')), parse_features(row.get('features'))
+
+def read_ndjson(stream):
+    # Yields (line number, row or RowError)
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, RowError(f'invalid JSON: {e}')
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # Header is line 1; reader.line_num is the last physical line read
+        yield reader.line_num, row
+
+def text_stream(binary):
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+def _insert_listings(conn, rows):
+    # Returns the new ids in row order
+    if conn.dialect.name != 'sqlite':
+        return conn.execute(
+            insert(Listing.__table__).returning(Listing.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+    # SQLite cannot return ids from a single executemany in order. The first
+    # INSERT takes the database write lock until commit and gets max(id) + 1,
+    # so the ids after it are free and can be assigned up front.
+    first = conn.execute(insert(Listing.__table__).returning(Listing.id), rows[0]).scalar_one()
+    ids = list(range(first, first + len(rows)))
+    if len(rows) > 1:
+        conn.execute(insert(Listing.__table__), [dict(row, id=i) for i, row in zip(ids[1:], rows[1:])])
+    return ids
+
+def _insert(batch):
+    conn = db.session.connection()
+    ids = _insert_listings(conn, [listing for _, listing, _, _ in batch])
+    images = [
+        {'listing_id': listing_id, 'image_url': url, 'is_primary': i == 0}
+        for listing_id, (_, _, urls, _) in zip(ids, batch)
+        for i, url in enumerate(urls)
+    ]
+    features = [
+        {'listing_id': listing_id, 'feature_name': name, 'feature_value': value}
+        for listing_id, (_, _, _, pairs) in zip(ids, batch)
+        for name, value in pairs
+    ]
+    if images:
+        conn.execute(insert(ListingImage.__table__), images)
+    if features:
+        conn.execute(insert(PropertyFeature.__table__), features)
+    return ids
+
+def _flush(batch, report):
+    if not batch:
+        return
+    try:
+        ids = _insert(batch)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        # Isolate the row(s) the database rejected and keep the rest
+        ids = []
+        for item in batch:
+            try:
+                ids += _insert([item])
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                report.error(item[0], f'database error: {e.__class__.__name__}')
+    report.imported += len(ids)
+
+def import_listings(rows, owner_id, batch_size=BATCH_SIZE):
+    # `rows` yields (line number, row or RowError), e.g. from read_ndjson()
+    report = ImportReport()
+    batch = []
+    for line_no, row in rows:
+        if isinstance(row, RowError):
+            report.error(line_no, str(row))
+            continue
+        try:
+            listing, urls, pairs = validate_row(row, owner_id)
+        except RowError as e:
+            report.error(line_no, str(e))
+            continue
+        batch.append((line_no, listing, urls, pairs))
+        if len(batch) >= batch_size:
+            _flush(batch, report)
+            batch = []
+    _flush(batch, report)
+    return report
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request SQL and timing instrumentation. Engine-level event hooks count
+# statements and database time for the request that issued them; every
+# response gets a Server-Timing header, statements slower than SLOW_QUERY_MS
+# are logged with their parameters, and per-endpoint counters and latency
+# histograms are served in Prometheus text format. Bookkeeping is a few
+# perf_counter() calls per statement and one locked update per request.
+
+logger = logging.getLogger('real_estate.sql')
+
+# Prometheus histogram upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+MAX_LOGGED_PARAMETERS = 500
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.total:.6f}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _request_stats():
+    if has_request_context():
+        return g.get('_sql_stats')
+    return None
+
+class Instrumentation:
+    def __init__(self):
+        self.slow_query_seconds = 0.2
+        self.server_timing = True
+        self.requests = {}    # (method, endpoint, status) -> count
+        self.latency = {}     # (method, endpoint) -> Histogram
+        self.queries = {}     # (method, endpoint) -> Histogram
+        self.db_seconds = {}  # (method, endpoint) -> float
+        self.slow_queries = 0
+        self.collectors = []
+        self._lock = threading.Lock()
+        self._hooked = False
+
+    def init_app(self, app):
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        self.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000
+        self.server_timing = app.config.get('SERVER_TIMING', True)
+        self._hook_engines()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def add_collector(self, collect):
+        # `collect()` returns extra exposition lines for metrics()
+        self.collectors.append(collect)
+
+    def _hook_engines(self):
+        # Listening on the Engine class covers engines created later too
+        if self._hooked:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._hooked = True
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context, which a failed statement discards
+        # along with it
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        stats = _request_stats()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+        # Batched executemany() calls (imports, seeding) are slow by design
+        if elapsed >= self.slow_query_seconds and not executemany:
+            with self._lock:
+                self.slow_queries += 1
+            shown = repr(parameters)
+            if len(shown) > MAX_LOGGED_PARAMETERS:
+                shown = shown[:MAX_LOGGED_PARAMETERS] + '...'
+            logger.warning(
+                'Slow query (%.1f ms)%s: %s | parameters: %s', elapsed * 1000,
+                f' in {request.method} {request.path}' if has_request_context() else '',
+                ' '.join(statement.split()), shown
+            )
+
+    def _before_request(self):
+        g._sql_stats = [0, 0.0]
+        g._request_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.get('_request_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        count, db_time = g._sql_stats
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        key = (request.method, endpoint)
+        with self._lock:
+            status_key = key + (response.status_code,)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.queries[key] = Histogram(QUERY_BUCKETS)
+                self.db_seconds[key] = 0.0
+            self.latency[key].observe(elapsed)
+            self.queries[key].observe(count)
+            self.db_seconds[key] += db_time
+        if self.server_timing:
+            # Streamed bodies (exports) are produced after this point
+            response.headers['Server-Timing'] = (
+                f'db;dur={db_time * 1000:.2f};desc="{count} queries", app;dur={elapsed * 1000:.2f}'
+            )
+        return response
+
+    def metrics(self):
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP http_requests_total Requests by endpoint and status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'http_requests_total{{method="{method}",endpoint="{_label(endpoint)}",status="{status}"}} {count}'
+                )
+            lines += [
+                '# HELP http_request_duration_seconds Time to produce the response.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for (method, endpoint), histogram in sorted(self.latency.items()):
+                lines += histogram.lines(
+                    'http_request_duration_seconds', f'method="{method}",endpoint="{_label(endpoint)}"'
+                )
+            lines += [
+                '# HELP db_queries_per_request SQL statements executed per request.',
+                '# TYPE db_queries_per_request histogram',
+            ]
+            for (method, endpoint), histogram in sorted(self.queries.items()):
+                lines += histogram.lines(
+                    'db_queries_per_request', f'method="{method}",endpoint="{_label(endpoint)}"'
+                )
+            lines += [
+                '# HELP db_duration_seconds_total Time spent executing SQL per endpoint.',
+                '# TYPE db_duration_seconds_total counter',
+            ]
+            for (method, endpoint), seconds in sorted(self.db_seconds.items()):
+                lines.append(
+                    f'db_duration_seconds_total{{method="{method}",endpoint="{_label(endpoint)}"}} {seconds:.6f}'
+                )
+            lines += [
+                '# HELP db_slow_queries_total Statements slower than SLOW_QUERY_MS.',
+                '# TYPE db_slow_queries_total counter',
+                f'db_slow_queries_total {self.slow_queries}',
+            ]
+        for collect in self.collectors:
+            lines += collect()
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,99 @@
+import math
+import re
+import unicodedata
+
+from geo import KM_PER_DEGREE, parse_geo_args
+
+# Evaluates listing filters (the query parameters of /api/listings and
+# /api/search) against a single listing in Python. Used to decide which
+# cached results a write can affect. Answers are conservative: anything the
+# evaluator cannot decide counts as a match.
+
+SNAPSHOT_FIELDS = (
+    'id', 'owner_id', 'title', 'description', 'price', 'property_type', 'bedrooms',
+    'address', 'city', 'latitude', 'longitude', 'status'
+)
+# City filters match as substrings; indexes of stored filters key them by
+# their first CITY_KEY_CHARS folded characters (see city_key)
+CITY_KEY_CHARS = 3
+
+def listing_snapshot(listing):
+    return {name: getattr(listing, name) for name in SNAPSHOT_FIELDS}
+
+def _fold(value):
+    # Case- and accent-insensitive, like the unicode61 tokenizer
+    value = unicodedata.normalize('NFKD', value or '')
+    return ''.join(c for c in value if not unicodedata.combining(c)).casefold()
+
+def city_key(city):
+    # Every city containing the filter value `city` contains this key
+    return _fold(city)[:CITY_KEY_CHARS]
+
+def city_keys(city):
+    # The keys of the city filter values `city` may contain
+    folded = _fold(city)
+    return {
+        folded[start:start + length]
+        for length in range(1, CITY_KEY_CHARS + 1) for start in range(len(folded) - length + 1)
+    }
+
+def _number(args, name, kind):
+    try:
+        return kind(args[name]) if args.get(name) else None
+    except ValueError:
+        return None
+
+def _keyword_matches(query, snapshot):
+    # Every word as a substring: a superset of both the FTS5 word/prefix match
+    # and the ILIKE fallback.
+    text = ' '.join(_fold(snapshot[name]) for name in ('title', 'description', 'address', 'city'))
+    return all(_fold(token) in text for token in re.findall(r'[^\W_]+', query))
+
+def _geo_matches(args, snapshot):
+    try:
+        geo = parse_geo_args(args)
+    except ValueError:
+        return False
+    if not geo:
+        return True
+    lat, lon = snapshot['latitude'], snapshot['longitude']
+    if lat is None or lon is None:
+        return False
+    if 'bbox' in geo:
+        south, west, north, east = geo['bbox']
+        if not (south <= lat <= north and west <= lon <= east):
+            return False
+    if 'near' in geo:
+        lat0, lon0 = geo['near']
+        dy = (lat - lat0) * KM_PER_DEGREE
+        dx = (lon - lon0) * KM_PER_DEGREE * math.cos(math.radians(lat0))
+        # Small slack covers the SQL approximation of the distance
+        if dy * dy + dx * dx > (geo['radius_km'] * 1.01) ** 2:
+            return False
+    return True
+
+def listing_may_match(args, snapshot, status=None):
+    # `args` is a werkzeug MultiDict of request arguments; `status` overrides
+    # the status filter for endpoints that do not take it from the request.
+    # Snapshots carry no features, so `feature` filters never rule a listing out.
+    if snapshot is None:
+        return False
+    if snapshot['status'] != (status or args.get('status', 'active')):
+        return False
+    if args.get('property_type') and snapshot['property_type'] != args['property_type']:
+        return False
+    price = snapshot['price']
+    min_price = _number(args, 'min_price', float)
+    if min_price and price is not None and price < min_price:
+        return False
+    max_price = _number(args, 'max_price', float)
+    if max_price and price is not None and price > max_price:
+        return False
+    bedrooms = _number(args, 'bedrooms', int)
+    if bedrooms and (snapshot['bedrooms'] or 0) < bedrooms:
+        return False
+    if args.get('city') and _fold(args['city']) not in _fold(snapshot['city']):
+        return False
+    if args.get('q') and not _keyword_matches(args['q'], snapshot):
+        return False
+    return _geo_matches(args, snapshot)
@@ -0,0 +1,179 @@
+from datetime import datetime
+
+from sqlalchemy import case, func, literal_column, select, text, update
+
+from models import db, dialect_insert, User, Message, Conversation, ConversationParticipant
+
+# Conversations group messages by participant pair and listing. Messages are
+# written through send_message() and read through mark_conversation_read(),
+# which keep the unread counters on conversation_participant and user in
+# step with message.is_read inside the caller's transaction, so inbox and
+# badge counts never scan the message table. Bulk loaders that insert
+# messages directly call sync_conversations() afterwards.
+
+def _pair(a, b):
+    return (a, b) if a <= b else (b, a)
+
+def _find_conversation(low, high, listing_id):
+    return db.session.execute(
+        select(Conversation).filter(
+            Conversation.user_low_id == low,
+            Conversation.user_high_id == high,
+            func.coalesce(Conversation.listing_id, 0) == (listing_id or 0)
+        )
+    ).scalars().first()
+
+def get_or_create_conversation(user_id, counterpart_id, listing_id=None):
+    # Concurrent first messages insert one row: uq_conversation_users_listing
+    # turns the others' inserts into no-ops, and they read the winner's row
+    low, high = _pair(user_id, counterpart_id)
+    conversation = _find_conversation(low, high, listing_id)
+    if conversation is not None:
+        return conversation
+    insert = dialect_insert(db.session.get_bind().dialect.name)
+    created = db.session.execute(
+        insert(Conversation).values(
+            user_low_id=low, user_high_id=high, listing_id=listing_id, created_at=datetime.utcnow()
+        ).on_conflict_do_nothing(
+            index_elements=['user_low_id', 'user_high_id', func.coalesce(Conversation.listing_id, literal_column('0'))]
+        ).returning(Conversation.id)
+    ).scalar()
+    if created is not None:
+        db.session.add(ConversationParticipant(conversation_id=created, user_id=low, counterpart_id=high))
+        if high != low:
+            db.session.add(ConversationParticipant(conversation_id=created, user_id=high, counterpart_id=low))
+        db.session.flush()
+    return _find_conversation(low, high, listing_id)
+
+def send_message(sender_id, receiver_id, content, subject='', listing_id=None):
+    # Adds the message and bumps the receiver's counters; the caller commits
+    conversation = get_or_create_conversation(sender_id, receiver_id, listing_id)
+    now = datetime.utcnow()
+    message = Message(
+        sender_id=sender_id,
+        receiver_id=receiver_id,
+        listing_id=listing_id,
+        subject=subject,
+        content=content,
+        conversation_id=conversation.id,
+        created_at=now
+    )
+    db.session.add(message)
+    db.session.flush()
+    conversation.last_message_id = message.id
+    conversation.last_message_at = now
+    db.session.execute(
+        update(ConversationParticipant)
+        .where(ConversationParticipant.conversation_id == conversation.id)
+        .values(
+            last_message_at=now,
+            unread_count=case(
+                (ConversationParticipant.user_id == receiver_id, ConversationParticipant.unread_count + 1),
+                else_=ConversationParticipant.unread_count
+            )
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        update(User).where(User.id == receiver_id).values(unread_count=User.unread_count + 1),
+        execution_options={'synchronize_session': False}
+    )
+    return message
+
+def _minus(column, amount):
+    return case((column > amount, column - amount), else_=0)
+
+def mark_conversation_read(conversation_id, user_id):
+    # Marks every unread message to `user_id` in the thread read with one
+    # UPDATE and takes exactly that many off the counters, so concurrent
+    # sends are never lost. Returns the number of messages marked; the
+    # caller commits.
+    marked = db.session.execute(
+        update(Message)
+        .where(
+            Message.conversation_id == conversation_id,
+            Message.receiver_id == user_id,
+            Message.is_read == False  # noqa: E712
+        )
+        .values(is_read=True),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if marked:
+        db.session.execute(
+            update(ConversationParticipant)
+            .where(
+                ConversationParticipant.conversation_id == conversation_id,
+                ConversationParticipant.user_id == user_id
+            )
+            .values(unread_count=_minus(ConversationParticipant.unread_count, marked)),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(
+            update(User).where(User.id == user_id).values(unread_count=_minus(User.unread_count, marked)),
+            execution_options={'synchronize_session': False}
+        )
+    return marked
+
+def _pair_sql(table):
+    low = f'CASE WHEN {table}.sender_id < {table}.receiver_id THEN {table}.sender_id ELSE {table}.receiver_id END'
+    high = f'CASE WHEN {table}.sender_id < {table}.receiver_id THEN {table}.receiver_id ELSE {table}.sender_id END'
+    return low, high
+
+def _same_conversation(table):
+    low, high = _pair_sql(table)
+    return (
+        f'c.user_low_id = {low} AND c.user_high_id = {high} AND '
+        f'COALESCE(c.listing_id, 0) = COALESCE({table}.listing_id, 0)'
+    )
+
+def sync_conversations(conn):
+    # Assigns conversations to messages that have none and recomputes every
+    # counter and last-message pointer from the message table. Set-based, so
+    # it suits migrations and bulk loads rather than request handlers.
+    low, high = _pair_sql('m')
+    statements = [
+        f"""INSERT INTO conversation (listing_id, user_low_id, user_high_id, created_at)
+            SELECT m.listing_id, {low}, {high}, MIN(m.created_at) FROM message m
+            WHERE m.conversation_id IS NULL AND NOT EXISTS (
+                SELECT 1 FROM conversation c WHERE {_same_conversation('m')}
+            )
+            GROUP BY m.listing_id, {low}, {high}""",
+        f"""UPDATE message SET conversation_id = (
+                SELECT MIN(c.id) FROM conversation c WHERE {_same_conversation('message')}
+            )
+            WHERE conversation_id IS NULL""",
+        """INSERT INTO conversation_participant (conversation_id, user_id, counterpart_id, unread_count)
+            SELECT c.id, c.user_low_id, c.user_high_id, 0 FROM conversation c
+            WHERE NOT EXISTS (
+                SELECT 1 FROM conversation_participant p
+                WHERE p.conversation_id = c.id AND p.user_id = c.user_low_id
+            )""",
+        """INSERT INTO conversation_participant (conversation_id, user_id, counterpart_id, unread_count)
+            SELECT c.id, c.user_high_id, c.user_low_id, 0 FROM conversation c
+            WHERE c.user_high_id <> c.user_low_id AND NOT EXISTS (
+                SELECT 1 FROM conversation_participant p
+                WHERE p.conversation_id = c.id AND p.user_id = c.user_high_id
+            )""",
+        """UPDATE conversation SET last_message_id = (
+                SELECT m.id FROM message m WHERE m.conversation_id = conversation.id
+                ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+            )""",
+        """UPDATE conversation SET last_message_at = (
+                SELECT m.created_at FROM message m WHERE m.id = conversation.last_message_id
+            )""",
+        """UPDATE conversation_participant SET
+                last_message_at = (
+                    SELECT c.last_message_at FROM conversation c
+                    WHERE c.id = conversation_participant.conversation_id
+                ),
+                unread_count = (
+                    SELECT COUNT(*) FROM message m
+                    WHERE m.conversation_id = conversation_participant.conversation_id
+                    AND m.receiver_id = conversation_participant.user_id AND m.is_read = :unread
+                )""",
+        """UPDATE "user" SET unread_count = (
+                SELECT COUNT(*) FROM message m WHERE m.receiver_id = "user".id AND m.is_read = :unread
+            )""",
+    ]
+    for statement in statements:
+        conn.execute(text(statement), {'unread': False})
@@ -0,0 +1,247 @@
+import json
+import re
+from datetime import datetime
+
+from sqlalchemy import inspect, select, text, tuple_
+
+from models import db, Favorite, Listing, ListingImage, Message, ConversationParticipant, PropertyFeature
+from queries import (
+    favorites_query, inbox_query, listing_cards_query, listing_detail_query, listings_detail_query, mailbox_query,
+    messages_query, search_cards_query, thread_query
+)
+from messaging import sync_conversations
+from favorites import sync_favorite_counts
+from saved_searches import index_keys
+from feature_index import feature_ids
+from search_index import apply_keyword_search
+from geo import apply_geo_filter
+
+# Versioned schema migrations for databases created before a model change.
+# db.create_all() only creates missing tables, so anything added to an
+# existing table (indexes, columns, constraints) ships as a numbered step
+# here. Applied versions are recorded in `schema_version`; every step is
+# written to be safe on a fresh database too, where create_all() has already
+# built the current schema.
+
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+def _create_index(conn, name, table, columns, unique=False):
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    ))
+
+@migration(1, 'Indexes for the listing, favorite, message, image and feature access paths')
+def _hot_path_indexes(conn):
+    _create_index(conn, 'ix_listing_status_created_at', 'listing', ['status', 'created_at', 'id'])
+    _create_index(conn, 'ix_listing_owner_id', 'listing', ['owner_id'])
+    _create_index(conn, 'ix_listing_image_listing_id', 'listing_image', ['listing_id'])
+    _create_index(conn, 'ix_favorite_listing_id', 'favorite', ['listing_id'])
+    _create_index(conn, 'ix_message_sender_created_at', 'message', ['sender_id', 'created_at'])
+    _create_index(conn, 'ix_message_receiver_created_at', 'message', ['receiver_id', 'created_at'])
+    _create_index(conn, 'ix_property_feature_listing_id', 'property_feature', ['listing_id'])
+
+    # Favorites become unique per (user, listing); keep the oldest duplicate
+    conn.execute(text(
+        """DELETE FROM favorite WHERE id NOT IN (
+            SELECT MIN(id) FROM favorite GROUP BY user_id, listing_id
+        )"""
+    ))
+    _create_index(conn, 'uq_favorite_user_listing', 'favorite', ['user_id', 'listing_id'], unique=True)
+
+@migration(2, 'Index listing.updated_at for incremental exports')
+def _updated_at_index(conn):
+    _create_index(conn, 'ix_listing_updated_at', 'listing', ['updated_at', 'id'])
+
+def _column_exists(conn, table, column):
+    return any(c['name'] == column for c in inspect(conn).get_columns(table))
+
+@migration(3, 'Conversations: message.conversation_id and maintained unread counters')
+def _conversations(conn):
+    # The conversation tables themselves come from create_all()
+    if not _column_exists(conn, 'user', 'unread_count'):
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN unread_count INTEGER NOT NULL DEFAULT 0'))
+    if not _column_exists(conn, 'message', 'conversation_id'):
+        conn.execute(text('ALTER TABLE message ADD COLUMN conversation_id INTEGER REFERENCES conversation (id)'))
+    _create_index(conn, 'ix_message_conversation_created_at', 'message', ['conversation_id', 'created_at', 'id'])
+    sync_conversations(conn)
+
+@migration(4, 'Maintained listing.favorite_count')
+def _favorite_counts(conn):
+    if not _column_exists(conn, 'listing', 'favorite_count'):
+        conn.execute(text('ALTER TABLE listing ADD COLUMN favorite_count INTEGER NOT NULL DEFAULT 0'))
+    sync_favorite_counts(conn)
+
+@migration(5, 'Index property_feature by (name, value) for feature filters')
+def _feature_index(conn):
+    _create_index(
+        conn, 'ix_property_feature_name_value', 'property_feature', ['feature_name', 'feature_value', 'listing_id']
+    )
+
+@migration(6, 'Widen user.password for password hashes')
+def _password_hashes(conn):
+    # SQLite does not enforce VARCHAR lengths; plaintext passwords are
+    # rehashed by the next successful login
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('ALTER TABLE "user" ALTER COLUMN password TYPE VARCHAR(255)'))
+    elif conn.dialect.name == 'mysql':
+        conn.execute(text('ALTER TABLE user MODIFY password VARCHAR(255) NOT NULL'))
+
+@migration(7, 'listing_image.content_hash for uploaded images')
+def _image_hashes(conn):
+    if not _column_exists(conn, 'listing_image', 'content_hash'):
+        conn.execute(text('ALTER TABLE listing_image ADD COLUMN content_hash VARCHAR(64)'))
+
+@migration(8, 'One conversation per user pair and listing')
+def _unique_conversations(conn):
+    # Merge duplicates from concurrent first messages into the oldest, then
+    # recount, before the unique index can be built
+    duplicate = """SELECT c.id FROM conversation c WHERE EXISTS (
+        SELECT 1 FROM conversation k WHERE k.user_low_id = c.user_low_id AND k.user_high_id = c.user_high_id
+        AND COALESCE(k.listing_id, 0) = COALESCE(c.listing_id, 0) AND k.id < c.id
+    )"""
+    if conn.execute(text(f'SELECT COUNT(*) FROM ({duplicate}) d')).scalar():
+        # sync_conversations() reassigns the detached messages
+        conn.execute(text(f'UPDATE message SET conversation_id = NULL WHERE conversation_id IN ({duplicate})'))
+        conn.execute(text(f'DELETE FROM conversation_participant WHERE conversation_id IN ({duplicate})'))
+        conn.execute(text(f'DELETE FROM conversation WHERE id IN ({duplicate})'))
+        sync_conversations(conn)
+    # The unique index replaces the plain one on the same columns
+    if conn.dialect.name != 'mysql':
+        conn.execute(text('DROP INDEX IF EXISTS ix_conversation_users_listing'))
+    elif any(index['name'] == 'ix_conversation_users_listing' for index in inspect(conn).get_indexes('conversation')):
+        conn.execute(text('DROP INDEX ix_conversation_users_listing ON conversation'))
+    _create_index(
+        conn, 'uq_conversation_users_listing', 'conversation',
+        ['user_low_id', 'user_high_id', 'COALESCE(listing_id, 0)'], unique=True
+    )
+
+@migration(9, 'Key saved searches by city prefix')
+def _saved_search_city_keys(conn):
+    # Rows keyed by city word miss listings whose city only contains the
+    # saved city as a substring; rebuilds every search's keys
+    searches = conn.execute(text('SELECT id, filters FROM saved_search')).all()
+    conn.execute(text('DELETE FROM saved_search_key'))
+    rows = [
+        {'search': search_id, 'city': city, 'type': property_type, 'band': band}
+        for search_id, filters in searches
+        for city, property_type, band in index_keys(json.loads(filters))
+    ]
+    if rows:
+        conn.execute(text(
+            """INSERT INTO saved_search_key (saved_search_id, city_key, property_type, price_band)
+               VALUES (:search, :city, :type, :band)"""
+        ), rows)
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        """CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )"""
+    ))
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_version"))}
+
+def apply_migrations():
+    # Applies pending migrations in order, each in its own transaction.
+    # Returns the (version, description) pairs that ran.
+    ran = []
+    with db.engine.begin() as conn:
+        done = applied_versions(conn)
+    for version, description, fn in MIGRATIONS:
+        if version in done:
+            continue
+        with db.engine.begin() as conn:
+            fn(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {'v': version, 'd': description, 't': datetime.utcnow()}
+            )
+        ran.append((version, description))
+    return ran
+
+# Query plan checks: the main statement of each hot endpoint, which must be
+# answered by index searches, without scanning a table or index and without
+# sorting rows in a temp B-tree. The INTERSECT of feature filters still
+# builds a temp B-tree of listing ids, from bounded index ranges. A virtual
+# table may be scanned with a constraint (an FTS5 MATCH, an R*Tree box) and
+# a materialized subquery may be scanned once built; RANKED queries order
+# their candidates by a computed score, which takes a sort. The search and
+# geo statements assume the indexes initialize_database() creates on SQLite.
+
+def hot_queries():
+    cursor = (datetime(2030, 1, 1), 1)
+    return {
+        'GET /api/listings': listing_cards_query('active').order_by(
+            Listing.created_at.desc()
+        ).limit(10),
+        'GET /api/listings (cursor)': listing_cards_query('active').filter(
+            tuple_(Listing.created_at, Listing.id) < tuple_(*cursor)
+        ).order_by(Listing.created_at.desc(), Listing.id.desc()).limit(10),
+        'GET /api/listings/<id>': listing_detail_query(1),
+        'GET /api/listings/<id> (features)': select(PropertyFeature).where(PropertyFeature.listing_id.in_([1])),
+        'GET /api/listings?ids=': listings_detail_query([1, 2, 3]),
+        'GET /api/listings?feature=': feature_ids([[('Balkon', 'Ja')], [('Heizung', 'Gas'), ('Garten', None)]]),
+        'GET /api/listings?near=': apply_geo_filter(
+            listing_cards_query('active'), {'near': (52.52, 13.405), 'radius_km': 5.0}, indexed=True
+        ).limit(10),
+        'GET /api/listings?bbox=': apply_geo_filter(
+            listing_cards_query('active'), {'bbox': (52.45, 13.3, 52.55, 13.5)}, indexed=True
+        ).order_by(Listing.created_at.desc()).limit(10),
+        'GET /api/search?q=': apply_keyword_search(search_cards_query(), 'altbau', indexed=True).order_by(
+            Listing.created_at.desc()
+        ).limit(20),
+        'listing images (selectin)': select(ListingImage).where(ListingImage.listing_id.in_([1, 2, 3])),
+        'GET /api/favorites': favorites_query(1),
+        'GET /api/favorites/check': select(Favorite.listing_id).where(
+            Favorite.user_id == 1, Favorite.listing_id.in_([1, 2, 3])
+        ),
+        'GET /api/messages': mailbox_query(1, 51, cursor),
+        'GET /api/messages (rows)': messages_query(list(range(1, 51))),
+        'GET /api/conversations': inbox_query(1).filter(
+            tuple_(ConversationParticipant.last_message_at, ConversationParticipant.conversation_id) < tuple_(*cursor)
+        ).order_by(
+            ConversationParticipant.last_message_at.desc(), ConversationParticipant.conversation_id.desc()
+        ).limit(20),
+        'GET /api/conversations/<id>/messages': thread_query(1).filter(
+            tuple_(Message.created_at, Message.id) < tuple_(*cursor)
+        ).order_by(Message.created_at.desc(), Message.id.desc()).limit(50),
+    }
+
+RANKED = {'GET /api/listings?near=', 'GET /api/search?q='}
+
+_SLOW_STEP = re.compile(r'^SCAN |USE TEMP B-TREE')
+_CONSTRAINED_VIRTUAL_SCAN = re.compile(r'^SCAN \S+ VIRTUAL TABLE INDEX \d+:\S')
+
+def slow_steps(plan, ranked=False):
+    materialized = {line.split()[1] for line in plan if line.startswith('MATERIALIZE ')}
+    return [
+        line for line in plan
+        if _SLOW_STEP.search(line)
+        and not _CONSTRAINED_VIRTUAL_SCAN.match(line)
+        and line not in {f'SCAN {name}' for name in materialized}
+        and not (ranked and line == 'USE TEMP B-TREE FOR ORDER BY')
+    ]
+
+def explain(conn, stmt):
+    sql = stmt.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True})
+    return [row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+
+def check_query_plans():
+    # Returns {name: (plan lines, offending lines)}; SQLite only.
+    results = {}
+    with db.engine.connect() as conn:
+        for name, stmt in hot_queries().items():
+            plan = explain(conn, stmt)
+            results[name] = (plan, slow_steps(plan, name in RANKED))
+    return results
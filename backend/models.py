@@ -1,16 +1,31 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import configure_mappers
 from datetime import datetime
 
-db = SQLAlchemy()
+from engines import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def dialect_insert(dialect):
+    # insert() with on_conflict_do_nothing() for the named dialect
+    if dialect == 'postgresql':
+        # Imported on use; the dialect package adds ~40 ms to startup
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert
+    return sqlite.insert
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(100), nullable=False)
+    # Hash from passwords.py; plaintext in rows older than migration 6
+    password = db.Column(db.String(255), nullable=False)
     phone = db.Column(db.String(20))
     user_type = db.Column(db.String(20))  # buyer, seller, agent
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Unread messages across all conversations, maintained by messaging.py
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     listings = db.relationship('Listing', backref='owner', lazy=True)
     favorites = db.relationship('Favorite', backref='user', lazy=True)
@@ -36,23 +51,44 @@ class Listing(db.Model):
     status = db.Column(db.String(20), default='active')  # active, sold, pending
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    favorite_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # see favorites.py
     
     images = db.relationship('ListingImage', backref='listing', lazy=True, cascade='all, delete-orphan')
     favorites = db.relationship('Favorite', backref='listing', lazy=True)
+    features = db.relationship('PropertyFeature', backref='listing', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        # Every listing query filters status and pages by (created_at, id)
+        db.Index('ix_listing_status_created_at', 'status', 'created_at', 'id'),
+        db.Index('ix_listing_owner_id', 'owner_id'),
+        db.Index('ix_listing_updated_at', 'updated_at', 'id'),
+    )
 
 class ListingImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     listing_id = db.Column(db.Integer, db.ForeignKey('listing.id'), nullable=False)
     image_url = db.Column(db.String(500), nullable=False)
+    # SHA-256 of an uploaded original in the image store (images.py); None
+    # for external URLs
+    content_hash = db.Column(db.String(64))
     is_primary = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_listing_image_listing_id', 'listing_id'),
+    )
+
 class Favorite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     listing_id = db.Column(db.Integer, db.ForeignKey('listing.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('uq_favorite_user_listing', 'user_id', 'listing_id', unique=True),
+        db.Index('ix_favorite_listing_id', 'listing_id'),
+    )
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -62,9 +98,99 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=True)
+
+    listing = db.relationship('Listing', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_message_sender_created_at', 'sender_id', 'created_at'),
+        db.Index('ix_message_receiver_created_at', 'receiver_id', 'created_at'),
+        # Thread pages walk (created_at, id) within one conversation
+        db.Index('ix_message_conversation_created_at', 'conversation_id', 'created_at', 'id'),
+    )
+
+class Conversation(db.Model):
+    # All messages between two users about one listing (or none). The pair is
+    # stored ordered, user_low_id <= user_high_id, so it has one spelling;
+    # the unique index counts a missing listing as 0 since NULLs never clash.
+    id = db.Column(db.Integer, primary_key=True)
+    listing_id = db.Column(db.Integer, db.ForeignKey('listing.id'), nullable=True)
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer)
+    last_message_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    listing = db.relationship('Listing', lazy=True)
+    last_message = db.relationship(
+        'Message', primaryjoin='Conversation.last_message_id == Message.id',
+        foreign_keys=[last_message_id], viewonly=True, lazy=True
+    )
+    participants = db.relationship('ConversationParticipant', backref='conversation', lazy=True)
+
+    __table_args__ = (
+        db.Index(
+            'uq_conversation_users_listing', 'user_low_id', 'user_high_id', db.text('COALESCE(listing_id, 0)'),
+            unique=True
+        ),
+    )
+
+class ConversationParticipant(db.Model):
+    # One inbox row per user and conversation
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    counterpart_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_message_at = db.Column(db.DateTime)
+
+    counterpart = db.relationship('User', foreign_keys=[counterpart_id], lazy=True)
+
+    __table_args__ = (
+        db.Index('uq_conversation_participant', 'conversation_id', 'user_id', unique=True),
+        # Inbox pages walk (last_message_at, conversation_id) per user
+        db.Index('ix_conversation_participant_inbox', 'user_id', 'last_message_at', 'conversation_id'),
+    )
 
 class PropertyFeature(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     listing_id = db.Column(db.Integer, db.ForeignKey('listing.id'), nullable=False)
     feature_name = db.Column(db.String(100), nullable=False)
-    feature_value = db.Column(db.String(200)) 
\ No newline at end of file
+    feature_value = db.Column(db.String(200))
+
+    __table_args__ = (
+        db.Index('ix_property_feature_listing_id', 'listing_id'),
+        # Sorted listing ids per (name, value), for feature_index.py
+        db.Index('ix_property_feature_name_value', 'feature_name', 'feature_value', 'listing_id'),
+    )
+ 
+class SavedSearch(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(100))
+    filters = db.Column(db.Text, nullable=False)  # JSON object of /api/search parameters
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    keys = db.relationship('SavedSearchKey', backref='saved_search', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_saved_search_user_id', 'user_id'),
+    )
+
+class SavedSearchKey(db.Model):
+    # Predicate index of saved searches: one row per (city key, property
+    # type, price band) a search can match, '' / -1 meaning any
+    id = db.Column(db.Integer, primary_key=True)
+    saved_search_id = db.Column(db.Integer, db.ForeignKey('saved_search.id'), nullable=False)
+    city_key = db.Column(db.String(100), nullable=False)
+    property_type = db.Column(db.String(50), nullable=False)
+    price_band = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_saved_search_key_lookup', 'city_key', 'property_type', 'price_band', 'saved_search_id'),
+        db.Index('ix_saved_search_key_search', 'saved_search_id'),
+    )
+
+# Resolve backrefs (Listing.owner, Message.sender, ...) now, so query options
+# can reference them before the first query runs
+configure_mappers()
@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Background delivery of Socket.IO notifications. Request handlers call
+# notify(room, event, payload), which only appends to a bounded in-memory
+# queue; a background task emits. Events queued for the same room while the
+# task is busy (or within NOTIFY_COALESCE_MS) go out together: one pending
+# event is emitted as is, several of the same kind as a single
+# '<event>_batch' emit with {'events': [...]}. When the queue is full new
+# events are dropped and counted rather than blocking the request.
+#
+# Backends: 'socketio' emits through the app's SocketIO server, which fans
+# out across worker processes when SOCKETIO_MESSAGE_QUEUE points at a
+# message queue (e.g. redis://); 'local' records deliveries in memory for
+# tests and development.
+
+logger = logging.getLogger('real_estate.notifications')
+
+BACKENDS = ('socketio', 'local')
+MAX_EVENTS_PER_ROOM = 100
+RECORDED_DELIVERIES = 1000
+
+class NotificationDispatcher:
+    def __init__(self):
+        self.get_socketio = None
+        self.socketio = None
+        self.backend = 'socketio'
+        self.capacity = 10000
+        self.coalesce_seconds = 0.01
+        self.delivered = deque(maxlen=RECORDED_DELIVERIES)  # (room, event, payload) with 'local'
+        self.enqueued = 0
+        self.coalesced = 0
+        self.emits = 0
+        self.dropped = 0
+        self.errors = 0
+        self._pending = OrderedDict()  # room -> [(event, payload)]
+        self._depth = 0
+        self._busy = 0
+        self._condition = threading.Condition()
+        self._started = False
+
+    def init_app(self, app, get_socketio):
+        # `get_socketio()` returns the app's SocketIO server, creating it on
+        # first use; it is only called once a notification is emitted
+        self.get_socketio = get_socketio
+        self.backend = app.config.get('NOTIFY_BACKEND', 'socketio')
+        if self.backend not in BACKENDS:
+            raise ValueError(f'Unknown NOTIFY_BACKEND: {self.backend}')
+        self.capacity = app.config.get('NOTIFY_QUEUE_SIZE', 10000)
+        self.coalesce_seconds = app.config.get('NOTIFY_COALESCE_MS', 10) / 1000
+
+    def notify(self, room, event, payload):
+        # Never blocks; returns False if the event was dropped
+        with self._condition:
+            if self._depth >= self.capacity:
+                self.dropped += 1
+                return False
+            events = self._pending.get(room)
+            if events is None:
+                self._pending[room] = [(event, payload)]
+            else:
+                self.coalesced += 1
+                events.append((event, payload))
+                if len(events) > MAX_EVENTS_PER_ROOM:
+                    events.pop(0)
+                    self.dropped += 1
+                    self._depth -= 1
+            self._depth += 1
+            self.enqueued += 1
+            self._condition.notify()
+        if not self._started:
+            self._start()
+        return True
+
+    def _start(self):
+        with self._condition:
+            if self._started:
+                return
+            self._started = True
+        if self.backend == 'socketio':
+            self._server().start_background_task(self._run)
+        else:
+            threading.Thread(target=self._run, name='notification-dispatcher', daemon=True).start()
+
+    def _server(self):
+        if self.socketio is None:
+            self.socketio = self.get_socketio()
+        return self.socketio
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            # Let a burst to the same rooms accumulate before sending
+            if self.coalesce_seconds:
+                time.sleep(self.coalesce_seconds)
+            with self._condition:
+                batch = list(self._pending.items())
+                self._pending.clear()
+                self._busy = self._depth
+                self._depth = 0
+            for room, events in batch:
+                self._deliver(room, events)
+            with self._condition:
+                self._busy = 0
+                self._condition.notify_all()
+
+    def _deliver(self, room, events):
+        by_event = OrderedDict()
+        for event, payload in events:
+            by_event.setdefault(event, []).append(payload)
+        for event, payloads in by_event.items():
+            if len(payloads) == 1:
+                self._emit(room, event, payloads[0])
+            else:
+                self._emit(room, f'{event}_batch', {'events': payloads})
+
+    def _emit(self, room, event, payload):
+        try:
+            if self.backend == 'local':
+                self.delivered.append((room, event, payload))
+            else:
+                self._server().emit(event, payload, room=room)
+            self.emits += 1
+        except Exception:
+            self.errors += 1
+            logger.exception('Failed to emit %s to %s', event, room)
+
+    def flush(self, timeout=5.0):
+        # Waits until everything queued so far has been emitted
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._depth or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def metrics(self):
+        # Prometheus exposition lines for instrumentation.Instrumentation
+        with self._condition:
+            depth = self._depth + self._busy
+        return [
+            '# HELP notification_queue_depth Notifications waiting to be emitted.',
+            '# TYPE notification_queue_depth gauge',
+            f'notification_queue_depth {depth}',
+            '# HELP notification_queue_capacity Queue size before notifications are dropped.',
+            '# TYPE notification_queue_capacity gauge',
+            f'notification_queue_capacity {self.capacity}',
+            '# HELP notifications_enqueued_total Notifications accepted into the queue.',
+            '# TYPE notifications_enqueued_total counter',
+            f'notifications_enqueued_total {self.enqueued}',
+            '# HELP notifications_coalesced_total Notifications merged into a pending emit to the same room.',
+            '# TYPE notifications_coalesced_total counter',
+            f'notifications_coalesced_total {self.coalesced}',
+            '# HELP notification_emits_total Socket.IO emits performed.',
+            '# TYPE notification_emits_total counter',
+            f'notification_emits_total {self.emits}',
+            '# HELP notifications_dropped_total Notifications dropped because the queue was full.',
+            '# TYPE notifications_dropped_total counter',
+            f'notifications_dropped_total {self.dropped}',
+            '# HELP notification_errors_total Emits that raised.',
+            '# TYPE notification_errors_total counter',
+            f'notification_errors_total {self.errors}',
+        ]
@@ -0,0 +1,80 @@
+import base64
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func, select, tuple_
+
+from models import db, Listing
+
+# Keyset pagination. A page is "the next N rows after (timestamp, id)",
+# which an index on those columns answers without an OFFSET, so page 1000
+# costs the same as page 1 and no COUNT(*) is needed. Listings page by
+# (created_at, id); messages and conversations pass their own columns.
+
+TOTAL_TTL_SECONDS = 60
+TOTAL_CACHE_SIZE = 1024
+# Largest per_page of the paged endpoints
+MAX_PAGE_SIZE = 100
+
+_totals = {}
+_totals_lock = threading.Lock()
+
+def encode_cursor(timestamp, row_id):
+    raw = f'{timestamp.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+def clamp_page_size(per_page, maximum=MAX_PAGE_SIZE):
+    # A per_page argument limited to 1..maximum
+    return max(1, min(per_page, maximum))
+
+def keyset_statement(stmt, cursor, per_page, columns=None):
+    # `stmt` narrowed to the page after `cursor`, plus one row to tell
+    # whether another page follows
+    timestamp_column, id_column = columns or (Listing.created_at, Listing.id)
+    if cursor:
+        stmt = stmt.filter(tuple_(timestamp_column, id_column) < tuple_(*decode_cursor(cursor)))
+    return stmt.order_by(timestamp_column.desc(), id_column.desc()).limit(per_page + 1)
+
+def keyset_result(rows, per_page, columns=None):
+    # (rows, next_cursor) from the rows keyset_statement() selected
+    timestamp_column, id_column = columns or (Listing.created_at, Listing.id)
+    if len(rows) > per_page:
+        last = rows[per_page - 1]
+        return rows[:per_page], encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
+    return rows, None
+
+def keyset_page(stmt, cursor, per_page, columns=None):
+    # Returns (rows, next_cursor), newest first; next_cursor is None on the
+    # last page. `columns` is the (timestamp, id) pair to page by, read back
+    # from the rows by attribute name; it defaults to the listing's.
+    rows = db.session.execute(keyset_statement(stmt, cursor, per_page, columns)).scalars().all()
+    return keyset_result(rows, per_page, columns)
+
+def approximate_total(stmt, key):
+    # Opt-in row count for cursor clients. Counts are cached per filter set
+    # for TOTAL_TTL_SECONDS, so they may lag recent writes by up to that long.
+    now = time.monotonic()
+    with _totals_lock:
+        cached = _totals.get(key)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    count = select(func.count()).select_from(Listing)
+    if stmt.whereclause is not None:
+        count = count.where(stmt.whereclause)
+    total = db.session.execute(count).scalar()
+
+    with _totals_lock:
+        if len(_totals) >= TOTAL_CACHE_SIZE:
+            _totals.clear()
+        _totals[key] = (total, now + TOTAL_TTL_SECONDS)
+    return total
@@ -0,0 +1,217 @@
+import hmac
+import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Password hashing. PASSWORD_HASH_METHOD picks the algorithm and its cost:
+# scrypt:N:r:p and pbkdf2:<digest>:<iterations> come with the standard
+# library (through Werkzeug); bcrypt:<rounds> and argon2id:<time>:<memory
+# KiB>:<parallelism> need the optional bcrypt or argon2-cffi package. The
+# stored hash records its own method, so changing the setting only affects
+# new hashes; a successful login with a hash of another method, or with a
+# plaintext password stored before hashing existed, returns a fresh hash
+# for the caller to save.
+#
+# Hashing is deliberately slow, so it runs on a pool of
+# PASSWORD_HASH_WORKERS threads (all four algorithms release the GIL) rather
+# than at the full concurrency of the request threads: at most that many
+# hashes compete with other requests for CPU, and their memory (32 MB per
+# scrypt:32768 hash) is bounded. Up to PASSWORD_HASH_QUEUE more wait for a
+# worker; beyond that submit() raises PasswordHasherBusy instead of letting
+# login latency grow without bound.
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+DEFAULTS = {
+    'scrypt': 'scrypt:32768:8:1',
+    'pbkdf2': 'pbkdf2:sha256:600000',
+    'bcrypt': 'bcrypt:12',
+    'argon2id': 'argon2id:3:65536:4',
+}
+# bcrypt only reads this many bytes of the password
+BCRYPT_MAX_BYTES = 72
+
+_ARGON2 = re.compile(r'^\$argon2id\$v=\d+\$m=(\d+),t=(\d+),p=(\d+)\$')
+
+class PasswordHasherBusy(Exception):
+    pass
+
+def _bcrypt():
+    try:
+        import bcrypt
+    except ImportError:
+        raise RuntimeError('PASSWORD_HASH_METHOD bcrypt needs the bcrypt package') from None
+    return bcrypt
+
+def _argon2(time_cost, memory_cost, parallelism):
+    try:
+        from argon2 import PasswordHasher
+    except ImportError:
+        raise RuntimeError('PASSWORD_HASH_METHOD argon2id needs the argon2-cffi package') from None
+    return PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+def normalize_method(method):
+    # 'scrypt' -> 'scrypt:32768:8:1'; raises ValueError for unknown methods
+    # and RuntimeError when the method's optional package is missing
+    name, *params = method.split(':')
+    if name not in DEFAULTS:
+        raise ValueError(f'Unknown PASSWORD_HASH_METHOD: {method}')
+    if not params:
+        method = DEFAULTS[name]
+        params = method.split(':')[1:]
+    expected = len(DEFAULTS[name].split(':')) - 1
+    numbers = params[1:] if name == 'pbkdf2' else params
+    if len(params) != expected or not all(number.isdigit() for number in numbers):
+        raise ValueError(f'PASSWORD_HASH_METHOD {name} takes {expected} parameters, like {DEFAULTS[name]}')
+    if name == 'bcrypt':
+        _bcrypt()
+    elif name == 'argon2id':
+        _argon2(1, 8, 1)
+    return method
+
+def stored_method(stored):
+    # Method of a stored hash in normalize_method() form; None for plaintext
+    if stored.startswith(('scrypt:', 'pbkdf2:')) and stored.count('$') == 2:
+        return stored.split('$', 1)[0]
+    if stored.startswith(('$2a$', '$2b$', '$2y$')):
+        return f'bcrypt:{int(stored[4:6])}'
+    match = _ARGON2.match(stored)
+    if match:
+        memory, time_cost, parallelism = match.groups()
+        return f'argon2id:{time_cost}:{memory}:{parallelism}'
+    return None
+
+def hash_password(password, method=DEFAULT_METHOD):
+    name, *params = method.split(':')
+    if name == 'bcrypt':
+        bcrypt = _bcrypt()
+        return bcrypt.hashpw(password.encode()[:BCRYPT_MAX_BYTES], bcrypt.gensalt(int(params[0]))).decode()
+    if name == 'argon2id':
+        return _argon2(*map(int, params)).hash(password)
+    return generate_password_hash(password, method)
+
+def check_password(stored, password):
+    if not isinstance(password, str):
+        return False
+    method = stored_method(stored)
+    if method is None:
+        # Stored before passwords were hashed
+        return hmac.compare_digest(stored.encode(), password.encode())
+    name = method.split(':')[0]
+    if name == 'bcrypt':
+        return _bcrypt().checkpw(password.encode()[:BCRYPT_MAX_BYTES], stored.encode())
+    if name == 'argon2id':
+        from argon2.exceptions import VerificationError
+        try:
+            return _argon2(1, 8, 1).verify(stored, password)
+        except VerificationError:
+            return False
+    return check_password_hash(stored, password)
+
+class PasswordHasher:
+    def __init__(self):
+        self.method = DEFAULT_METHOD
+        self.workers = os.cpu_count() or 1
+        self.queue_size = 4 * self.workers
+        self.operations = 0
+        self.seconds = 0.0
+        self.rehashed = 0
+        self.rejected = 0
+        self._in_flight = 0
+        self._executor = None
+        self._dummy = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = normalize_method(app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+        # 0 hashes on the request thread, still bounded by the queue size
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.queue_size = app.config.get('PASSWORD_HASH_QUEUE', 4 * max(1, self.workers))
+
+    def submit(self, fn, *args):
+        # Runs fn(*args) on the pool and returns its Future; raises
+        # PasswordHasherBusy when the workers and the queue are all taken
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self._in_flight += 1
+            if self.workers and self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(self._timed(fn, *args))
+            except Exception as e:
+                future.set_exception(e)
+            self._done(future)
+            return future
+        future = self._executor.submit(self._timed, fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.operations += 1
+                self.seconds += elapsed
+
+    def _done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def hash(self, password):
+        return self.submit(hash_password, password, self.method).result()
+
+    def verify(self, stored, password):
+        # (matches, new hash to store or None). `stored` is None for an
+        # unknown account, which is checked against a throwaway hash so the
+        # response takes as long as a wrong password.
+        return self.submit(self._verify, stored, password).result()
+
+    def _verify(self, stored, password):
+        if stored is None:
+            if self._dummy is None:
+                self._dummy = hash_password(secrets.token_hex(16), self.method)
+            check_password(self._dummy, password)
+            return False, None
+        if not check_password(stored, password):
+            return False, None
+        if stored_method(stored) == self.method:
+            return True, None
+        with self._lock:
+            self.rehashed += 1
+        return True, hash_password(password, self.method)
+
+    def metrics(self):
+        # Prometheus exposition lines for instrumentation.Instrumentation
+        with self._lock:
+            in_flight = self._in_flight
+        return [
+            '# HELP password_hash_in_flight Password hashes running or waiting for a worker.',
+            '# TYPE password_hash_in_flight gauge',
+            f'password_hash_in_flight {in_flight}',
+            '# HELP password_hash_capacity Hashes in flight before logins are turned away.',
+            '# TYPE password_hash_capacity gauge',
+            f'password_hash_capacity {self.workers + self.queue_size}',
+            '# HELP password_hash_operations_total Password hashes and verifications performed.',
+            '# TYPE password_hash_operations_total counter',
+            f'password_hash_operations_total {self.operations}',
+            '# HELP password_hash_seconds_total Worker time spent hashing.',
+            '# TYPE password_hash_seconds_total counter',
+            f'password_hash_seconds_total {self.seconds:.6f}',
+            '# HELP password_rehashes_total Logins that upgraded a plaintext or outdated hash.',
+            '# TYPE password_rehashes_total counter',
+            f'password_rehashes_total {self.rehashed}',
+            '# HELP password_hash_rejected_total Hashes refused because the queue was full.',
+            '# TYPE password_hash_rejected_total counter',
+            f'password_hash_rejected_total {self.rejected}',
+        ]
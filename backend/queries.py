@@ -0,0 +1,114 @@
+from sqlalchemy import select, tuple_, union_all
+from sqlalchemy.orm import joinedload, selectinload, load_only
+
+from models import (
+    User, Listing, ListingImage, Favorite, Message, PropertyFeature, Conversation, ConversationParticipant
+)
+
+# Every list endpoint eager-loads the relationships its payload touches, so a
+# page costs the same number of queries whether it holds 1 row or 100:
+# many-to-one rows (owner, sender, ...) are joined in, collections (images)
+# are fetched with one extra SELECT ... WHERE listing_id IN (...).
+
+def _card_images():
+    return selectinload(Listing.images).load_only(
+        ListingImage.listing_id, ListingImage.image_url, ListingImage.content_hash
+    )
+
+def listing_cards_query(status='active'):
+    # Payload of GET /api/listings
+    return select(Listing).filter_by(status=status).options(
+        load_only(
+            Listing.owner_id, Listing.title, Listing.description, Listing.price,
+            Listing.property_type, Listing.bedrooms, Listing.bathrooms, Listing.square_feet,
+            Listing.address, Listing.city, Listing.state, Listing.zip_code,
+            Listing.latitude, Listing.longitude, Listing.status, Listing.created_at,
+            Listing.favorite_count
+        ),
+        joinedload(Listing.owner).load_only(User.name, User.phone),
+        _card_images()
+    )
+
+def search_cards_query():
+    # Payload of GET /api/search
+    return select(Listing).filter_by(status='active').options(
+        load_only(
+            Listing.title, Listing.price, Listing.property_type, Listing.bedrooms,
+            Listing.bathrooms, Listing.city, Listing.state, Listing.latitude,
+            Listing.longitude, Listing.created_at, Listing.favorite_count
+        ),
+        _card_images()
+    )
+
+def _detail_options():
+    return (
+        joinedload(Listing.owner).load_only(User.name, User.phone, User.email),
+        selectinload(Listing.images).load_only(
+            ListingImage.listing_id, ListingImage.image_url, ListingImage.content_hash, ListingImage.is_primary
+        ),
+        selectinload(Listing.features).load_only(
+            PropertyFeature.listing_id, PropertyFeature.feature_name, PropertyFeature.feature_value
+        )
+    )
+
+def listing_detail_query(listing_id):
+    # Payload of GET /api/listings/<id>
+    return select(Listing).filter_by(id=listing_id).options(*_detail_options())
+
+def listings_detail_query(listing_ids):
+    # Payload of GET /api/listings?ids=
+    return select(Listing).where(Listing.id.in_(listing_ids)).options(*_detail_options())
+
+def favorites_query(user_id):
+    # Payload of GET /api/favorites
+    return select(Favorite).filter_by(user_id=user_id).options(
+        load_only(Favorite.listing_id, Favorite.created_at),
+        joinedload(Favorite.listing).load_only(
+            Listing.title, Listing.price, Listing.property_type, Listing.city, Listing.favorite_count
+        ).options(_card_images())
+    )
+
+def mailbox_query(user_id, limit, before=None):
+    # (id, created_at) of the `limit` newest messages the user sent or
+    # received, older than the (created_at, id) pair `before`. One UNION ALL
+    # branch per side lets SQLite merge ix_message_sender_created_at and
+    # ix_message_receiver_created_at in order; an OR of the two sorts all of
+    # the user's messages in a temp B-tree. Messages to oneself come from the
+    # sender branch only.
+    branches = [
+        select(Message.id, Message.created_at).filter(Message.sender_id == user_id),
+        select(Message.id, Message.created_at).filter(Message.receiver_id == user_id, Message.sender_id != user_id),
+    ]
+    if before is not None:
+        branches = [branch.filter(tuple_(Message.created_at, Message.id) < tuple_(*before)) for branch in branches]
+    page = union_all(*branches)
+    return page.order_by(page.selected_columns.created_at.desc(), page.selected_columns.id.desc()).limit(limit)
+
+def messages_query(message_ids):
+    # Payload of GET /api/messages for the ids mailbox_query() picked
+    return select(Message).filter(Message.id.in_(message_ids)).options(
+        joinedload(Message.sender).load_only(User.name),
+        joinedload(Message.receiver).load_only(User.name),
+        joinedload(Message.listing).load_only(Listing.title)
+    )
+
+def inbox_query(user_id):
+    # Payload of GET /api/conversations; page by (last_message_at, conversation_id)
+    return select(ConversationParticipant).filter_by(user_id=user_id).options(
+        joinedload(ConversationParticipant.counterpart).load_only(User.name),
+        joinedload(ConversationParticipant.conversation).load_only(
+            Conversation.listing_id, Conversation.last_message_id
+        ).options(
+            joinedload(Conversation.listing).load_only(Listing.title),
+            joinedload(Conversation.last_message).load_only(
+                Message.sender_id, Message.subject, Message.content, Message.is_read, Message.created_at
+            )
+        )
+    )
+
+def thread_query(conversation_id):
+    # Payload of GET /api/conversations/<id>/messages; page by (created_at, id)
+    return select(Message).filter_by(conversation_id=conversation_id).options(
+        joinedload(Message.sender).load_only(User.name),
+        joinedload(Message.receiver).load_only(User.name)
+    )
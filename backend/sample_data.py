@@ -1,42 +1,46 @@
 from models import db, User, Listing, ListingImage, Favorite, Message, PropertyFeature
 from datetime import datetime, timedelta
+from messaging import sync_conversations
+from passwords import DEFAULT_METHOD, hash_password
+from favorites import sync_favorite_counts
 import random
 
-def create_sample_data():
-    # Create users
+def create_sample_data(password_method=DEFAULT_METHOD):
+    # Create users; they share a password, so one hash serves all of them
+    password = hash_password('password123', password_method)
     users = [
         User(
             name='Max Mustermann',
             email='max@example.com',
-            password='password123',
+            password=password,
             phone='+49-30-123456',
             user_type='buyer'
         ),
         User(
             name='Sabine Müller',
             email='sabine@example.com',
-            password='password123',
+            password=password,
             phone='+49-89-654321',
             user_type='seller'
         ),
         User(
             name='Thomas Schmidt',
             email='thomas@example.com',
-            password='password123',
+            password=password,
             phone='+49-40-987654',
             user_type='agent'
         ),
         User(
             name='Julia Becker',
             email='julia@example.com',
-            password='password123',
+            password=password,
             phone='+49-69-112233',
             user_type='buyer'
         ),
         User(
             name='David Wagner',
             email='david@example.com',
-            password='password123',
+            password=password,
             phone='+49-221-445566',
             user_type='seller'
         )
@@ -58,6 +62,7 @@ def create_sample_data():
         ('Dresden', 'Altmarkt', '01067', 51.0504, 13.7373),
         ('Hannover', 'Kröpcke', '30159', 52.3759, 9.7320)
     ]
+    
     # Sample listings in German cities
     listings = [
         Listing(
@@ -98,12 +103,12 @@ def create_sample_data():
             owner_id=2,
             title='Altbauwohnung an der Alster',
             description='Charmante Altbauwohnung mit hohen Decken und Stuck, direkt an der Außenalster.',
-            price=890000.0,
+            price=850000.0,
             property_type='apartment',
             bedrooms=4,
             bathrooms=2,
             square_feet=140,
-            address='Jungfernstieg 5',
+            address='Alsterufer 8',
             city='Hamburg',
             state='Hamburg',
             zip_code='20095',
@@ -114,13 +119,13 @@ def create_sample_data():
         Listing(
             owner_id=5,
             title='Penthouse mit Skyline-Blick',
-            description='Modernes Penthouse mit Dachterrasse und Blick auf die Frankfurter Skyline.',
-            price=1750000.0,
+            description='Luxuriöses Penthouse mit Panoramablick über die Frankfurter Skyline. Moderne Ausstattung.',
+            price=1800000.0,
             property_type='apartment',
-            bedrooms=5,
+            bedrooms=3,
             bathrooms=3,
             square_feet=180,
-            address='Zeil 100',
+            address='Zeil 123',
             city='Frankfurt',
             state='Hessen',
             zip_code='60313',
@@ -130,16 +135,16 @@ def create_sample_data():
         ),
         Listing(
             owner_id=2,
-            title='Familienhaus am Dom',
-            description='Geräumiges Einfamilienhaus in bester Lage, fußläufig zum Kölner Dom.',
-            price=950000.0,
+            title='Stadtvilla im Rheinviertel',
+            description='Elegante Stadtvilla im exklusiven Rheinviertel. Großer Garten, Garage, hochwertige Ausstattung.',
+            price=1200000.0,
             property_type='house',
             bedrooms=5,
             bathrooms=3,
-            square_feet=200,
-            address='Domkloster 2',
+            square_feet=280,
+            address='Rheinallee 45',
             city='Köln',
-            state='NRW',
+            state='Nordrhein-Westfalen',
             zip_code='50667',
             latitude=50.9413,
             longitude=6.9583,
@@ -147,48 +152,31 @@ def create_sample_data():
         ),
         Listing(
             owner_id=5,
-            title='Stilvolle Wohnung an der Königsallee',
-            description='Elegante 2-Zimmer-Wohnung mit Balkon und Blick auf die Königsallee.',
-            price=720000.0,
-            property_type='apartment',
-            bedrooms=2,
-            bathrooms=1,
-            square_feet=90,
-            address='Königsallee 45',
-            city='Düsseldorf',
-            state='NRW',
-            zip_code='40212',
-            latitude=51.2254,
-            longitude=6.7763,
-            status='active'
-        ),
-        Listing(
-            owner_id=2,
-            title='Reihenhaus am Schlossplatz',
-            description='Modernes Reihenhaus mit Terrasse und Garten, zentral in Stuttgart gelegen.',
-            price=830000.0,
+            title='Stadthaus am Kröpcke',
+            description='Moderne Stadthaus in bester Lage. Offener Grundriss, Terrasse, Tiefgarage.',
+            price=950000.0,
             property_type='house',
             bedrooms=4,
             bathrooms=2,
-            square_feet=130,
-            address='Schlossplatz 8',
-            city='Stuttgart',
-            state='Baden-Württemberg',
-            zip_code='70173',
-            latitude=48.7784,
-            longitude=9.1806,
+            square_feet=200,
+            address='Kröpcke 7',
+            city='Hannover',
+            state='Niedersachsen',
+            zip_code='30159',
+            latitude=52.3759,
+            longitude=9.7320,
             status='active'
         ),
         Listing(
-            owner_id=5,
+            owner_id=2,
             title='Loftwohnung am Augustusplatz',
-            description='Großzügige Loftwohnung mit moderner Ausstattung und Blick auf den Augustusplatz.',
-            price=670000.0,
+            description='Industrielles Loft in einem umgebauten Fabrikgebäude. Hohe Decken, große Fenster.',
+            price=750000.0,
             property_type='apartment',
-            bedrooms=3,
+            bedrooms=2,
             bathrooms=2,
-            square_feet=120,
-            address='Augustusplatz 1',
+            square_feet=160,
+            address='Augustusplatz 15',
             city='Leipzig',
             state='Sachsen',
             zip_code='04109',
@@ -197,49 +185,31 @@ def create_sample_data():
             status='active'
         ),
         Listing(
-            owner_id=2,
-            title='Dachgeschosswohnung am Altmarkt',
-            description='Helle Dachgeschosswohnung mit großer Dachterrasse im Herzen von Dresden.',
-            price=610000.0,
+            owner_id=5,
+            title='Barockwohnung am Altmarkt',
+            description='Historische Wohnung in einem Barockgebäude. Stuckdecken, Parkett, antike Details.',
+            price=680000.0,
             property_type='apartment',
-            bedrooms=2,
+            bedrooms=3,
             bathrooms=1,
-            square_feet=85,
-            address='Altmarkt 10',
+            square_feet=120,
+            address='Altmarkt 22',
             city='Dresden',
             state='Sachsen',
             zip_code='01067',
             latitude=51.0504,
             longitude=13.7373,
             status='active'
-        ),
-        Listing(
-            owner_id=5,
-            title='Stadthaus am Kröpcke',
-            description='Stilvolles Stadthaus mit Garten und Garage, zentral in Hannover.',
-            price=990000.0,
-            property_type='house',
-            bedrooms=5,
-            bathrooms=3,
-            square_feet=180,
-            address='Kröpcke 3',
-            city='Hannover',
-            state='Niedersachsen',
-            zip_code='30159',
-            latitude=52.3759,
-            longitude=9.7320,
-            status='active'
         )
     ]
+    
     for listing in listings:
         db.session.add(listing)
     db.session.commit()
 
-    # Pool of real house images
+    # Add images to listings
     house_images = [
         'https://images.pexels.com/photos/106399/pexels-photo-106399.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/259588/pexels-photo-259588.jpeg?auto=compress&w=800',
-        'https://images.pexels.com/photos/534151/pexels-photo-534151.jpeg?auto=compress&w=800',
         'https://images.pexels.com/photos/1396122/pexels-photo-1396122.jpeg?auto=compress&w=800',
         'https://images.pexels.com/photos/210617/pexels-photo-210617.jpeg?auto=compress&w=800',
         'https://images.pexels.com/photos/323780/pexels-photo-323780.jpeg?auto=compress&w=800',
@@ -253,6 +223,7 @@ def create_sample_data():
         'https://images.pexels.com/photos/259588/pexels-photo-259588.jpeg?auto=compress&w=800',
         'https://images.pexels.com/photos/259600/pexels-photo-259600.jpeg?auto=compress&w=800',
     ]
+    
     # Add multiple images per listing
     listing_objs = Listing.query.all()
     for i, listing in enumerate(listing_objs):
@@ -296,6 +267,8 @@ def create_sample_data():
     
     for favorite in favorites:
         db.session.add(favorite)
+    db.session.flush()
+    sync_favorite_counts(db.session.connection())
     db.session.commit()
     
     # Create messages
@@ -337,5 +310,8 @@ def create_sample_data():
     for message in messages:
         db.session.add(message)
     db.session.commit()
+    # Group the messages into conversations and set the unread counters
+    sync_conversations(db.session.connection())
+    db.session.commit()
     
-    print("Sample data created successfully!") 
\ No newline at end of file
+    print("Sample data created successfully!")
@@ -0,0 +1,126 @@
+import json
+import re
+from bisect import bisect_right
+
+from sqlalchemy import select
+from werkzeug.datastructures import MultiDict
+
+from models import db, SavedSearch, SavedSearchKey
+from geo import parse_geo_args
+from matching import _fold, city_key, city_keys, listing_may_match
+
+# Saved searches are /api/search filter sets stored per user. To find the
+# searches a new or changed listing matches without evaluating all of them,
+# each search is also written to saved_search_key as the (city key,
+# property type, price band) combinations it can match, '' and -1 standing
+# for "any". A write looks up the few combinations the listing falls into
+# through the index, then checks only those candidates with the full filter
+# evaluator. City filters match as substrings, as in /api/search, so a saved
+# city is keyed by its first CITY_KEY_CHARS folded characters and a listing
+# is looked up by every substring of its city up to that length; keyword and
+# location filters are checked on the candidates.
+
+SEARCH_FILTERS = (
+    'q', 'city', 'property_type', 'min_price', 'max_price', 'bedrooms', 'near', 'radius_km', 'bbox'
+)
+MAX_SEARCHES_PER_USER = 50
+
+# Lower edges of the indexed price bands; the last band is open-ended
+PRICE_BAND_EDGES = (
+    0, 50000, 100000, 150000, 200000, 300000, 400000, 500000, 750000,
+    1000000, 1500000, 2000000, 3000000, 5000000
+)
+ANY_CITY = ''
+ANY_TYPE = ''
+ANY_BAND = -1
+
+def _words(value):
+    return re.findall(r'[^\W_]+', _fold(value))
+
+def price_band(price):
+    return max(0, bisect_right(PRICE_BAND_EDGES, price) - 1)
+
+def _number(filters, name, kind):
+    return kind(filters[name]) if filters.get(name) else None
+
+def normalize_filters(data):
+    # Keeps the known filters as non-empty strings, like request arguments;
+    # raises ValueError for malformed values.
+    if not isinstance(data, dict):
+        raise ValueError('filters must be an object')
+    filters = {}
+    for name in SEARCH_FILTERS:
+        value = data.get(name)
+        if value is None or str(value).strip() == '':
+            continue
+        filters[name] = str(value).strip()
+    for name, kind in (('min_price', float), ('max_price', float), ('bedrooms', int)):
+        try:
+            number = _number(filters, name, kind)
+        except ValueError:
+            raise ValueError(f'{name} must be a number')
+        if number is not None and number < 0:
+            raise ValueError(f'{name} must not be negative')
+    parse_geo_args(MultiDict(filters))
+    if 'city' in filters and not _words(filters['city']):
+        raise ValueError('city must contain a word')
+    if not filters:
+        raise ValueError('At least one filter is required')
+    return filters
+
+def index_keys(filters):
+    # (city_key, property_type, price_band) rows for one saved search
+    city = city_key(filters['city']) if filters.get('city') else ANY_CITY
+    property_type = filters.get('property_type', ANY_TYPE)
+    min_price = _number(filters, 'min_price', float)
+    max_price = _number(filters, 'max_price', float)
+    if min_price or max_price:
+        low = price_band(min_price or 0)
+        high = price_band(max_price) if max_price else len(PRICE_BAND_EDGES) - 1
+        bands = range(low, high + 1)
+    else:
+        bands = [ANY_BAND]
+    return [(city, property_type, band) for band in bands]
+
+def save_search(user_id, name, filters):
+    # Adds the search and its index rows; the caller commits
+    search = SavedSearch(user_id=user_id, name=name, filters=json.dumps(filters, sort_keys=True))
+    search.keys = [
+        SavedSearchKey(city_key=city, property_type=property_type, price_band=band)
+        for city, property_type, band in index_keys(filters)
+    ]
+    db.session.add(search)
+    db.session.flush()
+    return search
+
+def candidate_query(snapshot):
+    # Saved searches whose index rows admit the listing: every (city key,
+    # type, band) combination the listing falls into
+    cities = sorted(city_keys(snapshot['city'])) + [ANY_CITY]
+    types = [ANY_TYPE] + ([snapshot['property_type']] if snapshot['property_type'] else [])
+    bands = [ANY_BAND, price_band(snapshot['price'])]
+    keys = SavedSearchKey.__table__.c
+    matching_ids = select(keys.saved_search_id).where(
+        keys.city_key.in_(cities), keys.property_type.in_(types), keys.price_band.in_(bands)
+    )
+    return select(SavedSearch.id, SavedSearch.user_id, SavedSearch.name, SavedSearch.filters).where(
+        SavedSearch.id.in_(matching_ids)
+    )
+
+def matching_searches(before, after):
+    # Saved searches the listing newly matches after a write; `before` and
+    # `after` are matching.listing_snapshot() dicts, `before` None for a new
+    # listing. The owner's own searches are skipped.
+    if after is None or after['status'] != 'active':
+        return []
+    matches = []
+    for row in db.session.execute(candidate_query(after)):
+        if row.user_id == after['owner_id']:
+            continue
+        args = MultiDict(json.loads(row.filters))
+        if not listing_may_match(args, after, 'active'):
+            continue
+        if before is not None and listing_may_match(args, before, 'active'):
+            continue
+        matches.append(row)
+    return matches
@@ -0,0 +1,127 @@
+import re
+
+from sqlalchemy import column, literal_column, select, table, text
+
+from models import db, Listing
+
+# Full-text index behind /api/search. On SQLite this is an FTS5 table that
+# shadows the indexed columns of `listing` (external content) and is kept in
+# sync by triggers, so every writer -- create_listing, update_listing, bulk
+# jobs or a manual UPDATE -- maintains it without application code. Other
+# databases fall back to the old ILIKE scan.
+
+FTS_TABLE = 'listing_fts'
+FTS_COLUMNS = ('title', 'description', 'address', 'city')
+# bm25 column weights, in FTS_COLUMNS order
+FTS_WEIGHTS = (10.0, 1.0, 3.0, 5.0)
+RANK_WINDOW = 2000
+
+_fts = table(FTS_TABLE, column('rowid'))
+_ready = {}
+
+def _values(prefix):
+    return ', '.join(f'{prefix}.{name}' for name in FTS_COLUMNS)
+
+def _ddl():
+    columns = ', '.join(FTS_COLUMNS)
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            {columns}, content='listing', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON listing BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {_values('new')});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON listing BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns})
+            VALUES ('delete', old.id, {_values('old')});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columns} ON listing BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns})
+            VALUES ('delete', old.id, {_values('old')});
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {_values('new')});
+        END""",
+    ]
+
+def _table_exists(conn, name):
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': name}
+    ).first() is not None
+
+def create_search_index():
+    # Creates the index and its triggers if missing. A freshly created index
+    # over an existing database is populated immediately.
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        existed = _table_exists(conn, FTS_TABLE)
+        for statement in _ddl():
+            conn.execute(text(statement))
+        if not existed:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    _ready[engine.url] = True
+    return True
+
+def rebuild_search_index():
+    if not create_search_index():
+        return False
+    with db.engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+    return True
+
+def search_index_ready():
+    engine = db.engine
+    if engine.url not in _ready:
+        ready = False
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as conn:
+                ready = _table_exists(conn, FTS_TABLE)
+        _ready[engine.url] = ready
+    return _ready[engine.url]
+
+def match_expression(query):
+    # Every word must match, the last one as a prefix so results update per
+    # keystroke. Quoting each token keeps FTS5 operators in user input inert.
+    tokens = re.findall(r'\w+', query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def apply_keyword_search(stmt, query, indexed=None):
+    # Must be applied after all other filters on `stmt`. `indexed` defaults
+    # to whether the database has the full-text index.
+    if indexed is None:
+        indexed = search_index_ready()
+    if not indexed:
+        return stmt.filter(
+            db.or_(
+                Listing.title.ilike(f'%{query}%'),
+                Listing.description.ilike(f'%{query}%'),
+                Listing.address.ilike(f'%{query}%'),
+                Listing.city.ilike(f'%{query}%')
+            )
+        )
+
+    expression = match_expression(query)
+    if expression is None:
+        return stmt.filter(db.false())
+
+    # Only the newest RANK_WINDOW matches that pass the other filters are
+    # scored, so the cost of a query is bounded by the window instead of by
+    # how many listings contain a common word.
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    candidates = select(
+        Listing.id.label('id'),
+        literal_column(f'bm25({FTS_TABLE}, {weights})').label('score')
+    ).join(_fts, _fts.c.rowid == Listing.id).filter(
+        literal_column(FTS_TABLE).op('MATCH')(expression)
+    )
+    if stmt.whereclause is not None:
+        candidates = candidates.filter(stmt.whereclause)
+    candidates = candidates.order_by(_fts.c.rowid.desc()).limit(RANK_WINDOW).subquery()
+
+    return stmt.join(candidates, candidates.c.id == Listing.id).order_by(candidates.c.score)
@@ -0,0 +1,55 @@
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# The app binds its database and reads its configuration at import, so the
+# environment is set before anything imports it: a scratch SQLite file, no
+# Socket.IO server, notifications recorded in memory, no response cache
+# (tests count and compare what the views do) and a cheap password hash.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix='real-estate-tests-')
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(SCRATCH, 'test.db')}",
+    SOCKETIO_SERVER='0',
+    NOTIFY_BACKEND='local',
+    RESPONSE_CACHE_BACKEND='none',
+    PASSWORD_HASH_METHOD='pbkdf2:sha256:1000',
+    IMAGE_STORE_DIR=os.path.join(SCRATCH, 'images'),
+    INIT_DB_ON_STARTUP='0',
+)
+sys.path.insert(0, BACKEND_DIR)
+
+from app import app as flask_app, initialize_database, passwords  # noqa: E402
+from generator import PASSWORD, generate  # noqa: E402
+
+@pytest.fixture(scope='session')
+def app():
+    # Migrated schema with a small synthetic data set, shared by all tests;
+    # tests that write create their own users rather than editing these rows
+    initialize_database()
+    with flask_app.app_context():
+        generate(users=60, listings=120, favorites_per_user=2, messages=60, seed=7,
+                 password_method=passwords.method)
+    yield flask_app
+    shutil.rmtree(SCRATCH, ignore_errors=True)
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def register(client):
+    # register() -> (user id, Authorization headers) of a new buyer
+    def register(user_type='buyer'):
+        response = client.post('/api/auth/register', json={
+            'name': 'Test User', 'email': f'{uuid.uuid4().hex}@example.com', 'password': PASSWORD,
+            'user_type': user_type,
+        })
+        assert response.status_code == 200, response.get_data(as_text=True)
+        data = response.get_json()
+        return data['user']['id'], {'Authorization': f"Bearer {data['token']}"}
+    return register
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+
+import pytest
+
+from cache import FileBackend
+
+pytest.importorskip('aiosqlite')
+
+@pytest.fixture(scope='module')
+def asgi(app):
+    return pytest.importorskip('asgi')
+
+def _get_all(asgi, *queries):
+    # [(headers, body)] of GET /api/listings with each query string, on one
+    # event loop; pooled connections belong to the loop and close with it
+    async def run():
+        try:
+            return [await _get(asgi, query) for query in queries]
+        finally:
+            await asgi.engine.dispose()
+    return asyncio.run(run())
+
+async def _get(asgi, query):
+    scope = {'type': 'http', 'method': 'GET', 'path': '/api/listings', 'query_string': query.encode(), 'headers': []}
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.http(scope, receive, send)
+    return dict(sent[0]['headers']), sent[1]['body']
+
+def test_page_size_is_clamped_as_in_flask(asgi, client):
+    # Answered on the event loop, not handed to Flask
+    prepared = asgi._listings_statement(asgi.MultiDict({'page': '1', 'per_page': '1000'}))
+    assert prepared is not None and prepared[3] == 100
+    [(_, body)] = _get_all(asgi, 'page=1&per_page=1000')
+    assert body == client.get('/api/listings?page=1&per_page=100').get_data()
+
+def test_file_cache_runs_off_the_event_loop(asgi, tmp_path, monkeypatch):
+    backend = FileBackend(str(tmp_path / 'cache'))
+    threads = []
+    for name in ('get', 'set'):
+        method = getattr(backend, name)
+        monkeypatch.setattr(backend, name, lambda *args, _method=method: threads.append(
+            threading.current_thread()
+        ) or _method(*args))
+    monkeypatch.setattr(asgi.response_cache, 'backend', backend)
+
+    (miss, body), (hit, cached) = _get_all(asgi, 'per_page=3', 'per_page=3')
+    assert (miss[b'x-cache'], hit[b'x-cache']) == (b'MISS', b'HIT')
+    assert cached == body
+    assert threads and threading.main_thread() not in threads
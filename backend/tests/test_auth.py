@@ -0,0 +1,52 @@
+import uuid
+
+import pytest
+
+from app import passwords
+from models import db, User
+from passwords import check_password, hash_password, stored_method
+
+PASSWORD = 'correct horse'
+
+@pytest.mark.parametrize('path', ['/api/auth/login', '/api/auth/register'])
+@pytest.mark.parametrize('password', [12345678, None, ['password123'], {'password': 'x'}])
+def test_non_string_passwords_are_rejected(client, path, password):
+    email = f'{uuid.uuid4().hex}@example.com'
+    response = client.post(path, json={'name': 'Test', 'email': email, 'password': password})
+    assert response.status_code == 400
+    assert check_password(hash_password('12345678', passwords.method), password) is False
+
+def test_missing_credentials_are_rejected(client):
+    assert client.post('/api/auth/login', json={'password': PASSWORD}).status_code == 400
+    assert client.post('/api/auth/login', json=[PASSWORD]).status_code == 400
+
+@pytest.fixture(params=['plaintext', 'old_method'])
+def user(app, request):
+    # (email, stored password) of a user whose password predates the current method
+    stored = PASSWORD if request.param == 'plaintext' else hash_password(PASSWORD, 'pbkdf2:sha256:500')
+    email = f'{uuid.uuid4().hex}@example.com'
+    with app.app_context():
+        db.session.add(User(name='Old User', email=email, password=stored, user_type='buyer'))
+        db.session.commit()
+    return email, stored
+
+def _stored(app, email):
+    with app.app_context():
+        return db.session.query(User.password).filter_by(email=email).scalar()
+
+def test_failed_login_keeps_the_stored_password(app, client, user):
+    email, stored = user
+    response = client.post('/api/auth/login', json={'email': email, 'password': 'wrong'})
+    assert response.status_code == 401
+    assert _stored(app, email) == stored
+
+def test_successful_login_upgrades_the_stored_password(app, client, user):
+    email, stored = user
+    response = client.post('/api/auth/login', json={'email': email, 'password': PASSWORD})
+    assert response.status_code == 200
+    upgraded = _stored(app, email)
+    assert upgraded != stored and stored_method(upgraded) == passwords.method
+    assert check_password(upgraded, PASSWORD)
+    response = client.post('/api/auth/login', json={'email': email, 'password': PASSWORD})
+    assert response.status_code == 200
+    assert _stored(app, email) == upgraded
@@ -0,0 +1,82 @@
+import os
+import pickle
+import time
+import uuid
+
+import pytest
+
+from app import response_cache
+from cache import FileBackend, MemoryBackend
+
+def _entry(key):
+    return {
+        'key': key, 'body': b'{"listings": []}', 'status': 200, 'mimetype': 'application/json',
+        'expires': time.time() + 60, 'ids': {1, 2}, 'owners': {3}, 'filters': [('city', 'Berlin')],
+        'status_filter': 'active', 'encodings': {'gzip': b'\x1f\x8b\x08\x00'},
+        'tags': ['listing:1', 'listing:2', 'owner:3', 'city:ber'],
+    }
+
+def test_file_backend_round_trip(tmp_path):
+    backend = FileBackend(str(tmp_path / 'cache'))
+    key = '/api/listings?city=Berlin'
+    backend.set(key, _entry(key))
+    loaded = backend.get(key)
+    assert loaded['body'] == b'{"listings": []}'
+    assert loaded['ids'] == {1, 2} and loaded['owners'] == {3}
+    assert loaded['encodings'] == {'gzip': b'\x1f\x8b\x08\x00'}
+    assert backend.invalidate(['listing:2'], lambda entry: 2 in entry['ids']) == 1
+
+def test_file_backend_ignores_pickles(tmp_path):
+    backend = FileBackend(str(tmp_path / 'cache'))
+    key = '/api/listings'
+    with open(backend._path(key), 'wb') as f:
+        pickle.dump(_entry(key), f)
+    assert backend.get(key) is None
+
+def test_file_backend_directory_is_private(tmp_path):
+    FileBackend(str(tmp_path / 'cache'))
+    assert os.stat(tmp_path / 'cache').st_mode & 0o777 == 0o700
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(ValueError):
+        FileBackend(str(shared))
+
+@pytest.fixture(params=['memory', 'file'])
+def backend(request, tmp_path):
+    return MemoryBackend() if request.param == 'memory' else FileBackend(str(tmp_path / 'cache'))
+
+def test_invalidate_only_evaluates_tagged_entries(backend):
+    for i in range(50):
+        key = f'/api/listings/{i}'
+        backend.set(key, dict(_entry(key), ids={i}, owners=set(), tags=[f'listing:{i}']))
+    evaluated = []
+    assert backend.invalidate(['listing:7', 'listing:99'], lambda entry: evaluated.append(entry['key']) or True) == 1
+    assert evaluated == ['/api/listings/7']
+    assert backend.get('/api/listings/7') is None and backend.get('/api/listings/8') is not None
+    # A replaced entry is only indexed under its new tags
+    key = '/api/listings/8'
+    backend.set(key, dict(_entry(key), ids={8}, owners=set(), tags=['listing:80']))
+    assert backend.invalidate(['listing:8'], lambda entry: True) == 0
+    assert backend.invalidate(['listing:80'], lambda entry: True) == 1
+    assert len(backend) == 48
+
+@pytest.fixture
+def cache(monkeypatch, backend):
+    monkeypatch.setattr(response_cache, 'backend', backend)
+    return backend
+
+def test_listing_update_evicts_only_pages_showing_it(client, register, cache):
+    _, headers = register('agent')
+    tag = uuid.uuid4().hex[:8]
+    ids = {}
+    for city in (f'Ost{tag}', f'West{tag}'):
+        response = client.post('/api/listings', json={'title': 'Cached', 'price': 200000, 'city': city}, headers=headers)
+        ids[city] = response.get_json()['id']
+    east, west = ids
+    pages = [f'/api/listings/{ids[east]}', f'/api/listings?city={east}', f'/api/listings/{ids[west]}', f'/api/listings?city={west}']
+    for page in pages:
+        assert client.get(page).headers['X-Cache'] == 'MISS'
+        assert client.get(page).headers['X-Cache'] == 'HIT'
+    client.put(f'/api/listings/{ids[east]}', json={'price': 190000}, headers=headers)
+    assert [client.get(page).headers['X-Cache'] for page in pages] == ['MISS', 'MISS', 'HIT', 'HIT']
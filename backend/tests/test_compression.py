@@ -0,0 +1,71 @@
+import gzip
+import json
+import time
+
+import pytest
+
+from app import LISTINGS_CACHE_DEFAULTS, compression, response_cache
+from cache import MemoryBackend
+from compression import _brotli
+
+PAGE = '/api/listings?per_page=20'
+ENCODINGS = [
+    'gzip',
+    pytest.param('br', marks=pytest.mark.skipif(_brotli() is None, reason='brotli is not installed')),
+]
+
+def _decode(response):
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'gzip':
+        return gzip.decompress(response.data)
+    if encoding == 'br':
+        return _brotli().decompress(response.data)
+    assert encoding is None
+    return response.data
+
+def test_identity(client):
+    response = client.get(PAGE)
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(response.data)['listings']
+    response = client.get(PAGE, headers={'Accept-Encoding': 'gzip;q=0, identity'})
+    assert 'Content-Encoding' not in response.headers
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_negotiates_encoding(client, encoding):
+    identity = client.get(PAGE).data
+    response = client.get(PAGE, headers={'Accept-Encoding': f'{encoding}, deflate'})
+    assert response.headers['Content-Encoding'] == encoding
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(response.data) < len(identity)
+    assert _decode(response) == identity
+
+def test_prefers_br_when_both_are_accepted(client):
+    response = client.get(PAGE, headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == ('br' if _brotli() else 'gzip')
+
+def test_small_bodies_are_sent_as_is(client, monkeypatch):
+    monkeypatch.setattr(compression, 'min_bytes', 10 ** 9)
+    response = client.get(PAGE, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_cache_hits_send_precompressed_bodies(client, monkeypatch, encoding):
+    backend = MemoryBackend()
+    monkeypatch.setattr(response_cache, 'backend', backend)
+    miss = client.get(PAGE, headers={'Accept-Encoding': 'gzip'})
+    assert miss.headers['X-Cache'] == 'MISS'
+    key, _ = response_cache.request_key('/api/listings', miss.request.args, LISTINGS_CACHE_DEFAULTS)
+    deadline = time.time() + 5
+    while set(backend.get(key)['encodings']) != set(compression.encodings):
+        assert time.time() < deadline, 'background compression did not finish'
+        time.sleep(0.01)
+    compressed = dict(compression.compressed)
+    hit = client.get(PAGE, headers={'Accept-Encoding': encoding})
+    assert hit.headers['X-Cache'] == 'HIT'
+    assert hit.headers['Content-Encoding'] == encoding
+    assert 'Accept-Encoding' in hit.headers['Vary']
+    assert hit.data == backend.get(key)['encodings'][encoding]
+    assert _decode(hit) == _decode(miss)
+    assert compression.compressed == compressed
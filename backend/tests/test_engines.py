@@ -0,0 +1,47 @@
+import sqlite3
+import time
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+from models import db, Listing, User
+
+@pytest.fixture
+def read_engine(app, monkeypatch):
+    # DATABASE_READ_URL=readonly: read-only connections to the test database
+    engines = app.extensions['engines']
+    engine = engines._create_read_engine('readonly')
+    monkeypatch.setattr(engines, 'read_engine', engine)
+    yield engine
+    engine.dispose()
+
+def test_reads_proceed_while_a_writer_holds_the_lock(app, read_engine):
+    with app.app_context():
+        path = db.engine.url.database
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+    writer = sqlite3.connect(path, isolation_level=None)
+    try:
+        # An exclusive lock shuts readers out of a rollback-journal database;
+        # under WAL they keep reading the last commit
+        writer.execute('BEGIN EXCLUSIVE')
+        writer.execute("UPDATE listing SET title = 'uncommitted' WHERE id = 1")
+        started = time.perf_counter()
+        with read_engine.connect() as conn:
+            title = conn.execute(select(Listing.title).filter_by(id=1)).scalar()
+        # Well under the 5 s busy timeout a locked read would wait out
+        assert time.perf_counter() - started < 1
+        assert title != 'uncommitted'
+    finally:
+        writer.execute('ROLLBACK')
+        writer.close()
+
+def test_get_requests_read_from_the_read_engine_until_they_flush(app, read_engine):
+    with app.test_request_context('/api/listings', method='GET'):
+        assert db.session.get_bind(clause=select(Listing)) is read_engine
+        db.session.add(User(name='Writer', email=f'{uuid.uuid4().hex}@example.com', password='x'))
+        # A flush on the read-only engine would fail
+        db.session.flush()
+        assert db.session.get_bind(clause=select(Listing)) is db.engine
+        db.session.rollback()
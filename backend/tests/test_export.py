@@ -0,0 +1,62 @@
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+def _export(client, headers, query=''):
+    response = client.get(f'/api/listings/export?{query}', headers=headers)
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+def _records(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+@pytest.fixture
+def changed(client, register):
+    # (cutoff, headers, [ids changed after cutoff in change order]); one
+    # listing changes before the cutoff and again after it, one only before
+    _, headers = register('agent')
+
+    def create(title, **fields):
+        response = client.post('/api/listings', json=dict(fields, title=title, price=300000), headers=headers)
+        return response.get_json()['id']
+
+    updated = create('Altbau', city='Berlin', images=['https://example.com/a.jpg', 'https://example.com/b.jpg'])
+    create('Unverändert', city='Berlin')
+    time.sleep(0.01)
+    cutoff = datetime.utcnow().isoformat()
+    time.sleep(0.01)
+    created = create('Neubau', city='Hamburg', bedrooms=3, features={'Balkon': 'Ja', 'Aufzug': 'Nein'})
+    response = client.put(f'/api/listings/{updated}', json={'price': 280000, 'status': 'pending'}, headers=headers)
+    assert response.status_code == 200
+    return cutoff, headers, [created, updated]
+
+def test_updated_since(client, changed):
+    cutoff, headers, ids = changed
+    records = _records(_export(client, headers, f'updated_since={cutoff}'))
+    assert [record['id'] for record in records] == ids
+    assert all(record['updated_at'] >= cutoff for record in records)
+    pending = _records(_export(client, headers, f'updated_since={cutoff}&status=pending'))
+    assert [record['id'] for record in pending] == ids[1:]
+    response = client.get('/api/listings/export?updated_since=yesterday', headers=headers)
+    assert response.status_code == 400
+
+def _comparable(record):
+    return {
+        name: record[name]
+        for name in ('title', 'price', 'city', 'bedrooms', 'status', 'images', 'features')
+    }
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+def test_round_trip(client, register, changed, fmt):
+    cutoff, headers, _ = changed
+    originals = _records(_export(client, headers, f'updated_since={cutoff}'))
+    exported = _export(client, headers, f'updated_since={cutoff}&format={fmt}')
+    owner_id, importer_headers = register('agent')
+    response = client.post(f'/api/listings/import?format={fmt}', data=exported.encode(), headers=importer_headers)
+    assert response.get_json() == {'imported': 2, 'failed': 0, 'errors': [], 'errors_truncated': False}
+    copies = [record for record in _records(_export(client, headers, f'updated_since={cutoff}'))
+              if record['owner']['id'] == owner_id]
+    assert [_comparable(record) for record in copies] == [_comparable(record) for record in originals]
+    assert {record['id'] for record in copies}.isdisjoint(record['id'] for record in originals)
@@ -0,0 +1,47 @@
+import pytest
+
+import facets
+from models import db, Listing
+
+FILTERS = ['', 'city=Berlin', 'property_type=apartment&bedrooms=2', 'status=sold']
+
+def _facets(client, query):
+    response = client.get(f'/api/listings?facets=1&per_page=1&{query}')
+    assert response.status_code == 200
+    return response.get_json()['facets']
+
+def _assert_aggregate_matches_listings(client, monkeypatch):
+    aggregated = {query: _facets(client, query) for query in FILTERS}
+    with monkeypatch.context() as patch:
+        patch.setattr(facets, 'facet_index_ready', lambda: False)
+        assert {query: _facets(client, query) for query in FILTERS} == aggregated
+
+@pytest.fixture
+def agent(register):
+    return register('agent')[1]
+
+def test_aggregate_follows_listing_writes(app, client, register, agent, monkeypatch):
+    with app.app_context():
+        assert facets.facet_index_ready()
+    _assert_aggregate_matches_listings(client, monkeypatch)
+
+    created = [
+        client.post('/api/listings', json={
+            'title': 'Facet test', 'price': price, 'city': 'Berlin', 'property_type': 'apartment', 'bedrooms': 2
+        }, headers=agent).get_json()['id']
+        for price in (250000, 800000)
+    ]
+    _assert_aggregate_matches_listings(client, monkeypatch)
+
+    for change in ({'city': 'Hamburg'}, {'price': 1200000}, {'bedrooms': 7}, {'status': 'sold'}):
+        assert client.put(f'/api/listings/{created[0]}', json=change, headers=agent).status_code == 200
+        _assert_aggregate_matches_listings(client, monkeypatch)
+
+    _, buyer = register()
+    assert client.post('/api/favorites/batch', json={'add': [created[1]]}, headers=buyer).status_code == 200
+    _assert_aggregate_matches_listings(client, monkeypatch)
+
+    with app.app_context():
+        db.session.delete(db.session.get(Listing, created[0]))
+        db.session.commit()
+    _assert_aggregate_matches_listings(client, monkeypatch)
@@ -0,0 +1,12 @@
+from sqlalchemy import select
+
+from models import db, Listing
+
+def test_favoriting_keeps_updated_at(app, client, register):
+    _, headers = register()
+    with app.app_context():
+        before = db.session.execute(select(Listing.updated_at, Listing.favorite_count).filter_by(id=3)).one()
+    assert client.post('/api/favorites/batch', json={'add': [3]}, headers=headers).status_code == 200
+    with app.app_context():
+        after = db.session.execute(select(Listing.updated_at, Listing.favorite_count).filter_by(id=3)).one()
+    assert after == (before.updated_at, before.favorite_count + 1)
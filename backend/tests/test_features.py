@@ -0,0 +1,63 @@
+import uuid
+
+import pytest
+
+def _filtered(client, *filters):
+    query = '&'.join(f'feature={value}' for value in filters)
+    response = client.get(f'/api/listings?per_page=50&{query}')
+    assert response.status_code == 200
+    return {card['id'] for card in response.get_json()['listings']}
+
+@pytest.fixture
+def names():
+    # Feature names no other test's listings have
+    tag = uuid.uuid4().hex[:8]
+    return f'Heizung{tag}', f'Balkon{tag}'
+
+@pytest.fixture
+def listings(client, register, names):
+    heating, balcony = names
+    _, headers = register('agent')
+    created = {}
+    for name, features in (
+        ('gas_balcony', {heating: 'Gas', balcony: 'Ja'}),
+        ('gas', {heating: 'Gas'}),
+        ('district_balcony', {heating: 'Fernwärme', balcony: 'Ja'}),
+        ('oil_balcony', {heating: 'Öl', balcony: 'Ja'}),
+    ):
+        response = client.post('/api/listings', json={
+            'title': f'Features {name}', 'price': 250000, 'features': features
+        }, headers=headers)
+        created[name] = response.get_json()['id']
+    return created, headers
+
+def test_filters_are_anded_and_alternatives_ored(client, listings, names):
+    created, _ = listings
+    heating, balcony = names
+    assert _filtered(client, f'{heating}:Gas') == {created['gas_balcony'], created['gas']}
+    assert _filtered(client, f'{heating}:Gas', f'{balcony}:Ja') == {created['gas_balcony']}
+    assert _filtered(client, f'{heating}:Gas|{heating}:Fernwärme') == {
+        created['gas_balcony'], created['gas'], created['district_balcony']
+    }
+    assert _filtered(client, f'{heating}:Gas|{heating}:Fernwärme', f'{balcony}:Ja') == {
+        created['gas_balcony'], created['district_balcony']
+    }
+    assert _filtered(client, balcony) == {created['gas_balcony'], created['district_balcony'], created['oil_balcony']}
+    assert _filtered(client, f'{heating}:Gas', f'{balcony}:Nein') == set()
+
+def test_filters_follow_feature_changes(client, listings, names):
+    created, headers = listings
+    heating, balcony = names
+    response = client.put(f"/api/listings/{created['gas']}", json={
+        'features': {heating: 'Fernwärme', balcony: 'Ja'}
+    }, headers=headers)
+    assert response.status_code == 200
+    response = client.put(f"/api/listings/{created['oil_balcony']}", json={'features': {}}, headers=headers)
+    assert response.status_code == 200
+    assert _filtered(client, f'{heating}:Gas') == {created['gas_balcony']}
+    assert _filtered(client, f'{heating}:Fernwärme', f'{balcony}:Ja') == {created['gas'], created['district_balcony']}
+    assert _filtered(client, balcony) == {created['gas_balcony'], created['gas'], created['district_balcony']}
+
+def test_malformed_filter(client):
+    response = client.get('/api/listings?feature=:Gas')
+    assert response.status_code == 400
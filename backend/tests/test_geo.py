@@ -0,0 +1,77 @@
+import math
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from geo import GEO_TABLE, KM_PER_DEGREE
+from models import db
+
+RADIUS_KM = 5
+
+def _offset(center, north_km=0.0, east_km=0.0):
+    lat, lon = center
+    return (
+        lat + north_km / KM_PER_DEGREE,
+        lon + east_km / (KM_PER_DEGREE * math.cos(math.radians(lat)))
+    )
+
+def _listings(client, query):
+    response = client.get(f'/api/listings?per_page=50&{query}')
+    assert response.status_code == 200
+    return response.get_json()['listings']
+
+def _near(client, center, radius_km=RADIUS_KM):
+    return _listings(client, f'near={center[0]},{center[1]}&radius_km={radius_km}')
+
+@pytest.fixture
+def center():
+    # A point in the South Atlantic, away from the sample cities and from
+    # the other tests' points
+    bits = uuid.uuid4().int
+    return -50 + (bits % 2000) / 100, -30 + (bits // 2000 % 2000) / 100
+
+@pytest.fixture
+def listings(client, register, center):
+    # {name: id}, created farthest first so only distance orders them
+    _, headers = register('agent')
+    created = {}
+    for name, north_km, east_km in (
+        ('outside', 0, RADIUS_KM + 0.1),
+        ('edge', 0, RADIUS_KM - 0.1),
+        ('north', 2, 0),
+        ('center', 0, 0),
+    ):
+        lat, lon = _offset(center, north_km, east_km)
+        response = client.post('/api/listings', json={
+            'title': f'Geo {name}', 'price': 250000, 'latitude': lat, 'longitude': lon
+        }, headers=headers)
+        created[name] = response.get_json()['id']
+    return created, headers
+
+def test_near_orders_by_distance_within_radius(client, listings, center):
+    created, _ = listings
+    cards = _near(client, center)
+    assert [card['id'] for card in cards] == [created['center'], created['north'], created['edge']]
+    assert [round(card['distance_km'], 1) for card in cards] == [0, 2, RADIUS_KM - 0.1]
+    assert [card['id'] for card in _near(client, center, RADIUS_KM + 0.2)][-1] == created['outside']
+
+def test_bbox(client, listings, center):
+    created, _ = listings
+    south, west = _offset(center, -1, -1)
+    north, east = _offset(center, 3, RADIUS_KM)
+    cards = _listings(client, f'bbox={south},{west},{north},{east}')
+    assert {card['id'] for card in cards} == {created['center'], created['north'], created['edge']}
+
+def test_moved_listing_leaves_the_radius(app, client, listings, center):
+    created, headers = listings
+    lat, lon = _offset(center, 20, 0)
+    response = client.put(f"/api/listings/{created['north']}", json={'latitude': lat, 'longitude': lon}, headers=headers)
+    assert response.status_code == 200
+    assert [card['id'] for card in _near(client, center)] == [created['center'], created['edge']]
+    assert [card['id'] for card in _near(client, (lat, lon), 1)] == [created['north']]
+    with app.app_context():
+        box = db.session.execute(
+            text(f"SELECT min_lat, max_lat FROM {GEO_TABLE} WHERE id = :id"), {'id': created['north']}
+        ).one()
+    assert box.min_lat <= lat <= box.max_lat
@@ -0,0 +1,58 @@
+import hashlib
+import io
+import json
+import os
+
+import pytest
+
+from app import images
+
+Image = pytest.importorskip('PIL.Image')
+
+def _jpeg(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+@pytest.fixture
+def listing(client, register):
+    # (listing id, owner's Authorization headers)
+    _, headers = register('agent')
+    response = client.post('/api/listings', json={'title': 'Upload test', 'price': 1000}, headers=headers)
+    return response.get_json()['id'], headers
+
+def test_upload_stores_originals_by_hash(client, listing):
+    listing_id, headers = listing
+    red, blue = _jpeg('red'), _jpeg('blue')
+    response = client.post(f'/api/listings/{listing_id}/images', headers=headers, data={'images': [
+        (io.BytesIO(red), 'red.jpg'), (io.BytesIO(blue), 'blue.jpg'), (io.BytesIO(red), 'again.jpg'),
+    ]})
+    assert response.status_code == 201
+    result = response.get_json()
+    assert result['duplicates'] == 1
+    digests = [image['image_url'].rsplit('/', 1)[1] for image in result['images']]
+    assert digests == [hashlib.sha256(red).hexdigest(), hashlib.sha256(blue).hexdigest()]
+    assert client.get(result['images'][0]['image_url']).get_data() == red
+    assert not [name for name in os.listdir(images.root) if name.startswith('.partial-')]
+    images.flush(timeout=10)
+
+def test_upload_rejects_oversized_files(client, listing, monkeypatch):
+    listing_id, headers = listing
+    monkeypatch.setattr(images, 'max_bytes', 100)
+    response = client.post(f'/api/listings/{listing_id}/images', headers=headers, data={
+        'images': [(io.BytesIO(_jpeg('red')), 'red.jpg')],
+    })
+    assert response.status_code == 400
+
+def test_request_bodies_are_capped_except_imports(app, client, listing, monkeypatch):
+    listing_id, headers = listing
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+    response = client.post(f'/api/listings/{listing_id}/images', headers=headers, data={
+        'images': [(io.BytesIO(b'\xff\xd8' + bytes(4096)), 'large.jpg')],
+    })
+    assert response.status_code == 413
+    feed = ''.join(json.dumps({'title': f'Imported {n}', 'price': 1000 + n}) + '\n' for n in range(40))
+    assert len(feed) > 1024
+    response = client.post('/api/listings/import', data=feed, headers=headers, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.get_json()['imported'] == 40
@@ -0,0 +1,64 @@
+import json
+
+from sqlalchemy import select
+
+from models import db, Listing
+
+def _import(client, headers, body, content_type='application/x-ndjson'):
+    response = client.post('/api/listings/import', data=body.encode(), content_type=content_type, headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+def _imported(app, owner_id):
+    with app.app_context():
+        listings = db.session.execute(
+            select(Listing).filter_by(owner_id=owner_id).order_by(Listing.id)
+        ).scalars().all()
+        return [(listing.title, listing.price, [(f.feature_name, f.feature_value) for f in listing.features])
+                for listing in listings]
+
+def test_ndjson_reports_bad_rows_and_keeps_the_rest(app, client, register):
+    owner_id, headers = register('agent')
+    lines = [
+        {'title': 'Altbau', 'price': 300000, 'features': {'Balkon': 'Ja'}},
+        '{"title": "Broken",',
+        {'price': 100000},
+        '',
+        {'title': 'Negative', 'price': -1},
+        {'title': 'Unknown status', 'price': 1, 'status': 'archived'},
+        {'title': 'Bad features', 'price': 1, 'features': 'Balkon'},
+        ['not', 'an', 'object'],
+        {'title': 'Neubau', 'price': '450000.5', 'status': 'sold'},
+    ]
+    body = '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines) + '\n'
+    report = _import(client, headers, body)
+    assert report['imported'] == 2 and report['failed'] == 6
+    assert [error['line'] for error in report['errors']] == [2, 3, 5, 6, 7, 8]
+    assert report['errors'][0]['error'].startswith('invalid JSON')
+    assert report['errors'][1]['error'] == 'title is required'
+    assert not report['errors_truncated']
+    assert _imported(app, owner_id) == [('Altbau', 300000, [('Balkon', 'Ja')]), ('Neubau', 450000.5, [])]
+
+def test_csv_reports_lines_after_the_header(app, client, register):
+    owner_id, headers = register('agent')
+    body = (
+        'title,price,city,features\n'
+        'Altbau,300000,Berlin,Balkon:Ja|Aufzug:Nein\n'
+        'Kein Preis,,Berlin,\n'
+        'Neubau,abc,Berlin,\n'
+        'Loft,250000,Hamburg,\n'
+    )
+    report = _import(client, headers, body, 'text/csv')
+    assert (report['imported'], report['failed']) == (2, 2)
+    assert report['errors'] == [
+        {'line': 3, 'error': 'price is required'},
+        {'line': 4, 'error': 'price must be a number'},
+    ]
+    assert _imported(app, owner_id) == [
+        ('Altbau', 300000, [('Balkon', 'Ja'), ('Aufzug', 'Nein')]), ('Loft', 250000, [])
+    ]
+
+def test_import_requires_a_known_format(client, register):
+    _, headers = register('agent')
+    response = client.post('/api/listings/import?format=xml', data=b'', headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,15 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+def test_failed_statements_leave_no_timing_state(app):
+    with app.app_context(), db.engine.connect() as conn:
+        conn.exec_driver_sql('SELECT 1')
+        info = {key: repr(value) for key, value in conn.info.items()}
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql('SELECT * FROM no_such_table')
+            conn.rollback()
+        conn.exec_driver_sql('SELECT 1')
+        assert {key: repr(value) for key, value in conn.info.items()} == info
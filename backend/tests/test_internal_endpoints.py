@@ -0,0 +1,7 @@
+import pytest
+
+@pytest.mark.parametrize('path', ['/api/_metrics', '/api/_cache/stats'])
+def test_hidden_unless_enabled(app, client, monkeypatch, path):
+    assert client.get(path).status_code == 404
+    monkeypatch.setitem(app.config, 'INTERNAL_ENDPOINTS', True)
+    assert client.get(path).status_code == 200
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.exc import IntegrityError
+
+import messaging
+from migrations import _unique_conversations
+from models import db, Conversation, Message
+
+@pytest.mark.parametrize('receiver_id', ['abc', None, True, [1]])
+def test_send_message_rejects_bad_receiver(client, register, receiver_id):
+    _, headers = register()
+    response = client.post('/api/messages', json={'receiver_id': receiver_id, 'content': 'hi'}, headers=headers)
+    assert response.status_code == 400
+
+def test_send_message_to_missing_receiver_or_listing(client, register):
+    _, headers = register()
+    other_id, _ = register()
+    for data in ({'receiver_id': 10 ** 9}, {'receiver_id': other_id, 'listing_id': 10 ** 9}):
+        response = client.post('/api/messages', json=dict(data, content='hi'), headers=headers)
+        assert response.status_code == 404
+    response = client.get('/api/conversations', headers=headers)
+    assert response.get_json()['conversations'] == []
+
+def test_one_conversation_per_pair_and_listing(client, register):
+    user_id, headers = register()
+    other_id, other_headers = register()
+    ids = {
+        client.post('/api/messages', json={'receiver_id': other_id, 'content': 'a'}, headers=headers)
+        .get_json()['conversation_id'],
+        client.post('/api/messages', json={'receiver_id': user_id, 'content': 'b'}, headers=other_headers)
+        .get_json()['conversation_id'],
+    }
+    assert len(ids) == 1
+    about_listing = client.post(
+        '/api/messages', json={'receiver_id': other_id, 'content': 'c', 'listing_id': 1}, headers=headers
+    ).get_json()['conversation_id']
+    assert about_listing not in ids
+
+def test_concurrent_first_messages_share_a_conversation(app, register, monkeypatch):
+    # The loser of the race misses the row on lookup and conflicts on insert
+    user_id, _ = register()
+    other_id, _ = register()
+    with app.app_context():
+        first = messaging.get_or_create_conversation(user_id, other_id)
+        db.session.commit()
+        find = messaging._find_conversation
+        misses = iter([True])
+        monkeypatch.setattr(messaging, '_find_conversation', lambda *args: None if next(misses, False) else find(*args))
+        assert messaging.get_or_create_conversation(other_id, user_id).id == first.id
+        with pytest.raises(IntegrityError):
+            db.session.add(Conversation(user_low_id=min(user_id, other_id), user_high_id=max(user_id, other_id)))
+            db.session.flush()
+        db.session.rollback()
+
+def test_migration_merges_duplicate_conversations(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'duplicates.db'}")
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text('DROP INDEX uq_conversation_users_listing'))
+        for _ in range(2):
+            conn.execute(text('INSERT INTO conversation (user_low_id, user_high_id) VALUES (1, 2)'))
+        conn.execute(text(
+            """INSERT INTO message (sender_id, receiver_id, subject, content, is_read, created_at, conversation_id)
+               VALUES (1, 2, '', 'a', 0, '2024-01-01', 1), (2, 1, '', 'b', 0, '2024-01-02', 2)"""
+        ))
+        _unique_conversations(conn)
+        assert conn.execute(select(func.count()).select_from(Conversation)).scalar() == 1
+        assert set(conn.execute(select(Message.conversation_id)).scalars()) == {1}
+        assert conn.execute(select(Conversation.last_message_id)).scalar() == 2
+    engine.dispose()
@@ -0,0 +1,31 @@
+import pytest
+
+@pytest.mark.parametrize('mode', ['cursor=', 'page=1'])
+@pytest.mark.parametrize('per_page, clamped', [(-1, 1), (0, 1), (1000, 100)])
+def test_page_size_is_clamped(client, mode, per_page, clamped):
+    response = client.get(f'/api/listings?{mode}&per_page={per_page}')
+    assert response.status_code == 200
+    assert response.get_json() == client.get(f'/api/listings?{mode}&per_page={clamped}').get_json()
+
+def test_cursor_pages_do_not_skip_rows(client):
+    first = client.get('/api/listings?cursor=&per_page=0').get_json()
+    second = client.get(f"/api/listings?cursor={first['next_cursor']}&per_page=0").get_json()
+    both = client.get('/api/listings?cursor=&per_page=2').get_json()
+    assert [card['id'] for card in first['listings'] + second['listings']] == [
+        card['id'] for card in both['listings']
+    ]
+
+def test_message_pages_cover_sent_and_received(client, register):
+    user_id, headers = register()
+    other_id, other_headers = register()
+    client.post('/api/messages', json={'receiver_id': other_id, 'content': 'sent'}, headers=headers)
+    client.post('/api/messages', json={'receiver_id': user_id, 'content': 'received'}, headers=other_headers)
+    client.post('/api/messages', json={'receiver_id': user_id, 'content': 'to self'}, headers=headers)
+
+    first = client.get('/api/messages?cursor=&per_page=2', headers=headers).get_json()
+    second = client.get(f"/api/messages?cursor={first['next_cursor']}&per_page=2", headers=headers).get_json()
+    assert second['next_cursor'] is None
+    assert [msg['content'] for msg in first['messages'] + second['messages']] == ['to self', 'received', 'sent']
+    assert [msg['content'] for msg in client.get('/api/messages', headers=headers).get_json()] == [
+        'to self', 'received', 'sent'
+    ]
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import event
+
+import app as app_module
+from app import engines
+
+PAGE_SIZES = (1, 50)
+
+@pytest.fixture
+def count_queries(app, client):
+    # count_queries(path, headers) -> statements issued by one GET of path,
+    # after an untimed request that warms the user and statement caches
+    engines_used = [engine for engine in (engines.engine, engines.read_engine) if engine is not None]
+    executed = [0]
+
+    def count(*args):
+        executed[0] += 1
+
+    for engine in engines_used:
+        event.listen(engine, 'before_cursor_execute', count)
+
+    def count_queries(path, headers=None):
+        assert client.get(path, headers=headers).status_code == 200
+        executed[0] = 0
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return executed[0]
+
+    yield count_queries
+    for engine in engines_used:
+        event.remove(engine, 'before_cursor_execute', count)
+
+@pytest.fixture
+def correspondent(client, register):
+    # A user with 50 conversations, one message each
+    user_id, headers = register()
+    for receiver_id in range(1, 51):
+        response = client.post('/api/messages', headers=headers, json={
+            'receiver_id': receiver_id, 'subject': 'Anfrage', 'content': f'Nachricht {receiver_id}'
+        })
+        assert response.status_code == 200
+    return headers
+
+def test_listings(count_queries):
+    counts = [count_queries(f'/api/listings?per_page={n}') for n in PAGE_SIZES]
+    assert counts[0] == counts[1]
+
+def test_listings_cursor(count_queries):
+    counts = [count_queries(f'/api/listings?cursor=&per_page={n}') for n in PAGE_SIZES]
+    assert counts[0] == counts[1]
+
+def test_listings_by_ids(count_queries):
+    counts = [count_queries('/api/listings?ids=' + ','.join(map(str, range(1, n + 1)))) for n in PAGE_SIZES]
+    assert counts[0] == counts[1]
+
+def test_search(count_queries, monkeypatch):
+    counts = []
+    for n in PAGE_SIZES:
+        monkeypatch.setattr(app_module, 'SEARCH_LIMIT', n)
+        counts.append(count_queries('/api/search'))
+    assert counts[0] == counts[1]
+
+def test_favorites(client, register, count_queries):
+    counts = []
+    for n in PAGE_SIZES:
+        _, headers = register()
+        response = client.post('/api/favorites/batch', headers=headers, json={'add': list(range(1, n + 1))})
+        assert len(response.get_json()['added']) == n
+        counts.append(count_queries('/api/favorites', headers))
+    assert counts[0] == counts[1]
+
+def test_messages(correspondent, count_queries):
+    counts = [count_queries(f'/api/messages?per_page={n}', correspondent) for n in PAGE_SIZES]
+    assert counts[0] == counts[1]
+
+def test_conversations(correspondent, count_queries):
+    counts = [count_queries(f'/api/conversations?per_page={n}', correspondent) for n in PAGE_SIZES]
+    assert counts[0] == counts[1]
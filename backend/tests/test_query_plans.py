@@ -0,0 +1,21 @@
+import pytest
+
+from migrations import check_query_plans, hot_queries, slow_steps
+
+@pytest.fixture(scope='module')
+def plans(app):
+    # `app` has run every migration on the fixture database
+    with app.app_context():
+        return check_query_plans()
+
+@pytest.mark.parametrize('name', list(hot_queries()))
+def test_hot_query_uses_indexes(plans, name):
+    plan, offending = plans[name]
+    assert not offending, '\n'.join(plan)
+
+def test_slow_steps():
+    assert slow_steps(['SCAN listing']) == ['SCAN listing']
+    assert slow_steps(['SCAN listing_fts VIRTUAL TABLE INDEX 0:']) == ['SCAN listing_fts VIRTUAL TABLE INDEX 0:']
+    assert slow_steps(['MATERIALIZE anon_1', 'SCAN listing_fts VIRTUAL TABLE INDEX 192:M4', 'SCAN anon_1']) == []
+    assert slow_steps(['USE TEMP B-TREE FOR ORDER BY']) == ['USE TEMP B-TREE FOR ORDER BY']
+    assert slow_steps(['USE TEMP B-TREE FOR ORDER BY'], ranked=True) == []
@@ -0,0 +1,47 @@
+import json
+
+from sqlalchemy import create_engine, select, text
+
+from app import notifications
+from migrations import _saved_search_city_keys
+from models import db, SavedSearchKey
+
+def _save(client, headers, **filters):
+    response = client.post('/api/saved-searches', json={'name': 'Alert', 'filters': filters}, headers=headers)
+    assert response.status_code == 201, response.get_data(as_text=True)
+
+def _notified(user_id):
+    notifications.flush()
+    return [event for room, event, _ in notifications.delivered if room == f'user_{user_id}']
+
+def test_listing_writes_notify_matching_searches(client, register):
+    berlin_id, berlin_headers = register()
+    hamburg_id, hamburg_headers = register()
+    # Part of a word, as /api/search matches it
+    _save(client, berlin_headers, city='berl', max_price='500000')
+    _save(client, hamburg_headers, city='Hamburg')
+    _, agent_headers = register('agent')
+
+    response = client.post('/api/listings', json={'title': 'Altbau', 'price': 400000, 'city': 'Berlin'},
+                           headers=agent_headers)
+    listing_id = response.get_json()['id']
+    assert _notified(berlin_id) == ['saved_search_match']
+    assert _notified(hamburg_id) == []
+
+    client.put(f'/api/listings/{listing_id}', json={'city': 'Hamburg-Altona'}, headers=agent_headers)
+    assert _notified(hamburg_id) == ['saved_search_match']
+    assert _notified(berlin_id) == ['saved_search_match']
+
+def test_migration_rekeys_saved_searches_by_city_prefix(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'searches.db'}")
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("""INSERT INTO saved_search (id, user_id, name, filters) VALUES (1, 1, 'Alert', :filters)"""),
+                     {'filters': json.dumps({'city': 'Frankfurt am Main'})})
+        conn.execute(text(
+            """INSERT INTO saved_search_key (saved_search_id, city_key, property_type, price_band)
+               VALUES (1, 'frankfurt', '', -1)"""
+        ))
+        _saved_search_city_keys(conn)
+        assert conn.execute(select(SavedSearchKey.city_key)).scalars().all() == ['fra']
+    engine.dispose()
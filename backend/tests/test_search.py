@@ -0,0 +1,52 @@
+import uuid
+
+import pytest
+
+from models import db, Listing
+
+def _search(client, query):
+    response = client.get(f'/api/search?{query}')
+    assert response.status_code == 200
+    return [card['id'] for card in response.get_json()]
+
+@pytest.fixture
+def word():
+    # A word no other test's listings contain
+    return f'zaun{uuid.uuid4().hex[:8]}'
+
+@pytest.fixture
+def listings(client, register, word):
+    # {name: id}; the description match is created last, so only relevance
+    # puts the title match first
+    _, headers = register('agent')
+    created = {}
+    for name, data in (
+        ('title', {'title': f'{word} Villa', 'city': 'Berlin'}),
+        ('other_city', {'title': f'{word} Loft', 'city': 'Hamburg'}),
+        ('description', {'title': 'Altbau', 'description': f'Blick auf den {word} Park', 'city': 'Berlin'}),
+    ):
+        response = client.post('/api/listings', json=dict(data, price=300000), headers=headers)
+        created[name] = response.get_json()['id']
+    return created, headers
+
+def test_search_ranks_and_filters(client, listings, word):
+    created, _ = listings
+    assert _search(client, f'q={word}&city=Berlin') == [created['title'], created['description']]
+    # The last word matches as a prefix, in any case
+    assert set(_search(client, f'q={word[:-2].upper()}')) == set(created.values())
+    assert _search(client, f'q={word}+loft') == [created['other_city']]
+
+def test_search_follows_updates_and_deletes(app, client, listings, word):
+    created, headers = listings
+    # The last query word matches as a prefix, so the new title must not start with `word`
+    renamed = word[::-1]
+    response = client.put(f"/api/listings/{created['title']}", json={'title': f'{renamed} Villa'}, headers=headers)
+    assert response.status_code == 200
+    assert _search(client, f'q={word}&city=Berlin') == [created['description']]
+    assert _search(client, f'q={renamed}') == [created['title']]
+
+    with app.app_context():
+        db.session.delete(db.session.get(Listing, created['description']))
+        db.session.commit()
+    assert _search(client, f'q={word}&city=Berlin') == []
+    assert _search(client, f'q=blick+{word}+park') == []